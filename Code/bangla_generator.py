@@ -3,6 +3,8 @@ import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM, GenerationConfig
 import warnings
 
+from model_registry import model_registry
+
 # Suppress specific UserWarnings from transformers library
 warnings.filterwarnings(
     "ignore",
@@ -43,47 +45,58 @@ class BanglaGenerator:
     """
     def __init__(self, model_name: str = "shahidul034/Bangla_text_generation"):
         self.model_name = model_name
-        self.tokenizer = None
-        self.model = None
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.load_failed = False
+        print(f"Bot: Bangla Text Generation model: {self.model_name} (loaded on first use)")
+
+    def _parts(self):
+        """(tokenizer, model) from the shared model registry, or (None, None) if loading failed."""
+        if self.load_failed:
+            return None, None
+        try:
+            return model_registry.get(self.model_name, self._load_model, dtype='float32', kind='causal-lm')
+        except Exception as e:
+            print(f"Error loading Bangla Text Generation model {self.model_name}: {e}")
+            print("Please ensure internet/connectivity and that all necessary libraries are installed.")
+            print("Bot: Bangla generation will not be available.")
+            self.load_failed = True
+            return None, None
 
-        print(f"Bot: Loading Bangla Text Generation model: {self.model_name} (approx 0.5GB)...")
-        self._load_model()
-        if self.model and self.tokenizer:
-            print("Bot: Bangla Text Generation model loaded successfully.")
-        else:
-            print("Bot: Failed to load Bangla Text Generation model. Bangla generation will not be available.")
+    @property
+    def tokenizer(self):
+        return self._parts()[0]
+
+    @property
+    def model(self):
+        return self._parts()[1]
 
     def _load_model(self):
         """
         Loads the GPT-style causal language model and tokenizer.
         """
-        try:
-            # Use AutoTokenizer and AutoModelForCausalLM for GPT-style models
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.model = AutoModelForCausalLM.from_pretrained(self.model_name)
-            self.model.eval() # Set model to evaluation mode for inference
-
-            # GPT-2 tokenizers often lack a pad_token, use eos_token if missing
-            if self.tokenizer.pad_token is None:
-                self.tokenizer.pad_token = self.tokenizer.eos_token
-            # Set padding side to left for generation tasks with decoder-only models
-            self.tokenizer.padding_side = "left"
-
-            # Ensure model is on CPU if CUDA is not available or not desired
-            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-            self.model.to(self.device)
-
-        except Exception as e:
-            print(f"Error loading Bangla Text Generation model {self.model_name}: {e}")
-            print("Please ensure internet/connectivity and that all necessary libraries are installed.")
-            self.model = None
-            self.tokenizer = None
+        print(f"Bot: Loading Bangla Text Generation model: {self.model_name} (approx 0.5GB)...")
+        # Use AutoTokenizer and AutoModelForCausalLM for GPT-style models
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        model = AutoModelForCausalLM.from_pretrained(self.model_name)
+        model.eval() # Set model to evaluation mode for inference
+
+        # GPT-2 tokenizers often lack a pad_token, use eos_token if missing
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        # Set padding side to left for generation tasks with decoder-only models
+        tokenizer.padding_side = "left"
+
+        # Ensure model is on CPU if CUDA is not available or not desired
+        model.to(self.device)
+        print("Bot: Bangla Text Generation model loaded successfully.")
+        return tokenizer, model
 
     async def generate_bangla_text(self, prompt: str, max_new_tokens: int = 50, num_return_sequences: int = 1) -> str:
         """
         Generates Bengali text based on a given prompt.
         """
-        if not self.model or not self.tokenizer:
+        tokenizer, model = self._parts()
+        if not model or not tokenizer:
             return "দুঃখিত, বাংলা টেক্সট জেনারেশন মডেল লোড করা হয়নি।" # Sorry, Bangla text generation model not loaded.
 
         print("Bot: Generating Bangla text...")
@@ -93,21 +106,21 @@ class BanglaGenerator:
             # Tokenize the input. max_length set to avoid issues, truncation to handle long prompts.
             # Ensure tokens are on the correct device (CPU)
             # ... (inside generate_bangla_text method) ...
-            inputs = self.tokenizer(
+            inputs = tokenizer(
                 input_text,
                 return_tensors="pt",
                 padding=True,
                 truncation=True,
-                max_length=self.tokenizer.model_max_length
+                max_length=tokenizer.model_max_length
             ).to(self.device)
 
             print(f"Debug: Input IDs shape: {inputs['input_ids'].shape}")
             print(f"Debug: Attention Mask shape: {inputs['attention_mask'].shape}")
-            print(f"Debug: Model max position embeddings: {self.model.config.max_position_embeddings}")
-            print(f"Debug: Tokenizer model max length: {self.tokenizer.model_max_length}")
+            print(f"Debug: Model max position embeddings: {model.config.max_position_embeddings}")
+            print(f"Debug: Tokenizer model max length: {tokenizer.model_max_length}")
 
             generated_ids = await asyncio.to_thread(
-                self.model.generate,
+                model.generate,
                 **inputs, # Pass input_ids and attention_mask
                 max_new_tokens=max_new_tokens, # Use max_new_tokens
                 num_return_sequences=num_return_sequences,
@@ -115,12 +128,12 @@ class BanglaGenerator:
                 top_k=50,                   # Consider top 50 most likely tokens
                 top_p=0.95,                 # Nucleus sampling: pick from top tokens that sum up to 95% probability
                 temperature=0.7,            # Controls randomness (lower means more predictable)
-                pad_token_id=self.tokenizer.pad_token_id, # Explicitly pass pad_token_id
-                eos_token_id=self.tokenizer.eos_token_id, # Explicitly pass eos_token_id for robust stopping
+                pad_token_id=tokenizer.pad_token_id, # Explicitly pass pad_token_id
+                eos_token_id=tokenizer.eos_token_id, # Explicitly pass eos_token_id for robust stopping
                 no_repeat_ngram_size=2      # Avoid repeating 2-grams
             )
             # Decode the generated tokens back to text
-            generated_text = self.tokenizer.decode(generated_ids[0], skip_special_tokens=True)
+            generated_text = tokenizer.decode(generated_ids[0], skip_special_tokens=True)
 
             # Post-process: remove the input prompt from the generated text
             # Be careful with this, as tokenization might slightly alter spacing/characters
@@ -3,6 +3,8 @@ from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipe
 import warnings
 import asyncio  # Required for async operations
 
+from model_registry import model_registry
+
 # Suppress specific UserWarning from transformers library
 warnings.filterwarnings(
     "ignore",
@@ -77,37 +79,52 @@ class BanglaUnderstanding:
                               e.g., 'csebuetnlp/banglabert'.
         """
         self.model_name = model_name
-        self.tokenizer = None
-        self.model = None
-        self.pipeline = None
-        self._load_model()
-        print(f"BanglaUnderstanding initialized with model: {self.model_name}")
+        self.load_failed = False
+        print(f"BanglaUnderstanding initialized with model: {self.model_name} (loaded on first use)")
 
-    def _load_model(self):
+    @property
+    def pipeline(self):
         """
-        Loads the tokenizer and model from Hugging Face Transformers.
-        It also sets up a text classification pipeline for basic text understanding.
+        The text classification pipeline (tokenizer and model included), loaded on
+        first use and shared through the model registry; None if loading failed.
         """
+        if self.load_failed:
+            return None
         try:
-            # Load tokenizer
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            # Load model for sequence classification (useful for tasks like sentiment, intent)
-            self.model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
-
-            # Initialize a text classification pipeline.
-            self.pipeline = pipeline(
-                "text-classification",
-                model=self.model,
-                tokenizer=self.tokenizer
-            )
-            print("Tokenizer and model loaded successfully.")
+            return model_registry.get(self.model_name, self._load_model, dtype='float32', kind='text-classification')
         except Exception as e:
             print(f"Error loading model {self.model_name}: {e}")
             print("Please ensure you have an active internet connection to download the models.")
             print("Also, check if the model name is correct and supported by Hugging Face.")
-            self.tokenizer = None
-            self.model = None
-            self.pipeline = None
+            self.load_failed = True
+            return None
+
+    @property
+    def tokenizer(self):
+        classifier = self.pipeline
+        return classifier.tokenizer if classifier is not None else None
+
+    @property
+    def model(self):
+        classifier = self.pipeline
+        return classifier.model if classifier is not None else None
+
+    def _load_model(self):
+        """
+        Loads the tokenizer and model from Hugging Face Transformers and
+        sets up a text classification pipeline for basic text understanding.
+        """
+        # Load tokenizer
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        # Load model for sequence classification (useful for tasks like sentiment, intent)
+        model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
+        classifier = pipeline(
+            "text-classification",
+            model=model,
+            tokenizer=tokenizer
+        )
+        print("Tokenizer and model loaded successfully.")
+        return classifier
 
     def process_text(self, text: str) -> dict:
         """
@@ -122,18 +139,18 @@ class BanglaUnderstanding:
                   potentially classification results if the pipeline is active.
                   Returns an empty dictionary if the model is not loaded.
         """
-        if not self.tokenizer or not self.model:
+        classifier = self.pipeline
+        if classifier is None:
             print("Model not loaded. Cannot process text.")
             return {}
 
-        inputs = self.tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
+        inputs = classifier.tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
 
         classification_results = None
-        if self.pipeline:
-            try:
-                classification_results = self.pipeline(text)
-            except Exception as e:
-                print(f"Error during pipeline inference: {e}")
+        try:
+            classification_results = classifier(text)
+        except Exception as e:
+            print(f"Error during pipeline inference: {e}")
 
         return {
             "input_ids": inputs.input_ids.tolist(),
@@ -0,0 +1,134 @@
+import json
+import queue
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+BULK_OPERATIONS = ('get_drug_info', 'get_side_effects', 'get_related_drugs', 'classify_drug')
+
+
+def parse_bulk_line(line: str) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    'drug' or 'drug<TAB>symptom' (a comma also separates the pair when there is
+    no tab). Blank lines and '#' comments return None.
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    separator = '\t' if '\t' in line else ','
+    drug_name, _, symptom = line.partition(separator)
+    return drug_name.strip(), (symptom.strip() or None)
+
+
+class BulkDrugQueryRunner:
+    """
+    Answers drug questions for a whole list of drugs in one process.
+
+    Input lines are read lazily and processed in small batches: the text
+    answers come straight from the drug store and its indexes, and the
+    Rx/OTC predictions for a batch are made in one vectorized pass. A batch
+    is closed when it holds batch_size drugs or when no new line arrives
+    within batch_timeout seconds, so slow or interactive input is answered
+    as it comes. Each result is written as one JSON line and flushed
+    immediately, so the output can be consumed while the run is in progress.
+    """
+
+    def __init__(self, chatbot, operations: Sequence[str] = BULK_OPERATIONS, hops: int = 1,
+                 top_k: Optional[int] = None, batch_size: int = 256, batch_timeout: float = 0.05):
+        unknown = [operation for operation in operations if operation not in BULK_OPERATIONS]
+        if unknown:
+            raise ValueError(f"Unsupported bulk operations: {', '.join(unknown)} "
+                             f"(choose from {', '.join(BULK_OPERATIONS)})")
+        self.chatbot = chatbot
+        self.operations = list(operations)
+        self.hops = hops
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+
+    def _batches(self, lines: Iterable[str]) -> Iterator[List[Tuple[int, str, Optional[str]]]]:
+        # A reader thread lets a batch close when the input pauses instead of waiting for batch_size lines
+        pending: queue.Queue = queue.Queue(maxsize=4 * self.batch_size)
+        done = object()
+        errors = []
+
+        def read():
+            try:
+                for item in enumerate(lines, start=1):
+                    pending.put(item)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                pending.put(done)
+
+        threading.Thread(target=read, name="bulk-drug-reader", daemon=True).start()
+        batch, finished = [], False
+        while not finished:
+            try:
+                item = pending.get(timeout=self.batch_timeout) if batch else pending.get()
+            except queue.Empty:
+                yield batch
+                batch = []
+                continue
+            if item is done:
+                finished = True
+            else:
+                line_number, line = item
+                parsed = parse_bulk_line(line)
+                if parsed is not None:
+                    batch.append((line_number, *parsed))
+            if batch and (finished or len(batch) >= self.batch_size):
+                yield batch
+                batch = []
+        if errors:
+            raise errors[0]
+
+    def _answer(self, drug_name: str, symptom: Optional[str]) -> Dict[str, str]:
+        answers = {}
+        if 'get_drug_info' in self.operations:
+            answers['get_drug_info'] = self.chatbot.get_drug_info(drug_name)
+        if 'get_side_effects' in self.operations:
+            answers['get_side_effects'] = self.chatbot.get_side_effects(drug_name)
+        if symptom:
+            answers['get_semantic_side_effects'] = self.chatbot.get_semantic_side_effects(drug_name, symptom, self.top_k)
+        if 'get_related_drugs' in self.operations:
+            answers['get_related_drugs'] = self.chatbot.get_related_drugs(drug_name, self.hops)
+        return answers
+
+    def run(self, lines: Iterable[str], output: TextIO) -> Dict[str, float]:
+        """Streams one JSON object per input drug to output; returns throughput stats."""
+        start = time.perf_counter()
+        num_drugs = num_answers = num_errors = 0
+        for batch in self._batches(lines):
+            classifications = [None] * len(batch)
+            if 'classify_drug' in self.operations:
+                try:
+                    classifications = self.chatbot.classify_drugs([drug_name for _, drug_name, _ in batch])
+                except Exception as e:
+                    print(f"Error classifying drug batch: {e}")
+            for (line_number, drug_name, symptom), classification in zip(batch, classifications):
+                record = {'line': line_number, 'drug': drug_name}
+                if symptom:
+                    record['symptom'] = symptom
+                try:
+                    answers = self._answer(drug_name, symptom)
+                    if classification is not None:
+                        answers['classify_drug'] = classification
+                    record.update(answers)
+                    num_answers += len(answers)
+                except Exception as e:
+                    record['error'] = str(e)
+                    num_errors += 1
+                output.write(json.dumps(record, ensure_ascii=False) + '\n')
+                output.flush()
+            num_drugs += len(batch)
+
+        elapsed = time.perf_counter() - start
+        return {
+            'drugs': num_drugs,
+            'answers': num_answers,
+            'errors': num_errors,
+            'seconds': elapsed,
+            'drugs_per_second': num_drugs / max(elapsed, 1e-9),
+            'answers_per_second': num_answers / max(elapsed, 1e-9),
+        }
@@ -1,6 +1,8 @@
 import os
 import sys
 import asyncio
+from functools import cached_property
+from typing import List, Optional
 from dotenv import load_dotenv
 import warnings
 from sklearn.exceptions import InconsistentVersionWarning
@@ -28,35 +30,73 @@ from drug_classifier import DrugClassifier
 load_dotenv()
 
 class Chatbot:
+    """
+    Task-specific features behind one object. Each component is created the
+    first time a command uses it, so a command only pays for what it needs;
+    the models they load are shared through model_registry.
+    """
+
     def __init__(self):
-        print("Chatbot: Initializing core components (task-specific features only)...")
-
-        self.knowledge_base_manager = KnowledgeBaseManager()
-        self.train_data_manager = TrainDataManager()
-        self.nlp_processor = NLPProcessor()
-        self.drug_info_processor = DrugInfoProcessor(nlp_processor=self.nlp_processor)
-        self.drug_classifier = DrugClassifier()
-        self.web_searcher = WebSearcher()
-        self.math_solver = MathSolver()
-        self.translator = Translator()
-        self.bangla_generator = BanglaGenerator()
-        self.hindi_generator = HindiGenerator()
-
-        self.rental_predictor = None
+        print("Chatbot: Ready (components load on first use).")
+
+    @cached_property
+    def knowledge_base_manager(self) -> KnowledgeBaseManager:
+        return KnowledgeBaseManager()
+
+    @cached_property
+    def train_data_manager(self) -> TrainDataManager:
+        return TrainDataManager()
+
+    @cached_property
+    def nlp_processor(self) -> NLPProcessor:
+        return NLPProcessor()
+
+    @cached_property
+    def drug_info_processor(self) -> DrugInfoProcessor:
+        return DrugInfoProcessor(nlp_processor=self.nlp_processor)
+
+    @cached_property
+    def drug_classifier(self) -> DrugClassifier:
+        return DrugClassifier()
+
+    @cached_property
+    def web_searcher(self) -> WebSearcher:
+        return WebSearcher()
+
+    @cached_property
+    def math_solver(self) -> MathSolver:
+        return MathSolver()
+
+    @cached_property
+    def translator(self) -> Translator:
+        return Translator()
+
+    @cached_property
+    def bangla_generator(self) -> BanglaGenerator:
+        return BanglaGenerator()
+
+    @cached_property
+    def hindi_generator(self) -> HindiGenerator:
+        return HindiGenerator()
+
+    @cached_property
+    def rental_predictor(self) -> Optional[RentalPredictor]:
         try:
             print("Chatbot: Attempting to load RentalPredictor from model files...")
-            self.rental_predictor = RentalPredictor(model_path='rental_predictor_model.pkl', columns_path='original_X_columns.pkl')
+            rental_predictor = RentalPredictor(model_path='rental_predictor_model.pkl', columns_path='original_X_columns.pkl')
             print("Chatbot: RentalPredictor loaded from model files.")
+            return rental_predictor
         except Exception as e:
             print(f"Chatbot: Warning: RentalPredictor could not be initialized from model files: {e}")
-            try:
-                print("Chatbot: Attempting to initialize RentalPredictor from raw data...")
-                self.rental_predictor = RentalPredictor(data_path='rental_data.csv')
-                print("Chatbot: RentalPredictor initialized from data path.")
-            except Exception as e:
-                print(f"Chatbot: Error: RentalPredictor could not be initialized from data either: {e}")
-                self.rental_predictor = None
-                print("Chatbot: Rental predictor unavailable.")
+        try:
+            print("Chatbot: Attempting to initialize RentalPredictor from raw data...")
+            rental_predictor = RentalPredictor(data_path='rental_data.csv')
+            print("Chatbot: RentalPredictor initialized from data path.")
+            return rental_predictor
+        except Exception as e:
+            print(f"Chatbot: Error: RentalPredictor could not be initialized from data either: {e}")
+            print("Chatbot: Rental predictor unavailable.")
+            return None
 
     async def async_run(self, history_manager=None):
         """
@@ -100,24 +140,58 @@ class Chatbot:
     def get_side_effects(self, drug_name: str) -> str:
         return self.drug_info_processor.get_side_effects(drug_name)
 
-    def get_semantic_side_effects(self, drug_name: str, symptom: str) -> str:
-        return self.drug_info_processor.get_semantically_relevant_side_effects(drug_name, symptom)
+    def get_semantic_side_effects(self, drug_name: str, symptom: str, top_k: Optional[int] = None) -> str:
+        return self.drug_info_processor.get_semantically_relevant_side_effects(drug_name, symptom, top_k=top_k)
+
+    def find_drugs_by_symptom(self, symptom: str, top_k: int = 10) -> str:
+        return self.drug_info_processor.find_drugs_with_similar_side_effects(symptom, top_k=top_k)
 
-    def get_related_drugs(self, drug_name: str) -> str:
-        return self.drug_info_processor.get_related_drugs(drug_name)
+    def get_drugs_causing(self, side_effect_query: str) -> str:
+        return self.drug_info_processor.get_drugs_with_side_effects(side_effect_query)
+
+    def get_related_drugs(self, drug_name: str, hops: int = 1) -> str:
+        return self.drug_info_processor.get_related_drugs(drug_name, hops=hops)
+
+    def get_relation_path(self, source_drug: str, target_drug: str) -> str:
+        return self.drug_info_processor.get_relation_path(source_drug, target_drug)
+
+    def get_common_related_drugs(self, drug_names: List[str]) -> str:
+        return self.drug_info_processor.get_drugs_related_to_all(drug_names)
 
     def classify_drug(self, drug_name: str) -> str:
-        drug_info = self.drug_info_processor.drug_data.get(drug_name.lower())
-        if not drug_info:
-            return f"No data available to classify {drug_name}."
-        features = {
-            'activity': drug_info.get('activity', ''),
-            'drug_classes': drug_info.get('drug_classes', '')
-        }
-        prediction = self.drug_classifier.predict_rx_otc(features)
-        if prediction:
-            return f"{drug_name.capitalize()} is predicted to be an **{prediction}** drug."
-        return "Could not classify drug."
+        return self.classify_drugs([drug_name])[0]
+
+    def classify_drugs(self, drug_names: List[str]) -> List[str]:
+        """classify_drug for many drugs with a single vectorized prediction pass."""
+        drug_data = self.drug_info_processor.drug_data
+        infos = [drug_data.get(drug_name.lower()) for drug_name in drug_names]
+        known = [i for i, drug_info in enumerate(infos) if drug_info]
+        predictions = self.drug_classifier.predict_many(
+            [infos[i].get('drug_classes', '') for i in known],
+            [infos[i].get('activity', '') for i in known])
+        responses = [f"No data available to classify {drug_name}." for drug_name in drug_names]
+        for position, i in enumerate(known):
+            prediction = predictions[position] if position < len(predictions) else None
+            if prediction:
+                responses[i] = f"{drug_names[i].capitalize()} is predicted to be an **{prediction}** drug."
+            else:
+                responses[i] = "Could not classify drug."
+        return responses
+
+    def train_drug_classifier(self) -> str:
+        drug_data = self.drug_info_processor.drug_data
+        if not drug_data:
+            return "No drug data available to train the classifier."
+        columns = [[info.get(field, '') for info in drug_data.values()]
+                   for field in ('drug_classes', 'activity', 'rx_otc')]
+        try:
+            report = self.drug_classifier.train_and_evaluate(*columns)
+        except ValueError as e:
+            return f"Could not train drug classifier: {e}"
+        return (f"Trained Rx/OTC classifier on {report['train_rows']} drugs: held-out accuracy "
+                f"{report['accuracy']:.3f} (majority baseline {report['majority_baseline']:.3f}) on "
+                f"{report['test_rows']} drugs. Throughput: {report['catalog_predictions_per_second']:.0f} "
+                f"drugs/sec for the full catalog. Model saved to '{self.drug_classifier.model_path}'.")
 
     async def translate_to_english(self, text: str) -> str:
         return await self.translator.translate_bengali_to_english(text)
@@ -1,98 +1,164 @@
-import pandas as pd
-import re
 import joblib
 import os
-from typing import Optional, List, Dict, Union, Set
+from typing import Optional, List, Dict, Union, Set, Mapping, Sequence, Tuple
 # Assuming NLPProcessor is available, which it should be in your project
 from nlp_processor import NLPProcessor 
+from drug_name_matcher import DrugNameMatcher
+from embedding_index import EmbeddingIndex
+from side_effect_index import SideEffectSentenceIndex, split_side_effect_sentences
+from drug_store import DrugStore
+from drug_ingest import describe_csv, ingest_drug_csv, csv_source_changed
+from side_effect_inverted_index import SideEffectInvertedIndex
+from related_drugs_graph import RelatedDrugsGraph, parse_related_drugs
+from drug_spell_index import DrugSpellIndex
 
 
 class DrugInfoProcessor:
     def __init__(self, data_path: str = 'drugs_side_effects_drugs_com.csv',
-                 processed_data_path: str = 'drug_data.pkl',
-                 nlp_processor: Optional[NLPProcessor] = None): # Accept NLPProcessor instance
+                 processed_data_path: str = 'drug_data.store',
+                 nlp_processor: Optional[NLPProcessor] = None, # Accept NLPProcessor instance
+                 legacy_data_path: Optional[str] = 'drug_data.pkl',
+                 csv_chunk_size: int = 100_000):
         
         self.data_path = data_path
         self.processed_data_path = processed_data_path
+        self.legacy_data_path = legacy_data_path # Old joblib dict-of-dicts, imported once if present
         self.nlp_processor = nlp_processor # Store the NLPProcessor
-        self.drug_data: Dict[str, Dict[str, str]] = {}
-        self.drug_names: Set[str] = set()
+        self.csv_chunk_size = csv_chunk_size # Rows per chunk when ingesting the CSV
+        # drug_data is a memory-mapped DrugStore once loaded: drug_data[name]['side_effects'] decodes lazily
+        self.drug_data: Mapping[str, Mapping[str, str]] = {}
+        self.drug_names: Sequence[str] = [] # Sorted; a drug's position is its drug id
+        self.name_matcher: Optional[DrugNameMatcher] = None
+        self.name_embeddings: Optional[EmbeddingIndex] = None # Built lazily on first semantic lookup
+        self.side_effect_index: Optional[SideEffectSentenceIndex] = None
+        self.side_effect_terms: Optional[SideEffectInvertedIndex] = None # Side-effect term -> drug ids
+        self.related_graph: Optional[RelatedDrugsGraph] = None
+        self.spell_index: Optional[DrugSpellIndex] = None # Typo-tolerant brand/generic name lookup
         self._load_or_process_data()
+        self._load_or_build_indexes()
+
+    def _artifact_path(self, suffix: str) -> str:
+        """Path of a derived artifact stored next to the processed drug data."""
+        return os.path.splitext(self.processed_data_path)[0] + suffix
+
+    def _drug_id(self, drug_name_lower: str) -> Optional[int]:
+        return self.drug_data.id_of(drug_name_lower) if isinstance(self.drug_data, DrugStore) else None
+
+    def _load_or_build_indexes(self):
+        """Loads (or builds and persists) the lookup structures derived from drug_data."""
+        if not isinstance(self.drug_data, DrugStore):
+            return
+        self.name_matcher = DrugNameMatcher.load_or_build(
+            self._artifact_path('_matcher.pkl'), self.drug_names, signature=self.drug_data.names_signature)
+        self.side_effect_terms = SideEffectInvertedIndex.load_or_build(
+            self._artifact_path('_side_effect_terms.pkl'), self.drug_data.column('side_effects'),
+            source_signature=self.drug_data.signature)
+        self.related_graph = RelatedDrugsGraph.load_or_build(
+            self._artifact_path('_related_graph.pkl'), self.drug_names, self.drug_data.column('related_drugs'),
+            catalog_id=self.drug_data.id_of, source_signature=self.drug_data.signature)
+        self.spell_index = DrugSpellIndex.load_or_build(
+            self._artifact_path('_spelling.pkl'), self.drug_names, self.drug_data.column('generic_name'),
+            source_signature=self.drug_data.signature)
+
+    def _get_name_embeddings(self) -> Optional[EmbeddingIndex]:
+        """
+        Returns the memory-mapped drug-name embedding matrix, embedding the names
+        only if no cache exists for the current names and embedding model.
+        """
+        if self.name_embeddings is None and self.nlp_processor and self.drug_names:
+            self.name_embeddings = EmbeddingIndex.load_or_build(
+                self._artifact_path('_name_embeddings'), self.drug_names, self.nlp_processor,
+                signature=self.drug_data.names_signature)
+        return self.name_embeddings
+
+    def _get_side_effect_index(self) -> Optional[SideEffectSentenceIndex]:
+        """Returns the side-effect sentence table, splitting the catalog only once per data version."""
+        if self.side_effect_index is None and isinstance(self.drug_data, DrugStore):
+            self.side_effect_index = SideEffectSentenceIndex.load_or_build(
+                self._artifact_path('_side_effects.pkl'), self.drug_data.column('side_effects'),
+                source_signature=self.drug_data.signature)
+        return self.side_effect_index
+
+    def _get_side_effect_embeddings(self) -> Optional[SideEffectSentenceIndex]:
+        """Returns the side-effect sentence index with its sentence embeddings attached."""
+        index = self._get_side_effect_index()
+        if not self.nlp_processor or index is None:
+            return None
+        index.attach_embeddings(self._artifact_path('_side_effect_embeddings'), self.nlp_processor)
+        return index
+
+    def _open_store(self):
+        self.drug_data = DrugStore(self.processed_data_path)
+        self.drug_names = self.drug_data.names
+
+    def _resolve_data_path(self) -> str:
+        local_path = os.path.join(os.path.dirname(__file__), self.data_path)
+        return local_path if os.path.exists(local_path) else self.data_path
 
     def _load_or_process_data(self):
-        # ... (This method remains largely the same as before) ...
         """
-        Attempts to load processed data from a PKL file.
-        If not found or an error occurs, processes from CSV and saves to PKL.
+        Memory-maps the processed drug store if it exists, refreshing it first if the
+        source CSV changed since it was built. Otherwise imports a legacy joblib PKL,
+        or processes the CSV, and writes the store.
         """
         if os.path.exists(self.processed_data_path):
             try:
-                print(f"Attempting to load processed drug data from {self.processed_data_path}...")
-                loaded_data = joblib.load(self.processed_data_path)
-                if isinstance(loaded_data, dict) and 'drug_data' in loaded_data and 'drug_names' in loaded_data:
+                self._open_store()
+                print(f"Successfully mapped {len(self.drug_data)} drugs from {self.processed_data_path}")
+                if csv_source_changed(self.drug_data.source, self._resolve_data_path()):
+                    print(f"'{self.data_path}' changed since the drug store was built. Refreshing...")
+                    self._process_data_from_csv()
+                return
+            except Exception as e:
+                print(f"Error loading {self.processed_data_path}: {e}. Re-processing from source data.")
+
+        if self.legacy_data_path and os.path.exists(self.legacy_data_path):
+            try:
+                print(f"Attempting to import legacy drug data from {self.legacy_data_path}...")
+                loaded_data = joblib.load(self.legacy_data_path)
+                if isinstance(loaded_data, dict) and loaded_data.get('drug_data'):
                     self.drug_data = loaded_data['drug_data']
-                    self.drug_names = loaded_data['drug_names']
-                    print(f"Successfully loaded {len(self.drug_data)} drugs from {self.processed_data_path}")
-                    return
+                    # Record the CSV as the store's source so the next start does not rebuild it
+                    data_path = self._resolve_data_path()
+                    self._save_processed_data(describe_csv(data_path)[0] if os.path.exists(data_path) else None)
+                    if isinstance(self.drug_data, DrugStore):
+                        return
                 else:
-                    print(f"Invalid format or corrupted data in {self.processed_data_path}. Re-processing from CSV.")
+                    print(f"No usable drug data in {self.legacy_data_path}. Processing from CSV.")
             except Exception as e:
-                print(f"Error loading {self.processed_data_path}: {e}. Re-processing from CSV.")
+                print(f"Error importing {self.legacy_data_path}: {e}. Processing from CSV.")
 
         # If loading failed or file doesn't exist, process from CSV
         print(f"'{self.processed_data_path}' not found or invalid. Processing drug data from '{self.data_path}'...")
         self._process_data_from_csv()
-        self._save_processed_data()
 
     def _process_data_from_csv(self):
-        # ... (This method remains largely the same as before, ensuring strip and fillna) ...
-        """Loads and processes the drug data from the CSV file into a dictionary."""
+        """
+        Builds the drug store from the CSV in chunks (see drug_ingest.ingest_drug_csv).
+        An existing store is refreshed incrementally when the CSV was only appended to.
+        """
+        previous = self.drug_data if isinstance(self.drug_data, DrugStore) else None
         try:
-            full_data_path = os.path.join(os.path.dirname(__file__), self.data_path) if os.path.exists(os.path.join(os.path.dirname(__file__), self.data_path)) else self.data_path
-            
-            df = pd.read_csv(full_data_path)
-            
-            df['drug_name'] = df['drug_name'].astype(str).fillna('')
-            df['generic_name'] = df['generic_name'].astype(str).fillna('')
-            df['drug_classes'] = df['drug_classes'].astype(str).fillna('')
-            df['activity'] = df['activity'].astype(str).fillna('')
-            df['rx_otc'] = df['rx_otc'].astype(str).fillna('')
-            df['pregnancy_category'] = df['pregnancy_category'].astype(str).fillna('')
-            df['side_effects'] = df['side_effects'].astype(str).fillna('')
-            df['related_drugs'] = df['related_drugs'].astype(str).fillna('')
-
-            drug_info = {}
-            for index, row in df.iterrows():
-                drug_name = row['drug_name'].lower().strip()
-                if drug_name:
-                    drug_info[drug_name] = {
-                        'generic_name': row['generic_name'].strip(),
-                        'drug_classes': row['drug_classes'].strip(),
-                        'activity': row['activity'].strip(),
-                        'rx_otc': row['rx_otc'].strip(),
-                        'pregnancy_category': row['pregnancy_category'].strip(),
-                        'side_effects': row['side_effects'].strip(),
-                        'related_drugs': row['related_drugs'].strip()
-                    }
-            self.drug_data = drug_info
-            self.drug_names = {name for name in self.drug_data.keys() if name}
-            print(f"Processed {len(self.drug_data)} unique drugs from '{self.data_path}'")
+            store, mode = ingest_drug_csv(self._resolve_data_path(), self.processed_data_path,
+                                          previous=previous, chunk_size=self.csv_chunk_size)
+            self.drug_data = store
+            self.drug_names = store.names
+            print(f"Processed {len(self.drug_data)} unique drugs from '{self.data_path}' ({mode})")
         except FileNotFoundError:
             print(f"Error: '{self.data_path}' not found. Please ensure the CSV file is in the correct directory.")
-            self.drug_data = {}
-            self.drug_names = set()
         except Exception as e:
             print(f"Error processing drug data from CSV: {e}")
-            self.drug_data = {}
-            self.drug_names = set()
+            if previous is not None:
+                self._open_store() # The old store is still intact; map it again
 
-    def _save_processed_data(self):
-        # ... (This method remains largely the same as before) ...
-        """Saves the processed drug data (dictionary and set) to a PKL file."""
+    def _save_processed_data(self, source: Optional[dict] = None):
+        """Writes the processed drug dictionary as a columnar store and memory-maps it."""
+        if not self.drug_data:
+            return
         try:
-            data_to_save = {'drug_data': self.drug_data, 'drug_names': self.drug_names}
-            joblib.dump(data_to_save, self.processed_data_path)
+            DrugStore.write(self.processed_data_path, self.drug_data, source)
             print(f"Processed drug data saved to '{self.processed_data_path}'")
+            self._open_store()
         except Exception as e:
             print(f"Error saving processed drug data to '{self.processed_data_path}': {e}")
 
@@ -105,24 +171,23 @@ class DrugInfoProcessor:
         """
         query_lower = query.lower()
 
-        # 1. First, try direct keyword matching (fastest)
-        found_drug_direct = None
-        max_len_match_direct = 0
-        for drug in sorted(list(self.drug_names), key=len, reverse=True):
-            pattern = r'\b' + re.escape(drug) + r'\b'
-            if re.search(pattern, query_lower):
-                if len(drug) > max_len_match_direct:
-                    found_drug_direct = drug
-                    max_len_match_direct = len(drug)
+        # 1. First, try direct keyword matching (fastest): one pass of the name automaton
+        found_drug_direct = self.name_matcher.find_longest(query_lower) if self.name_matcher else None
         if found_drug_direct:
             print(f"Debug: Direct match found: {found_drug_direct}")
             return found_drug_direct
 
-        # 2. If no direct match, use NLPProcessor for semantic similarity
-        if self.nlp_processor and self.drug_names:
+        # 2. If no direct match, score the query against the precomputed drug-name matrix
+        name_embeddings = self._get_name_embeddings()
+        if name_embeddings is not None:
             print("Debug: No direct match, trying NLP similarity for drug name...")
-            # Convert set to list for find_best_match
-            best_match, score = self.nlp_processor.find_best_match(query, list(self.drug_names))
+            try:
+                # Same cutoff NLPProcessor.find_best_match applied: weaker matches count as no match
+                matches = name_embeddings.top_k(self.nlp_processor.get_embedding(query), k=1, threshold=0.85)
+            except Exception as e:
+                print(f"Error during semantic drug name search: {e}")
+                matches = []
+            best_match, score = matches[0] if matches else (None, 0.0)
             if best_match and score > 0.7: # A slightly lower threshold might be okay for drug names
                 print(f"Debug: NLP match found: {best_match} with score {score}")
                 return best_match
@@ -131,10 +196,14 @@ class DrugInfoProcessor:
         return None
 
     # --- ADDED METHOD FOR SEMANTIC SIDE EFFECT RETRIEVAL ---
-    def get_semantically_relevant_side_effects(self, drug_name: str, symptom_query: str) -> str:
+    def get_semantically_relevant_side_effects(self, drug_name: str, symptom_query: str,
+                                               threshold: Optional[float] = 0.7,
+                                               top_k: Optional[int] = None) -> str:
         """
         Retrieves side effects for a drug, focusing on semantic relevance to a symptom query.
         Uses NLPProcessor to compare the query to sentences within the side effects text.
+        By default every sentence scoring above threshold is returned; with top_k, only
+        the k most similar sentences (still above threshold, if one is given).
         """
         drug_name_lower = drug_name.lower()
         if drug_name_lower not in self.drug_data:
@@ -147,37 +216,22 @@ class DrugInfoProcessor:
         if not self.nlp_processor:
             return f"NLP capabilities not available to semantically search side effects for {drug_name}. Full list: {full_side_effects_text}"
 
-        # Simple sentence splitting (can be improved with nltk.sent_tokenize)
-        side_effect_sentences = [s.strip() for s in re.split(r'[.;](?=\s*[A-Z])', full_side_effects_text) if s.strip()]
-
+        # Sentences were split and embedded ahead of time; only the symptom is embedded here
         relevant_sentences = []
-        for sentence in side_effect_sentences:
-            # Use NLPProcessor to find similarity between symptom query and side effect sentence
-            # Note: find_best_match returns a tuple (best_match_text, score) when comparing
-            # a query to a list of candidates. Here, we're doing it sentence by sentence.
-            # A simpler way would be to get embedding for symptom_query and each sentence, then calculate cosine.
-            # Let's adapt NLPProcessor.find_best_match slightly if it can return score, or do manual cosine.
-            
-            # Since find_best_match is designed for a list of questions, we'll feed it one sentence at a time
-            # or directly calculate cosine if NLPProcessor exposes embedding method.
-            # Assuming find_best_match will return (sentence, score) for direct compare.
-            
-            # ALTERNATIVE: Directly get embeddings and calculate cosine similarity
-            try:
-                query_embedding = self.nlp_processor.nlp(symptom_query)[0][0]
-                sentence_embedding = self.nlp_processor.nlp(sentence)[0][0]
-                score = 1 - (self.nlp_processor.cosine(query_embedding, sentence_embedding) if hasattr(self.nlp_processor, 'cosine') else self.nlp_processor.scipy_cosine(query_embedding, sentence_embedding))
-                
-                # A higher threshold for semantic match
-                if score > 0.7: # Adjust this threshold based on testing
-                    relevant_sentences.append(sentence)
-            except Exception as e:
-                print(f"Error during semantic search for side effects: {e}")
-                # Fallback to direct text search if NLP fails
-                if any(word in sentence.lower() for word in symptom_query.lower().split()):
+        try:
+            index = self._get_side_effect_embeddings()
+            query_embedding = self.nlp_processor.get_embedding(symptom_query)
+            matches = index.search_drug(self._drug_id(drug_name_lower), query_embedding,
+                                        threshold=threshold, top_k=top_k)
+            relevant_sentences = [sentence for sentence, _ in matches]
+        except Exception as e:
+            print(f"Error during semantic search for side effects: {e}")
+            # Fallback to direct text search if NLP fails
+            query_words = symptom_query.lower().split()
+            for sentence in split_side_effect_sentences(full_side_effects_text):
+                if any(word in sentence.lower() for word in query_words):
                     relevant_sentences.append(sentence)
 
-
         if relevant_sentences:
             return (f"For {drug_name.capitalize()} regarding '{symptom_query}'-like issues, "
                     f"you might experience: {'; '.join(relevant_sentences)}.")
@@ -188,43 +242,159 @@ class DrugInfoProcessor:
                          f"'{symptom_query}'. The full side effects are: {full_side_effects_text[:300]}...") # Truncate long text
             return f"I did not find specific side effects related to '{symptom_query}' for {drug_name.capitalize()}. The full side effects are: {full_side_effects_text[:300]}..." # Truncate
 
-    # ... (get_drug_info, get_side_effects, get_related_drugs methods remain the same) ...
+    def find_drugs_with_similar_side_effects(self, symptom_query: str, top_k: int = 10,
+                                             threshold: Optional[float] = 0.7) -> str:
+        """Answers "which drugs list something like this symptom" across the whole catalog."""
+        if not self.nlp_processor:
+            return "NLP capabilities not available to semantically search side effects."
+        index = self._get_side_effect_embeddings()
+        if index is None:
+            return "Drug data not available to search side effects."
+        try:
+            matches = index.search_all(self.nlp_processor.get_embedding(symptom_query), top_k=top_k, threshold=threshold)
+        except Exception as e:
+            print(f"Error during cross-drug side effect search: {e}")
+            return f"Could not search side effects for '{symptom_query}'."
+        if not matches:
+            return f"I did not find drugs listing side effects similar to '{symptom_query}'."
+        lines = [f"- {self.drug_names[drug_id].capitalize()} ({score:.2f}): {sentence}"
+                 for drug_id, score, sentence in matches]
+        return f"Drugs listing side effects similar to '{symptom_query}':\n" + "\n".join(lines)
+
+    def get_drugs_with_side_effects(self, query: str, limit: int = 25) -> str:
+        """
+        Answers "which drugs cause X" from the inverted side-effect index, e.g.
+        "drowsiness but not nausea" or "headache or rash".
+        """
+        if self.side_effect_terms is None:
+            return "Drug data not available to search side effects."
+        all_of, any_of, none_of = SideEffectInvertedIndex.parse_query(query)
+        if not all_of and not any_of:
+            return f"Please name at least one side effect to search for (got '{query}')."
+        drug_ids = self.side_effect_terms.search(all_of, any_of, none_of, texts=self.drug_data.column('side_effects'))
+        if not len(drug_ids):
+            return f"I did not find drugs listing side effects matching '{query}'."
+        names = [self.drug_names[drug_id].capitalize() for drug_id in drug_ids[:limit]]
+        more = f" (and {len(drug_ids) - limit} more)" if len(drug_ids) > limit else ""
+        return f"{len(drug_ids)} drugs list side effects matching '{query}': {', '.join(names)}{more}."
+
+    def suggest_drug_names(self, drug_name: str, limit: int = 5) -> List[str]:
+        """Ranked catalog drug names for a possibly misspelled brand or generic name."""
+        if self.spell_index is None:
+            return []
+        suggestions = []
+        for _, _, drug_ids in self.spell_index.lookup(drug_name, limit=limit):
+            for drug_id in drug_ids:
+                if self.drug_names[drug_id] not in suggestions:
+                    suggestions.append(self.drug_names[drug_id])
+        return suggestions[:limit]
+
+    def _resolve_drug_name(self, drug_name: str) -> Tuple[Optional[str], str]:
+        """
+        Maps a user-typed name to a catalog drug. Returns (catalog name, note): an
+        exact hit has an empty note; a generic name or a clear spelling correction
+        resolves with a "did you mean" note; otherwise the name is None and the
+        note is the not-found reply, listing suggestions if there are any.
+        """
+        drug_name_lower = drug_name.lower().strip()
+        if drug_name_lower in self.drug_data:
+            return drug_name_lower, ""
+        matches = self.spell_index.lookup(drug_name_lower) if self.spell_index is not None else []
+        if matches:
+            term, distance, drug_ids = matches[0]
+            ambiguous = len(matches) > 1 and matches[1][1] == distance and matches[1][2] != drug_ids
+            if distance == 0 or not ambiguous:
+                resolved = self.drug_names[drug_ids[0]]
+                if resolved == term:
+                    return resolved, f"Did you mean {resolved.capitalize()}? "
+                others = [self.drug_names[drug_id].capitalize() for drug_id in drug_ids[1:4]]
+                also = f" (also sold as {', '.join(others)})" if others else ""
+                prefix = f"Did you mean {term}? " if distance else ""
+                return resolved, f"{prefix}Showing {resolved.capitalize()}, a brand of {term}{also}. "
+            suggestions = ", ".join(name.capitalize() for name in self.suggest_drug_names(drug_name_lower))
+            return None, f"I could not find information for {drug_name}. Did you mean: {suggestions}?"
+        return None, f"I could not find information for {drug_name}. Please check the spelling."
+
     def get_drug_info(self, drug_name: str) -> str:
         """Returns general information about a drug."""
-        drug_name_lower = drug_name.lower()
-        if drug_name_lower in self.drug_data:
+        drug_name_lower, note = self._resolve_drug_name(drug_name)
+        if drug_name_lower is not None:
             info = self.drug_data[drug_name_lower]
             response = (
-                f"{info['generic_name'].capitalize()} is a generic drug belonging to {info['drug_classes']}. "
+                f"{note}{info['generic_name'].capitalize()} is a generic drug belonging to {info['drug_classes']}. "
                 f"It has {info['activity']}% activity and is an {info['rx_otc']} drug."
             )
             if info['pregnancy_category'] and info['pregnancy_category'] != 'nan':
                 response += f" It is categorized as Pregnancy Category {info['pregnancy_category']}."
             return response
-        return f"I could not find information for {drug_name}. Please check the spelling."
+        return note
 
     def get_side_effects(self, drug_name: str) -> str:
         """Returns the side effects of a drug."""
-        drug_name_lower = drug_name.lower()
-        if drug_name_lower in self.drug_data:
+        drug_name_lower, note = self._resolve_drug_name(drug_name)
+        if drug_name_lower is not None:
+            drug_name = drug_name_lower if note else drug_name
             side_effects = self.drug_data[drug_name_lower]['side_effects']
             if side_effects and side_effects != 'nan':
                 side_effects = side_effects.strip().strip('"')
-                return f"Common side effects of {drug_name.capitalize()} may include: {side_effects}."
-            return f"Side effects information not available for {drug_name}."
-        return f"I could not find information for {drug_name}. Please check the spelling."
+                return f"{note}Common side effects of {drug_name.capitalize()} may include: {side_effects}."
+            return f"{note}Side effects information not available for {drug_name}."
+        return note
 
-    def get_related_drugs(self, drug_name: str) -> str:
-        """Returns drugs related to a given drug."""
-        drug_name_lower = drug_name.lower()
-        if drug_name_lower in self.drug_data:
-            related_drugs_str = self.drug_data[drug_name_lower]['related_drugs']
-            if related_drugs_str and related_drugs_str != 'nan':
-                drug_names_only = [
-                    re.split(r':\s*https?://', item)[0].strip()
-                    for item in related_drugs_str.split('|') if re.split(r':\s*https?://', item)[0].strip()
-                ]
+    def _graph_node(self, drug_name: str) -> Optional[int]:
+        """Graph node for a catalog drug, or for a name that only appears as a related drug."""
+        if self.related_graph is None:
+            return None
+        node = self._drug_id(drug_name.lower().strip())
+        return node if node is not None else self.related_graph.external_id(drug_name.strip())
+
+    def _node_name(self, node: int) -> str:
+        """A graph node's name as listed in the related-drugs data."""
+        if node < self.related_graph.num_catalog:
+            return self.related_graph.display_names.get(node, self.drug_names[node])
+        return self.related_graph.external_names[node - self.related_graph.num_catalog]
+
+    def get_related_drugs(self, drug_name: str, hops: int = 1) -> str:
+        """Returns drugs related to a given drug; with hops > 1, also drugs reachable through them."""
+        drug_name_lower, note = self._resolve_drug_name(drug_name)
+        if drug_name_lower is not None:
+            drug_name = drug_name_lower if note else drug_name
+            node = self._drug_id(drug_name_lower)
+            if hops <= 1:
+                # Exactly the names listed in the record, as the original lookup returned them
+                drug_names_only = parse_related_drugs(self.drug_data[drug_name_lower]['related_drugs'])
                 if drug_names_only:
-                    return f"Yes, some drugs related to {drug_name.capitalize()} include: {', '.join(drug_names_only)}."
-            return f"No related drugs information available for {drug_name}."
-        return f"I could not find information for {drug_name}. Please check the spelling."
\ No newline at end of file
+                    return f"{note}Yes, some drugs related to {drug_name.capitalize()} include: {', '.join(drug_names_only)}."
+            else:
+                rings = self.related_graph.within_hops(node, hops)
+                if rings:
+                    parts = [f"{distance} hop{'s' if distance > 1 else ''}: "
+                             f"{', '.join(self._node_name(related) for related in ring)}"
+                             for distance, ring in rings.items()]
+                    return f"{note}Drugs related to {drug_name.capitalize()} within {hops} hops - " + "; ".join(parts) + "."
+            return f"{note}No related drugs information available for {drug_name}."
+        return note
+
+    def get_relation_path(self, source_drug: str, target_drug: str, max_hops: int = 6) -> str:
+        """Returns the shortest chain of related-drug links between two drugs."""
+        source, target = self._graph_node(source_drug), self._graph_node(target_drug)
+        for name, node in ((source_drug, source), (target_drug, target)):
+            if node is None:
+                return f"I could not find information for {name}. Please check the spelling."
+        path = self.related_graph.shortest_path(source, target, max_hops=max_hops)
+        if path is None:
+            return f"No relation path within {max_hops} hops between {source_drug.capitalize()} and {target_drug.capitalize()}."
+        return f"Relation path ({len(path) - 1} hops): " + " -> ".join(self._node_name(node) for node in path) + "."
+
+    def get_drugs_related_to_all(self, drug_names: List[str]) -> str:
+        """Returns drugs related to every one of the given drugs."""
+        nodes = []
+        for name in drug_names:
+            node = self._graph_node(name)
+            if node is None:
+                return f"I could not find information for {name}. Please check the spelling."
+            nodes.append(node)
+        common = self.related_graph.common_neighbours(nodes) if nodes else []
+        if not len(common):
+            return f"No drugs are related to all of: {', '.join(drug_names)}."
+        return f"Drugs related to all of {', '.join(drug_names)}: {', '.join(self._node_name(node) for node in common)}."
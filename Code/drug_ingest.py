@@ -0,0 +1,191 @@
+import csv
+import hashlib
+import heapq
+import io
+import os
+import shutil
+import tempfile
+from typing import Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from drug_store import DRUG_FIELDS, DrugStore, DrugStoreWriter
+
+CSV_COLUMNS = ('drug_name',) + DRUG_FIELDS
+_HASH_BLOCK = 1 << 20
+
+
+def describe_csv(csv_path: str, prefix_size: Optional[int] = None) -> Tuple[dict, Optional[str]]:
+    """
+    Returns the source description recorded in the store header (size, mtime,
+    SHA-1, header columns) and, if prefix_size is given, the SHA-1 of the first
+    prefix_size bytes. Both hashes come from a single read of the file.
+    """
+    stat = os.stat(csv_path)
+    digest = hashlib.sha1()
+    prefix_sha1 = None
+    position = 0
+    last_byte = b''
+    with open(csv_path, 'rb') as file:
+        header_line = file.readline()
+        file.seek(0)
+        while True:
+            block = file.read(_HASH_BLOCK)
+            if not block:
+                break
+            if prefix_size is not None and prefix_sha1 is None and position + len(block) >= prefix_size:
+                digest.update(block[:prefix_size - position])
+                prefix_sha1 = digest.hexdigest()
+                digest.update(block[prefix_size - position:])
+            else:
+                digest.update(block)
+            position += len(block)
+            last_byte = block[-1:]
+    columns = next(csv.reader(io.StringIO(header_line.decode('utf-8-sig'))), [])
+    source = {
+        'path': os.path.basename(csv_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha1': digest.hexdigest(),
+        'columns': columns,
+        'ends_with_newline': last_byte == b'\n',
+    }
+    return source, prefix_sha1
+
+
+def csv_source_changed(source: Optional[dict], csv_path: str) -> bool:
+    """Cheap staleness check: compares the CSV's size and mtime with what the store recorded."""
+    if not os.path.exists(csv_path):
+        return False
+    if not source:
+        return True
+    stat = os.stat(csv_path)
+    return stat.st_size != source.get('size') or stat.st_mtime_ns != source.get('mtime_ns')
+
+
+def _read_chunks(csv_path: str, chunk_size: int, start: int = 0,
+                 columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """Reads only the drug columns, as strings, chunk by chunk, optionally from a byte offset."""
+    with open(csv_path, 'rb') as file:
+        file.seek(start)
+        reader = pd.read_csv(
+            file,
+            usecols=lambda column: column in CSV_COLUMNS,
+            dtype=str,
+            keep_default_na=False,
+            encoding='utf-8-sig',
+            chunksize=chunk_size,
+            header=None if start else 'infer',
+            names=columns if start else None,
+        )
+        for chunk in reader:
+            yield chunk
+
+
+def _clean_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    """Column-wise strip/lowercase, drop unnamed rows, keep each name's last row, and sort by name."""
+    if 'drug_name' not in df.columns:
+        raise ValueError("Drug CSV has no 'drug_name' column")
+    df = df.fillna('')
+    for field in DRUG_FIELDS:
+        df[field] = df[field].str.strip() if field in df.columns else ''
+    df['drug_name'] = df['drug_name'].str.lower().str.strip()
+    df = df[df['drug_name'] != '']
+    df = df.drop_duplicates('drug_name', keep='last')
+    return df.sort_values('drug_name', kind='stable')
+
+
+def _write_batch(writer: DrugStoreWriter, df: pd.DataFrame):
+    writer.add_batch(df['drug_name'].tolist(), [df[field].tolist() for field in DRUG_FIELDS])
+
+
+def _write_run(df: pd.DataFrame, run_dir: str, run_number: int) -> DrugStore:
+    path = os.path.join(run_dir, f'run{run_number:05d}.store')
+    writer = DrugStoreWriter(path)
+    try:
+        _write_batch(writer, df)
+        writer.commit()
+    finally:
+        writer.abort()
+    return DrugStore(path)
+
+
+def _merge_runs(runs: List[DrugStore], writer: DrugStoreWriter):
+    """
+    K-way merge of sorted runs into writer. When several runs hold the same
+    name, the latest run wins, matching "last row wins" in the CSV. Field bytes
+    are copied without decoding.
+    """
+    def entries(run_number: int, run: DrugStore):
+        for row, name in enumerate(run.names_column):
+            yield name, -run_number, row
+
+    last_name = None
+    for name, negative_run, row in heapq.merge(*(entries(i, run) for i, run in enumerate(runs))):
+        if name == last_name:
+            continue
+        last_name = name
+        run = runs[-negative_run]
+        writer.add_row(name, [run.columns[field].raw(row) for field in DRUG_FIELDS])
+
+
+def ingest_drug_csv(csv_path: str, store_path: str, previous: Optional[DrugStore] = None,
+                    chunk_size: int = 100_000) -> Tuple[DrugStore, str]:
+    """
+    Builds or refreshes the drug store at store_path from csv_path in bounded memory.
+
+    Each chunk is cleaned with vectorized pandas operations and spilled as a
+    sorted run, and the runs are merged into the final store. If previous was
+    built from a file the CSV only appended to (same hash over the old size),
+    just the appended rows are read and merged over it; if its content is the
+    same, only the source recorded in the store header is updated. Otherwise
+    the finished store replaces store_path atomically. Returns the new store
+    and the mode used: 'rebuilt', 'appended' or 'unchanged'.
+    """
+    previous_source = previous.source if previous is not None else None
+    prefix_size = previous_source.get('size') if previous_source else None
+    source, prefix_sha1 = describe_csv(csv_path, prefix_size)
+
+    base, start, mode = None, 0, 'rebuilt'
+    if previous_source and previous_source.get('columns') == source['columns']:
+        if previous_source.get('sha1') == source['sha1']:
+            # Same content (e.g. only the mtime changed): record the new source, keep the data
+            if os.path.abspath(previous.path) == os.path.abspath(store_path) \
+                    and DrugStore.update_source(store_path, source):
+                previous.close()
+                return DrugStore(store_path), 'unchanged'
+            base, start, mode = previous, source['size'], 'unchanged'
+        elif prefix_sha1 == previous_source.get('sha1') and previous_source.get('ends_with_newline'):
+            base, start, mode = previous, previous_source['size'], 'appended'
+
+    run_dir = tempfile.mkdtemp(prefix='.drug-runs-', dir=os.path.dirname(os.path.abspath(store_path)))
+    runs: List[DrugStore] = [base] if base is not None else []
+    try:
+        pending = None  # Hold one chunk back so a CSV that fits in one chunk skips the merge
+        if start < source['size']:
+            for chunk in _read_chunks(csv_path, chunk_size, start, source['columns'] if start else None):
+                if pending is not None:
+                    runs.append(_write_run(pending, run_dir, len(runs)))
+                pending = _clean_chunk(chunk)
+
+        writer = DrugStoreWriter(store_path, source)
+        try:
+            if not runs and pending is not None:
+                _write_batch(writer, pending)
+            else:
+                if pending is not None:
+                    runs.append(_write_run(pending, run_dir, len(runs)))
+                _merge_runs(runs, writer)
+            tmp_path = writer.finish()
+        except Exception:
+            writer.abort()
+            raise
+        for run in runs:
+            run.close()
+        os.replace(tmp_path, store_path)
+    finally:
+        for run in runs:
+            if run is not previous:
+                run.close()
+        shutil.rmtree(run_dir, ignore_errors=True)
+    return DrugStore(store_path), mode
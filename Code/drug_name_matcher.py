@@ -0,0 +1,170 @@
+import hashlib
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import joblib
+
+
+def _is_word_char(ch: str) -> bool:
+    """Mirrors the regex notion of a word character used by \\b."""
+    return ch.isalnum() or ch == '_'
+
+
+class DrugNameMatcher:
+    """
+    Aho-Corasick automaton over the drug vocabulary.
+
+    Finds every drug name occurring in a query in a single pass over the query,
+    applying the same word-boundary rule as r'\\b<name>\\b', and returns the
+    longest one. Lookup cost depends on the query length, not the catalog size.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.patterns: List[str] = []
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[int] = [-1]        # pattern id ending exactly at this node, or -1
+        self.dict_link: List[int] = [-1]  # nearest suffix node that ends a pattern, or -1
+        self.signature = ''
+        self._build(names)
+
+    @staticmethod
+    def vocabulary_signature(names: Iterable[str]) -> str:
+        """Stable hash of a name set, used to detect a stale persisted automaton."""
+        digest = hashlib.sha1()
+        for name in sorted(set(names)):
+            digest.update(name.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _build(self, names: Iterable[str]):
+        self.patterns = sorted({name for name in names if name})
+        self.signature = self.vocabulary_signature(self.patterns)
+
+        # Trie construction
+        for pattern_id, pattern in enumerate(self.patterns):
+            node = 0
+            for ch in pattern:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(-1)
+                    self.dict_link.append(-1)
+                node = nxt
+            self.out[node] = pattern_id
+
+        # Breadth-first computation of failure and dictionary-suffix links
+        queue = list(self.goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[child] = target if target != child else 0
+                suffix = self.fail[child]
+                self.dict_link[child] = suffix if self.out[suffix] != -1 else self.dict_link[suffix]
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def find_all(self, text: str) -> List[Tuple[int, int, str]]:
+        """Returns (start, end, name) for every boundary-respecting match in text."""
+        matches = []
+        if not self.patterns:
+            return matches
+        goto, fail, out, dict_link = self.goto, self.fail, self.out, self.dict_link
+        node = 0
+        text_len = len(text)
+        for end, ch in enumerate(text, 1):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = node if out[node] != -1 else dict_link[node]
+            while hit != -1:
+                name = self.patterns[out[hit]]
+                start = end - len(name)
+                if self._at_boundary(text, start, text_len) and self._at_boundary(text, end, text_len):
+                    matches.append((start, end, name))
+                hit = dict_link[hit]
+        return matches
+
+    @staticmethod
+    def _at_boundary(text: str, pos: int, text_len: int) -> bool:
+        before = pos > 0 and _is_word_char(text[pos - 1])
+        after = pos < text_len and _is_word_char(text[pos])
+        return before != after
+
+    def find_longest(self, text: str) -> Optional[str]:
+        """Returns the longest drug name in text (earliest wins on ties), or None."""
+        best = None
+        best_key = None
+        for start, end, name in self.find_all(text):
+            key = (end - start, -start)
+            if best_key is None or key > best_key:
+                best, best_key = name, key
+        return best
+
+    def save(self, path: str):
+        state = {
+            'version': self.FORMAT_VERSION,
+            'signature': self.signature,
+            'patterns': self.patterns,
+            'goto': self.goto,
+            'fail': self.fail,
+            'out': self.out,
+            'dict_link': self.dict_link,
+        }
+        joblib.dump(state, path)
+
+    @classmethod
+    def load(cls, path: str, expected_signature: Optional[str] = None) -> Optional['DrugNameMatcher']:
+        """Loads a persisted automaton; returns None if missing, invalid or stale."""
+        if not os.path.exists(path):
+            return None
+        try:
+            state = joblib.load(path)
+        except Exception as e:
+            print(f"Error loading drug name matcher from {path}: {e}")
+            return None
+        if not isinstance(state, dict) or state.get('version') != cls.FORMAT_VERSION:
+            return None
+        if expected_signature is not None and state.get('signature') != expected_signature:
+            return None
+        matcher = cls.__new__(cls)
+        matcher.signature = state['signature']
+        matcher.patterns = state['patterns']
+        matcher.goto = state['goto']
+        matcher.fail = state['fail']
+        matcher.out = state['out']
+        matcher.dict_link = state['dict_link']
+        return matcher
+
+    @classmethod
+    def load_or_build(cls, path: str, names: Iterable[str], signature: Optional[str] = None) -> 'DrugNameMatcher':
+        """
+        Reuses the automaton at path if it matches names, otherwise rebuilds and saves it.
+        A precomputed vocabulary signature can be passed to avoid hashing every name.
+        """
+        if signature is None:
+            names = list(names)
+            signature = cls.vocabulary_signature(names)
+        matcher = cls.load(path, expected_signature=signature)
+        if matcher is not None:
+            return matcher
+        matcher = cls(names)
+        try:
+            matcher.save(path)
+            print(f"Drug name matcher ({len(matcher)} names) saved to '{path}'")
+        except Exception as e:
+            print(f"Error saving drug name matcher to '{path}': {e}")
+        return matcher
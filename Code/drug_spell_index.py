@@ -0,0 +1,149 @@
+import os
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import joblib
+
+
+def _deletes(word: str, max_distance: int) -> Set[str]:
+    """Every string reachable from word by deleting up to max_distance characters."""
+    results = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        next_frontier = set()
+        for item in frontier:
+            if len(item) <= 1:
+                continue
+            for i in range(len(item)):
+                next_frontier.add(item[:i] + item[i + 1:])
+        next_frontier -= results
+        results |= next_frontier
+        frontier = next_frontier
+    return results
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Optimal-string-alignment (Damerau-Levenshtein) distance; returns max_distance + 1 once exceeded."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = current[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous_previous is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+
+class DrugSpellIndex:
+    """
+    SymSpell-style deletion dictionary over drug names and generic names.
+
+    Every term's deletions (up to max_distance characters, within a fixed prefix)
+    point back to the term, so a lookup only generates the query's own deletions
+    and verifies the few candidates they hit, independent of catalog size. Each
+    term maps to the drug ids it names, which resolves a generic name to its
+    brands.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, drug_names: Sequence[str] = (), generic_names: Sequence[str] = (),
+                 max_distance: int = 2, prefix_length: int = 7, source_signature: str = ''):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.source_signature = source_signature
+        self.terms: List[str] = []
+        self.term_drugs: List[List[int]] = []
+        self.term_is_brand: List[bool] = []
+        term_ids: Dict[str, int] = {}
+
+        def add(term: str, drug_id: int, is_brand: bool):
+            term = term.lower().strip()
+            if not term or term == 'nan':
+                return
+            term_id = term_ids.get(term)
+            if term_id is None:
+                term_id = term_ids[term] = len(self.terms)
+                self.terms.append(term)
+                self.term_drugs.append([])
+                self.term_is_brand.append(False)
+            if drug_id not in self.term_drugs[term_id]:
+                self.term_drugs[term_id].append(drug_id)
+            self.term_is_brand[term_id] = self.term_is_brand[term_id] or is_brand
+
+        for drug_id, name in enumerate(drug_names):
+            add(name, drug_id, True)
+        for drug_id, generic in enumerate(generic_names):
+            add(generic, drug_id, False)
+
+        self.deletes: Dict[str, List[int]] = {}
+        for term_id, term in enumerate(self.terms):
+            for deleted in _deletes(term[:self.prefix_length], self.max_distance):
+                self.deletes.setdefault(deleted, []).append(term_id)
+
+    def save(self, path: str):
+        tmp_path = path + '.tmp'
+        joblib.dump({'version': self.FORMAT_VERSION, 'state': self.__dict__}, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, source_signature: str) -> Optional['DrugSpellIndex']:
+        """Loads a saved index built from the same drug data; returns None if missing or stale."""
+        if not os.path.exists(path):
+            return None
+        try:
+            saved = joblib.load(path)
+        except Exception as e:
+            print(f"Error loading drug spelling index from {path}: {e}")
+            return None
+        if not isinstance(saved, dict) or saved.get('version') != cls.FORMAT_VERSION \
+                or saved['state'].get('source_signature') != source_signature:
+            return None
+        index = cls.__new__(cls)
+        index.__dict__.update(saved['state'])
+        return index
+
+    @classmethod
+    def load_or_build(cls, path: str, drug_names: Sequence[str], generic_names: Sequence[str],
+                      source_signature: str) -> 'DrugSpellIndex':
+        index = cls.load(path, source_signature)
+        if index is not None:
+            return index
+        index = cls(drug_names, generic_names, source_signature=source_signature)
+        try:
+            index.save(path)
+            print(f"Drug spelling index ({len(index.terms)} terms) saved to '{path}'")
+        except Exception as e:
+            print(f"Error saving drug spelling index to '{path}': {e}")
+        return index
+
+    def lookup(self, query: str, limit: int = 5,
+               max_distance: Optional[int] = None) -> List[Tuple[str, int, List[int]]]:
+        """
+        Ranked corrections as (term, distance, drug_ids): closest first, brand
+        names before generic names at equal distance, then by popularity.
+        """
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        query = query.lower().strip()
+        if not query:
+            return []
+        candidates: Set[int] = set()
+        for deleted in _deletes(query[:self.prefix_length], max_distance):
+            candidates.update(self.deletes.get(deleted, ()))
+        results = []
+        for term_id in candidates:
+            term = self.terms[term_id]
+            distance = edit_distance(query, term, max_distance)
+            if distance <= max_distance:
+                results.append((distance, not self.term_is_brand[term_id], -len(self.term_drugs[term_id]), term, term_id))
+        results.sort()
+        return [(term, distance, self.term_drugs[term_id]) for distance, _, _, term, term_id in results[:limit]]
@@ -0,0 +1,368 @@
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from array import array
+from collections.abc import Mapping, Sequence
+from typing import Dict, Iterator, Optional, Union
+
+import numpy as np
+
+DRUG_FIELDS = ('generic_name', 'drug_classes', 'activity', 'rx_otc',
+               'pregnancy_category', 'side_effects', 'related_drugs')
+
+_MAGIC = b'DRUGSTR1'
+_PREFIX = struct.Struct('<8sQ')  # magic, header length
+_ALIGN = 8
+
+
+def names_signature(names) -> str:
+    """Hash of a sorted name list; matches the signatures used by derived name indexes."""
+    digest = hashlib.sha1()
+    for name in names:
+        digest.update(name.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class _StringColumn(Sequence):
+    """One column of strings: a UTF-8 blob plus an int64 offset array, both views into the mapping."""
+
+    def __init__(self, buffer, offsets: np.ndarray, data_start: int):
+        self._buffer = buffer
+        self._offsets = offsets
+        self._data_start = data_start
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        start = self._data_start + int(self._offsets[row])
+        end = self._data_start + int(self._offsets[row + 1])
+        return self._buffer[start:end].decode('utf-8')
+
+    def raw(self, row: int) -> bytes:
+        """Undecoded UTF-8 bytes of one row, for copying between stores."""
+        return self._buffer[self._data_start + int(self._offsets[row]):self._data_start + int(self._offsets[row + 1])]
+
+
+class DrugRecord(Mapping):
+    """Read-only view of one drug's fields; each field is decoded only when accessed."""
+
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store: 'DrugStore', row: int):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, field: str) -> str:
+        column = self._store.columns.get(field)
+        if column is None:
+            raise KeyError(field)
+        return column[self._row]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(DRUG_FIELDS)
+
+    def __len__(self) -> int:
+        return len(DRUG_FIELDS)
+
+    def __repr__(self) -> str:
+        return f"DrugRecord({dict(self)!r})"
+
+
+class _NameView(Sequence):
+    """Sorted drug names (drug id -> name) with O(log n) membership tests."""
+
+    def __init__(self, store: 'DrugStore'):
+        self._column = store.names_column
+
+    def __len__(self) -> int:
+        return len(self._column)
+
+    def __getitem__(self, row):
+        return self._column[row]
+
+    def __contains__(self, name) -> bool:
+        return self.index_of(name) is not None
+
+    def index_of(self, name: str) -> Optional[int]:
+        if not isinstance(name, str):
+            return None
+        row = bisect.bisect_left(self._column, name)
+        if row < len(self._column) and self._column[row] == name:
+            return row
+        return None
+
+
+class DrugStore(Mapping):
+    """
+    Columnar, memory-mapped drug catalog.
+
+    The file holds a small JSON header followed by one string table per column
+    (drug_name plus DRUG_FIELDS), each with an int64 offset array. Rows are sorted
+    by drug name, so a drug's row number doubles as its drug id. Opening the store
+    only maps the file; strings are decoded on access, and several processes
+    reading the same file share one copy through the OS page cache.
+
+    Access mirrors the old dict-of-dicts: store[name]['side_effects'].
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_len = _PREFIX.unpack_from(self._mmap, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a drug store file")
+        self.header = json.loads(self._mmap[_PREFIX.size:_PREFIX.size + header_len].decode('utf-8'))
+        if self.header.get('version') != self.FORMAT_VERSION:
+            raise ValueError(f"Unsupported drug store version in {path}: {self.header.get('version')}")
+        self.signature: str = self.header['signature']
+        self.names_signature: str = self.header['names_signature']
+        self.num_rows: int = self.header['num_rows']
+
+        self.columns: Dict[str, _StringColumn] = {}
+        for name, section in self.header['columns'].items():
+            offsets = np.frombuffer(self._mmap, dtype='<i8', count=self.num_rows + 1, offset=section['offsets'])
+            self.columns[name] = _StringColumn(self._mmap, offsets, section['data'])
+        self.names_column = self.columns.pop('drug_name')
+        self.names = _NameView(self)
+
+    # --- Mapping interface: drug name -> DrugRecord ---
+    def __getitem__(self, name: str) -> DrugRecord:
+        row = self.names.index_of(name)
+        if row is None:
+            raise KeyError(name)
+        return DrugRecord(self, row)
+
+    def __contains__(self, name) -> bool:
+        return name in self.names
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def id_of(self, name: str) -> Optional[int]:
+        return self.names.index_of(name)
+
+    def record(self, drug_id: int) -> DrugRecord:
+        return DrugRecord(self, drug_id)
+
+    def column(self, field: str) -> _StringColumn:
+        """Whole column as a lazily decoded sequence indexed by drug id."""
+        return self.columns[field]
+
+    @property
+    def source(self) -> Optional[dict]:
+        """Description of the CSV the store was built from (path, size, mtime, hash), if recorded."""
+        return self.header.get('source')
+
+    @staticmethod
+    def update_source(path: str, source: Optional[dict]) -> bool:
+        """
+        Records a new source description in the header of the store at path
+        without rewriting its data. Returns False (leaving the file untouched)
+        if the new header does not fit in the space reserved for it.
+        """
+        with open(path, 'r+b') as file:
+            magic, header_len = _PREFIX.unpack(file.read(_PREFIX.size))
+            if magic != _MAGIC:
+                raise ValueError(f"{path} is not a drug store file")
+            header = json.loads(file.read(header_len).decode('utf-8'))
+            header['source'] = source
+            header_bytes = json.dumps(header).encode('utf-8')
+            if len(header_bytes) > header_len:
+                return False
+            file.seek(_PREFIX.size)
+            file.write(header_bytes.ljust(header_len))
+            file.flush()
+            os.fsync(file.fileno())
+        return True
+
+    def close(self):
+        """Releases the mapping (needed on Windows before the file can be replaced)."""
+        self.columns = {}
+        self.names_column = self.names = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # A caller still holds a view; the mapping is released when it is dropped
+
+    @classmethod
+    def write(cls, path: str, drug_data: Dict[str, Dict[str, str]], source: Optional[dict] = None):
+        """
+        Writes drug_data ({name: {field: value}}) as a store file.
+        The file is written under a temporary name and renamed into place, so
+        readers never observe a partially written store.
+        """
+        writer = DrugStoreWriter(path, source)
+        try:
+            for name in sorted(drug_data):
+                writer.add_row(name, [drug_data[name].get(field, '') for field in DRUG_FIELDS])
+            writer.commit()
+        finally:
+            writer.abort()
+
+
+class DrugStoreWriter:
+    """
+    Streams rows, in strictly increasing name order, into a new store file.
+
+    Each column's bytes and offsets are spooled to temporary files, so memory use
+    stays bounded regardless of row count. finish() assembles the final file
+    next to the destination; commit() also renames it into place atomically.
+    """
+
+    _COLUMNS = ('drug_name',) + DRUG_FIELDS
+    _OFFSET_BATCH = 65536
+
+    def __init__(self, path: str, source: Optional[dict] = None):
+        self.path = path
+        self.source = source
+        self.num_rows = 0
+        self._tmp_dir = tempfile.mkdtemp(prefix='.drugstore-', dir=os.path.dirname(os.path.abspath(path)))
+        self._data_files = {name: open(os.path.join(self._tmp_dir, f'{name}.data'), 'wb') for name in self._COLUMNS}
+        self._offset_files = {name: open(os.path.join(self._tmp_dir, f'{name}.offsets'), 'wb') for name in self._COLUMNS}
+        self._offset_buffers = {name: array('q', [0]) for name in self._COLUMNS}
+        self._sizes = {name: 0 for name in self._COLUMNS}
+        # Per column: one digest over value lengths and one over value bytes, so rows and batches hash alike
+        self._length_digests = {name: hashlib.sha1(name.encode('utf-8')) for name in self._COLUMNS}
+        self._data_digests = {name: hashlib.sha1() for name in self._COLUMNS}
+        self._names_digest = hashlib.sha1()
+        self._last_name: Optional[str] = None
+        self._tmp_path: Optional[str] = None
+
+    def add_row(self, name: str, values: Sequence[Union[str, bytes]]):
+        """Appends one drug; values are the DRUG_FIELDS in order, as str or UTF-8 bytes."""
+        if self._last_name is not None and name <= self._last_name:
+            raise ValueError(f"Rows must be added in increasing name order ('{name}' after '{self._last_name}')")
+        self._last_name = name
+        self._names_digest.update(name.encode('utf-8'))
+        self._names_digest.update(b'\0')
+        for column, value in zip(self._COLUMNS, (name, *values)):
+            if isinstance(value, str):
+                value = value.encode('utf-8')
+            self._data_files[column].write(value)
+            self._sizes[column] += len(value)
+            self._length_digests[column].update(struct.pack('<q', len(value)))
+            self._data_digests[column].update(value)
+            buffer = self._offset_buffers[column]
+            buffer.append(self._sizes[column])
+            if len(buffer) >= self._OFFSET_BATCH:
+                buffer.tofile(self._offset_files[column])
+                del buffer[:]
+        self.num_rows += 1
+
+    def add_batch(self, names: Sequence[str], columns: Sequence[Sequence[str]]):
+        """
+        Appends many drugs at once; columns holds one value sequence per DRUG_FIELDS
+        entry. Offsets are computed with NumPy and each column is written in one call.
+        """
+        if not len(names):
+            return
+        previous = self._last_name
+        for name in names:
+            if previous is not None and name <= previous:
+                raise ValueError(f"Rows must be added in increasing name order ('{name}' after '{previous}')")
+            previous = name
+        self._last_name = previous
+        for name in names:
+            self._names_digest.update(name.encode('utf-8'))
+            self._names_digest.update(b'\0')
+        for column, values in zip(self._COLUMNS, (names, *columns)):
+            encoded = [value.encode('utf-8') for value in values]
+            lengths = np.fromiter(map(len, encoded), dtype='<i8', count=len(encoded))
+            blob = b''.join(encoded)
+            self._data_files[column].write(blob)
+            self._length_digests[column].update(lengths.tobytes())
+            self._data_digests[column].update(blob)
+            offsets = self._sizes[column] + np.cumsum(lengths)
+            self._sizes[column] += len(blob)
+            buffer = self._offset_buffers[column]
+            buffer.tofile(self._offset_files[column])
+            del buffer[:]
+            offsets.astype('<i8').tofile(self._offset_files[column])
+        self.num_rows += len(names)
+
+    def finish(self) -> str:
+        """Assembles the store into a temporary file next to the destination and returns its path."""
+        for column in self._COLUMNS:
+            self._offset_buffers[column].tofile(self._offset_files[column])
+            del self._offset_buffers[column][:]
+            self._offset_files[column].close()
+            self._data_files[column].close()
+
+        combined = hashlib.sha1()
+        for column in self._COLUMNS:
+            combined.update(self._length_digests[column].digest())
+            combined.update(self._data_digests[column].digest())
+        header = {
+            'version': DrugStore.FORMAT_VERSION,
+            'num_rows': self.num_rows,
+            'signature': combined.hexdigest(),
+            'names_signature': self._names_digest.hexdigest(),
+            'source': self.source,
+            'columns': {},
+        }
+        offsets_nbytes = (self.num_rows + 1) * 8
+
+        # Section positions depend on the header size, so grow the reserved header until it fits
+        header_len = 0
+        while True:
+            position = _pad(_PREFIX.size + header_len)
+            for column in self._COLUMNS:
+                header['columns'][column] = {'offsets': position, 'data': position + offsets_nbytes}
+                position = _pad(position + offsets_nbytes + self._sizes[column])
+            header_bytes = json.dumps(header).encode('utf-8')
+            if len(header_bytes) <= header_len:
+                break
+            header_len = len(header_bytes) + 64
+        header_bytes = header_bytes.ljust(header_len)
+
+        self._tmp_path = self.path + '.tmp'
+        with open(self._tmp_path, 'wb') as file:
+            file.write(_PREFIX.pack(_MAGIC, header_len))
+            file.write(header_bytes)
+            for column in self._COLUMNS:
+                file.write(b'\0' * (header['columns'][column]['offsets'] - file.tell()))
+                for part in ('offsets', 'data'):
+                    with open(os.path.join(self._tmp_dir, f'{column}.{part}'), 'rb') as spool:
+                        shutil.copyfileobj(spool, file, 1 << 20)
+            file.write(b'\0' * (_pad(file.tell()) - file.tell()))
+            file.flush()
+            os.fsync(file.fileno())
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        return self._tmp_path
+
+    def commit(self):
+        """finish() and atomically replace the destination file."""
+        tmp_path = self.finish()
+        os.replace(tmp_path, self.path)
+        self._tmp_path = None
+
+    def abort(self):
+        """Removes any temporary files left behind (a no-op after a successful commit)."""
+        for handle in list(self._data_files.values()) + list(self._offset_files.values()):
+            if not handle.closed:
+                handle.close()
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        if self._tmp_path and os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+            self._tmp_path = None
+
+
+def _pad(position: int) -> int:
+    return (position + _ALIGN - 1) // _ALIGN * _ALIGN
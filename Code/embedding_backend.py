@@ -0,0 +1,263 @@
+import importlib.util
+import os
+import re
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+from transformers import AutoModel, AutoTokenizer
+
+from model_registry import model_registry
+
+_SAFE_NAME_RE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+class EmbeddingBackend:
+    """
+    Batched CPU sentence encoder.
+
+    embed_many sorts texts by token length and encodes them in batches padded
+    only to the longest text of each batch, so short texts are not padded to
+    the length of long ones. Sentence vectors are the CLS token ('cls', the
+    same vector the old feature-extraction pipeline returned) or the
+    attention-masked mean of the token vectors ('mean'), optionally
+    L2-normalized. The encoder runs in eager PyTorch (float32, or with
+    Linear layers dynamically quantized to int8) or as an exported ONNX
+    Runtime graph (optionally int8-quantized too). The encoder is loaded on
+    first use through the shared model registry. num_threads applies to this
+    backend only: the ORT session's intra-op threads, or PyTorch's thread
+    count for the duration of each forward pass.
+    """
+
+    POOLINGS = ('cls', 'mean')
+    RUNTIMES = ('torch', 'onnx')
+
+    def __init__(self, model_name: str = "distilbert-base-uncased", pooling: str = 'cls',
+                 normalize: bool = False, quantize: Optional[str] = None, runtime: str = 'torch',
+                 max_length: int = 512, onnx_dir: str = 'onnx_models', num_threads: Optional[int] = None):
+        if pooling not in self.POOLINGS:
+            raise ValueError(f"pooling must be one of {self.POOLINGS}, got '{pooling}'")
+        if runtime not in self.RUNTIMES:
+            raise ValueError(f"runtime must be one of {self.RUNTIMES}, got '{runtime}'")
+        if quantize not in (None, 'int8'):
+            raise ValueError(f"quantize must be None or 'int8', got '{quantize}'")
+        self.model_name = model_name
+        self.pooling = pooling
+        self.normalize = normalize
+        self.quantize = quantize
+        self.runtime = runtime
+        self.max_length = max_length
+        self.onnx_dir = onnx_dir
+        self.num_threads = num_threads
+
+    def _parts(self):
+        """(tokenizer, torch model or None, ONNX session or None), loaded through the shared model registry."""
+        return model_registry.get(self.model_name, self._load, dtype=self.quantize or 'float32',
+                                  kind=f'encoder ({self.runtime})')
+
+    @property
+    def tokenizer(self):
+        return self._parts()[0]
+
+    @property
+    def model(self):
+        return self._parts()[1]
+
+    @property
+    def session(self):
+        return self._parts()[2]
+
+    def _load(self):
+        start = time.perf_counter()
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        model = AutoModel.from_pretrained(self.model_name)
+        model.eval()
+        if self.runtime == 'onnx':
+            parts = (tokenizer, None, self._onnx_session(model, tokenizer, self.onnx_dir, self.num_threads))
+        elif self.quantize == 'int8':
+            parts = (tokenizer, torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8), None)
+        else:
+            parts = (tokenizer, model, None)
+        print(f"Embedding backend '{self.name}' loaded in {time.perf_counter() - start:.1f}s")
+        return parts
+
+    def release(self):
+        """Drops the encoder from the shared model registry."""
+        model_registry.release(self.model_name, dtype=self.quantize or 'float32', kind=f'encoder ({self.runtime})')
+
+    @property
+    def name(self) -> str:
+        """
+        Identifies the vectors this configuration produces. The default
+        configuration reproduces the pipeline's vectors, so it keeps the plain
+        model name and existing caches stay valid.
+        """
+        options = []
+        if self.pooling != 'cls':
+            options.append(self.pooling)
+        if self.normalize:
+            options.append('normalized')
+        if self.quantize:
+            options.append(self.quantize)
+        if self.runtime != 'torch':
+            options.append(self.runtime)
+        return '|'.join([self.model_name] + options)
+
+    def _onnx_session(self, model, tokenizer, onnx_dir: str, num_threads: Optional[int]):
+        """Exports the encoder to ONNX once (quantizing it if requested) and opens an ORT session."""
+        import onnxruntime
+
+        os.makedirs(onnx_dir, exist_ok=True)
+        base = os.path.join(onnx_dir, _SAFE_NAME_RE.sub('_', self.model_name))
+        float_path = base + '.onnx'
+        path = base + ('.int8.onnx' if self.quantize == 'int8' else '.onnx')
+        if not os.path.exists(float_path):
+            print(f"Exporting '{self.model_name}' to ONNX at '{float_path}'...")
+            dummy = tokenizer(["a sample sentence"], return_tensors='pt')
+            tmp_path = float_path + '.tmp'
+            torch.onnx.export(
+                model, (dummy['input_ids'], dummy['attention_mask']), tmp_path,
+                input_names=['input_ids', 'attention_mask'], output_names=['last_hidden_state'],
+                dynamic_axes={'input_ids': {0: 'batch', 1: 'sequence'},
+                              'attention_mask': {0: 'batch', 1: 'sequence'},
+                              'last_hidden_state': {0: 'batch', 1: 'sequence'}},
+                opset_version=14,
+            )
+            os.replace(tmp_path, float_path)
+        if path != float_path and not os.path.exists(path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            print(f"Quantizing ONNX encoder to int8 at '{path}'...")
+            quantize_dynamic(float_path, path + '.tmp', weight_type=QuantType.QInt8)
+            os.replace(path + '.tmp', path)
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        return onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+    def _encode_batch(self, token_ids: List[List[int]], parts) -> np.ndarray:
+        tokenizer, model, session = parts
+        inputs = tokenizer.pad({'input_ids': token_ids}, padding='longest', return_tensors='np')
+        input_ids = inputs['input_ids'].astype(np.int64)
+        attention_mask = inputs['attention_mask'].astype(np.int64)
+        if session is not None:
+            hidden = session.run(['last_hidden_state'],
+                                      {'input_ids': input_ids, 'attention_mask': attention_mask})[0]
+        else:
+            threads = torch.get_num_threads()
+            if self.num_threads:
+                torch.set_num_threads(self.num_threads)
+            try:
+                with torch.inference_mode():
+                    hidden = model(input_ids=torch.from_numpy(input_ids),
+                                   attention_mask=torch.from_numpy(attention_mask)).last_hidden_state.numpy()
+            finally:
+                if self.num_threads:
+                    torch.set_num_threads(threads) # Leave the rest of the process (e.g. generation) as it was
+        if self.pooling == 'cls':
+            vectors = hidden[:, 0]
+        else:
+            mask = attention_mask[:, :, None].astype(np.float32)
+            vectors = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1.0)
+        return np.asarray(vectors, dtype=np.float32)
+
+    def embed_many(self, texts: Sequence[str], batch_size: int = 32) -> np.ndarray:
+        """Returns a (len(texts), dim) float32 matrix in the order of texts."""
+        texts = [str(text) for text in texts]
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        # Tokenize once, then bucket by length: neighbours in sorted order have similar token counts
+        parts = self._parts()
+        token_ids = parts[0](texts, truncation=True, max_length=self.max_length)['input_ids']
+        order = np.argsort([len(ids) for ids in token_ids], kind='stable')
+        result = None
+        for start in range(0, len(texts), batch_size):
+            batch_ids = order[start:start + batch_size]
+            vectors = self._encode_batch([token_ids[i] for i in batch_ids], parts)
+            if result is None:
+                result = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            result[batch_ids] = vectors
+        if self.normalize:
+            norms = np.linalg.norm(result, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            result /= norms
+        return result
+
+
+def _cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return (a * b).sum(axis=1)
+
+
+def _nearest_neighbours(vectors: np.ndarray) -> np.ndarray:
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    scores = vectors @ vectors.T
+    np.fill_diagonal(scores, -np.inf)
+    return scores.argmax(axis=1)
+
+
+def onnx_available() -> bool:
+    """Whether the optional ONNX Runtime backend can run (it needs onnxruntime, and onnx for the export)."""
+    return all(importlib.util.find_spec(name) is not None for name in ('onnxruntime', 'onnx'))
+
+
+def benchmark_embedding_backends(texts: Sequence[str], model_name: str = "distilbert-base-uncased",
+                                 batch_size: int = 32, include_onnx: bool = True) -> List[Dict[str, float]]:
+    """
+    Encodes texts with the current pipeline path and each backend configuration.
+    Reports sentences/sec, plus agreement with the float32 torch encoder of the
+    same pooling: mean and minimum cosine between the two vectors of each text,
+    and the fraction of texts whose nearest neighbour in the set is unchanged.
+    ONNX configurations are skipped when onnxruntime or onnx is not installed.
+    """
+    from transformers import pipeline
+
+    texts = list(texts)
+    results = []
+
+    def measure(label: str, embed) -> np.ndarray:
+        embed(texts[:batch_size])  # Warm-up
+        start = time.perf_counter()
+        vectors = embed(texts)
+        seconds = time.perf_counter() - start
+        results.append({'backend': label, 'sentences_per_second': len(texts) / max(seconds, 1e-9)})
+        return vectors
+
+    def agreement(vectors: np.ndarray, reference: np.ndarray):
+        cosines = _cosine_rows(vectors, reference)
+        results[-1].update({
+            'mean_cosine': float(cosines.mean()),
+            'min_cosine': float(cosines.min()),
+            'neighbour_agreement': float(np.mean(_nearest_neighbours(vectors) == _nearest_neighbours(reference)))
+                                   if len(texts) > 1 else 1.0,
+        })
+
+    feature_pipeline = pipeline("feature-extraction", model=model_name, tokenizer=model_name)
+    pipeline_vectors = measure('pipeline float32 cls, one text at a time (current)', lambda batch: np.vstack(
+        [np.asarray(feature_pipeline(text)[0][0], dtype=np.float32) for text in batch]))
+    del feature_pipeline
+
+    if include_onnx and not onnx_available():
+        print("Skipping the ONNX backends: install onnxruntime and onnx to benchmark them.")
+        include_onnx = False
+    configs = [dict(pooling=pooling, quantize=quantize, runtime=runtime)
+               for pooling in EmbeddingBackend.POOLINGS
+               for runtime in (('torch', 'onnx') if include_onnx else ('torch',))
+               for quantize in (None, 'int8')]
+    references = {}
+    for config in configs:
+        backend = EmbeddingBackend(model_name, **config)
+        try:
+            vectors = measure(f"{backend.name} (bucketed, batch {batch_size})",
+                              lambda batch: backend.embed_many(batch, batch_size=batch_size))
+        except ImportError as e: # e.g. the ONNX exporter's own optional dependencies
+            print(f"Skipping {backend.name}: {e}")
+            backend.release()
+            continue
+        reference = references.setdefault(config['pooling'], vectors)
+        if config['pooling'] == 'cls' and reference is vectors:
+            reference = pipeline_vectors  # The float32 CLS backend is checked against the pipeline itself
+        agreement(vectors, reference)
+        backend.release()
+    return results
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import re
+import struct
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError: # Windows: no cross-process locking, use one process per cache directory
+    fcntl = None
+
+_INDEX_RECORD = struct.Struct('<20sq')  # sha1(key), row in the vector file
+_SAFE_NAME_RE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed by (model name, normalized text).
+
+    Tier 1 is a bounded in-memory LRU. Tier 2 is a persistent store per model:
+    an append-only float32 vector file plus an append-only index of
+    (sha1 of the key, row) records, which is read into a hash map on open.
+    A vector is written before its index record, and any torn tail left by a
+    crash is truncated on the next open, so the store never points at a
+    partial vector. Several processes can share a store: opening and appending
+    hold an exclusive lock on a lock file, rows are numbered from the vector
+    file's actual size, and each append first reads the index records other
+    processes added since.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, path_prefix: Optional[str], model_name: str, max_memory_entries: int = 10_000):
+        self.model_name = model_name
+        self.max_memory_entries = max_memory_entries
+        self.lowercase = 'uncased' in model_name.lower()
+        self._memory: 'OrderedDict[bytes, np.ndarray]' = OrderedDict()
+        self._rows: Dict[bytes, int] = {}
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+        self.dim: Optional[int] = None
+        self._vectors = None
+        self._index = None
+        self._num_rows = 0
+        self._index_offset = 0 # Bytes of the index file already read into _rows
+        self._disk_enabled = bool(path_prefix) # Without a path only the in-memory tier is used
+        if not self._disk_enabled:
+            return
+        base = f"{path_prefix}_{_SAFE_NAME_RE.sub('_', model_name)}"
+        self.meta_path = base + '_meta.json'
+        self.vectors_path = base + '.vec'
+        self.index_path = base + '.idx'
+        self.lock_path = base + '.lock'
+        try:
+            with self._locked():
+                self._open()
+        except Exception as e:
+            print(f"Error opening embedding cache '{base}': {e}. Continuing with the in-memory cache only.")
+            self._close_files()
+            self._disk_enabled = False
+
+    # --- Disk tier ---
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock on the store across processes."""
+        with open(self.lock_path, 'a+b') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _open(self):
+        """Opens an existing store (caller holds the lock)."""
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+            if meta.get('version') == self.FORMAT_VERSION and meta.get('model_name') == self.model_name:
+                self.dim = int(meta['dim'])
+            else:
+                print(f"Embedding cache '{self.meta_path}' is from another format or model. Starting a new one.")
+                for path in (self.vectors_path, self.index_path, self.meta_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+        if self.dim is None:
+            return
+        self._vectors = open(self.vectors_path, 'a+b')
+        self._index = open(self.index_path, 'a+b')
+        self._index_offset = 0
+        self._sync()
+
+    def _sync(self):
+        """
+        Truncates torn tails (from a crashed writer) and reads index records
+        appended since the last sync, by this or another process. Caller holds
+        the lock.
+        """
+        row_bytes = self.dim * 4
+        vectors_size = os.path.getsize(self.vectors_path)
+        self._num_rows = vectors_size // row_bytes
+        if vectors_size % row_bytes:
+            self._vectors.truncate(self._num_rows * row_bytes)
+
+        self._index.seek(self._index_offset)
+        data = self._index.read()
+        complete = len(data) - len(data) % _INDEX_RECORD.size
+        if complete != len(data):
+            self._index.truncate(self._index_offset + complete)
+        for digest, row in _INDEX_RECORD.iter_unpack(data[:complete]):
+            if row < self._num_rows:
+                self._rows[digest] = row
+        self._index_offset += complete
+
+    def _create(self, dim: int):
+        """Starts an empty store (caller holds the lock)."""
+        self.dim = dim
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'version': self.FORMAT_VERSION, 'model_name': self.model_name, 'dim': dim}, file)
+        os.replace(tmp_path, self.meta_path)
+        self._vectors = open(self.vectors_path, 'a+b')
+        self._index = open(self.index_path, 'a+b')
+        self._vectors.truncate(0)
+        self._index.truncate(0)
+        self._num_rows = 0
+        self._index_offset = 0
+
+    def _close_files(self):
+        for file in (self._vectors, self._index):
+            if file is not None:
+                file.close()
+        self._vectors = self._index = None
+
+    def _read_row(self, row: int) -> np.ndarray:
+        row_bytes = self.dim * 4
+        self._vectors.seek(row * row_bytes)
+        return np.frombuffer(self._vectors.read(row_bytes), dtype=np.float32)
+
+    def _append(self, digests: List[bytes], matrix: np.ndarray):
+        if not self._disk_enabled:
+            return
+        with self._locked():
+            if self._vectors is None:
+                try:
+                    self._open() # Another process may have created the store since we opened
+                    if self._vectors is None:
+                        self._create(matrix.shape[1])
+                except Exception as e:
+                    print(f"Error creating embedding cache '{self.vectors_path}': {e}")
+                    self._close_files()
+                    self._disk_enabled = False
+                    return
+            if matrix.shape[1] != self.dim:
+                return
+            self._sync()
+            first_row = self._num_rows # Rows other processes appended are already counted
+            self._vectors.write(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+            self._vectors.flush()
+            records = b''.join(_INDEX_RECORD.pack(digest, first_row + i) for i, digest in enumerate(digests))
+            self._index.write(records)
+            self._index.flush()
+            self._index_offset += len(records)
+            self._num_rows += len(digests)
+        for i, digest in enumerate(digests):
+            self._rows[digest] = first_row + i
+
+    # --- Lookups ---
+    def normalize(self, text: str) -> str:
+        text = ' '.join(str(text).split())
+        return text.lower() if self.lowercase else text
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha1(f"{self.model_name}\0{self.normalize(text)}".encode('utf-8')).digest()
+
+    def _remember(self, digest: bytes, vector: np.ndarray):
+        self._memory[digest] = vector
+        self._memory.move_to_end(digest)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_or_compute(self, texts: Sequence[str], compute: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Returns a (len(texts), dim) float32 matrix, calling compute once with the
+        distinct texts found in neither tier and storing their embeddings.
+        """
+        digests = [self.key(text) for text in texts]
+        found: Dict[bytes, np.ndarray] = {}
+        missing: Dict[bytes, str] = {}
+        for digest, text in zip(digests, texts):
+            if digest in found or digest in missing:
+                continue
+            vector = self._memory.get(digest)
+            if vector is not None:
+                self._memory.move_to_end(digest)
+                self.hits_memory += 1
+            elif digest in self._rows:
+                vector = self._read_row(self._rows[digest])
+                self._remember(digest, vector)
+                self.hits_disk += 1
+            else:
+                missing[digest] = text
+                self.misses += 1
+                continue
+            found[digest] = vector
+
+        if missing:
+            computed = np.asarray(compute(list(missing.values())), dtype=np.float32)
+            missing_digests = list(missing.keys())
+            try:
+                self._append(missing_digests, computed)
+            except Exception as e:
+                print(f"Error writing to embedding cache '{self.vectors_path}': {e}")
+            for digest, vector in zip(missing_digests, computed):
+                found[digest] = vector
+                self._remember(digest, vector)
+
+        if not digests:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.vstack([found[digest] for digest in digests])
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            'memory_hits': self.hits_memory,
+            'disk_hits': self.hits_disk,
+            'misses': self.misses,
+            'hit_rate': (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            'memory_entries': len(self._memory),
+            'disk_entries': len(self._rows),
+        }
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (f"Embedding cache ({self.model_name}): {stats['memory_hits']} memory hits, "
+                f"{stats['disk_hits']} disk hits, {stats['misses']} misses "
+                f"(hit rate {stats['hit_rate']:.1%}); {stats['memory_entries']} vectors in memory, "
+                f"{stats['disk_entries']} on disk.")
+
+    def close(self):
+        self._close_files()
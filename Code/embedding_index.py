@@ -0,0 +1,142 @@
+import hashlib
+import os
+from typing import List, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+
+
+class EmbeddingIndex:
+    """
+    A fixed set of texts with their L2-normalised embeddings.
+
+    The matrix is a contiguous float32 array saved as .npy and memory-mapped on
+    load, so it is shared through the page cache instead of being copied into
+    every process. A metadata file records the embedding model and a signature
+    of the texts; if either differs from what the caller expects, the cache is
+    considered stale and rebuilt.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, texts: Sequence[str], matrix: np.ndarray, model_name: str, signature: str):
+        self.texts: List[str] = list(texts)
+        self.matrix = matrix
+        self.model_name = model_name
+        self.signature = signature
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @staticmethod
+    def texts_signature(texts: Sequence[str]) -> str:
+        """Order-sensitive hash of the indexed texts."""
+        digest = hashlib.sha1()
+        for text in texts:
+            digest.update(text.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @staticmethod
+    def _paths(path_prefix: str) -> Tuple[str, str]:
+        return path_prefix + '.npy', path_prefix + '_meta.pkl'
+
+    @classmethod
+    def build(cls, texts: Sequence[str], nlp_processor, batch_size: int = 32) -> 'EmbeddingIndex':
+        texts = list(texts)
+        matrix = cls.normalize(nlp_processor.get_embeddings(texts, batch_size=batch_size)) if texts \
+            else np.zeros((0, 0), dtype=np.float32)
+        return cls(texts, np.ascontiguousarray(matrix), nlp_processor.model_name, cls.texts_signature(texts))
+
+    def save(self, path_prefix: str):
+        matrix_path, meta_path = self._paths(path_prefix)
+        # Write to temporary names first so a crash never leaves a half-written cache behind
+        tmp_matrix_path = path_prefix + '.tmp.npy'
+        np.save(tmp_matrix_path, self.matrix)
+        os.replace(tmp_matrix_path, matrix_path)
+        joblib.dump({
+            'version': self.FORMAT_VERSION,
+            'model_name': self.model_name,
+            'signature': self.signature,
+            'texts': self.texts,
+            'shape': self.matrix.shape,
+        }, meta_path + '.tmp')
+        os.replace(meta_path + '.tmp', meta_path)
+
+    @classmethod
+    def load(cls, path_prefix: str, model_name: Optional[str] = None,
+             signature: Optional[str] = None) -> Optional['EmbeddingIndex']:
+        """Memory-maps a saved index; returns None if missing, corrupt or stale."""
+        matrix_path, meta_path = cls._paths(path_prefix)
+        if not (os.path.exists(matrix_path) and os.path.exists(meta_path)):
+            return None
+        try:
+            meta = joblib.load(meta_path)
+            if not isinstance(meta, dict) or meta.get('version') != cls.FORMAT_VERSION:
+                return None
+            if model_name is not None and meta.get('model_name') != model_name:
+                return None
+            if signature is not None and meta.get('signature') != signature:
+                return None
+            matrix = np.load(matrix_path, mmap_mode='r')
+            if matrix.shape != tuple(meta['shape']) or matrix.dtype != np.float32:
+                return None
+        except Exception as e:
+            print(f"Error loading embedding index from {path_prefix}: {e}")
+            return None
+        return cls(meta['texts'], matrix, meta['model_name'], meta['signature'])
+
+    @classmethod
+    def load_or_build(cls, path_prefix: str, texts: Sequence[str], nlp_processor,
+                      signature: Optional[str] = None) -> 'EmbeddingIndex':
+        """
+        Reuses the cached index for (model, texts) or embeds the texts once and saves them.
+        A precomputed signature of texts can be passed to avoid hashing them on every load.
+        """
+        if signature is None:
+            texts = list(texts)
+            signature = cls.texts_signature(texts)
+        index = cls.load(path_prefix, model_name=nlp_processor.model_name, signature=signature)
+        if index is not None:
+            return index
+        texts = list(texts)
+        print(f"Building embedding index for {len(texts)} texts at '{path_prefix}'...")
+        index = cls.build(texts, nlp_processor)
+        try:
+            index.save(path_prefix)
+            index = cls.load(path_prefix) or index
+        except Exception as e:
+            print(f"Error saving embedding index to '{path_prefix}': {e}")
+        return index
+
+    def scores(self, query_embedding) -> np.ndarray:
+        """Cosine similarity of one query embedding against every indexed text."""
+        if not len(self.texts):
+            return np.zeros(0, dtype=np.float32)
+        return self.matrix @ self.normalize(query_embedding)
+
+    def top_k(self, query_embedding, k: int = 1, threshold: Optional[float] = None) -> List[Tuple[str, float]]:
+        """Returns up to k (text, score) pairs, best first, optionally above a threshold."""
+        scores = self.scores(query_embedding)
+        return [(self.texts[i], float(scores[i])) for i in self.top_k_ids(scores, k, threshold)]
+
+    @staticmethod
+    def top_k_ids(scores: np.ndarray, k: int, threshold: Optional[float] = None) -> np.ndarray:
+        """Row ids of the k highest scores (descending), optionally filtered by threshold."""
+        if k <= 0 or scores.size == 0:
+            return np.zeros(0, dtype=np.int64)
+        if k < scores.size:
+            ids = np.argpartition(-scores, k - 1)[:k]
+        else:
+            ids = np.arange(scores.size)
+        ids = ids[np.argsort(-scores[ids], kind='stable')]
+        if threshold is not None:
+            ids = ids[scores[ids] > threshold]
+        return ids
@@ -0,0 +1,654 @@
+import asyncio
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+import torch
+import torch.nn.functional as F
+from transformers import AutoTokenizer, DynamicCache, TextStreamer
+
+from history_window import HistoryWindow
+from model_precision import PRECISIONS, load_causal_lm
+from model_registry import model_registry
+from qwen_chatbot import BENCHMARK_PROMPTS, common_prefix_length, strip_thinking, summary_instruction
+
+# Caches are read and built through the DynamicCache layer API, not the deprecated legacy tuple format.
+# Written against transformers 4.51-4.57 (see requirements.txt): key_cache/value_cache lists up to 4.55,
+# per-layer objects with keys/values from 4.56. update() is the public way to fill a cache in both.
+CacheLayers = List[Tuple[torch.Tensor, torch.Tensor]] # Per-layer (keys, values), [batch, heads, tokens, dim]
+
+
+def _cache_layers(cache: DynamicCache) -> CacheLayers:
+    if hasattr(cache, 'layers'):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    return list(zip(cache.key_cache, cache.value_cache))
+
+
+def _new_cache(layers: CacheLayers) -> DynamicCache:
+    cache = DynamicCache()
+    for index, (keys, values) in enumerate(layers):
+        cache.update(keys, values, index)
+    return cache
+
+
+class _TextCallbackStreamer(TextStreamer):
+    """Decodes generated tokens into printable text deltas and hands them to a callback."""
+
+    def __init__(self, tokenizer, on_text: Callable[[str], None]):
+        super().__init__(tokenizer, skip_prompt=False, skip_special_tokens=True)
+        self.on_text = on_text
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        if text:
+            self.on_text(text)
+
+
+class ChatSession:
+    """Conversation state of one user of a GenerationEngine: history window and cached prompt prefix."""
+
+    def __init__(self, session_id: str, history_window: HistoryWindow):
+        self.session_id = session_id
+        self.history_window = history_window
+        self.cache = None # Per-layer (keys, values) of cache_ids, left by the last turn while it is in the LRU
+        self.cache_ids: List[int] = []
+        self.last_stats: Dict[str, float] = {}
+        self.turn_lock = threading.Lock() # Held while a turn is queued or generating
+
+    @property
+    def history(self) -> List[Dict[str, str]]:
+        return self.history_window.messages
+
+
+class GenerationRequest:
+    """One queued or running generation; result() waits for the reply."""
+
+    def __init__(self, session: Optional[ChatSession], user_input: Optional[str], prompt_ids: List[int],
+                 max_new_tokens: int, temperature: float, top_k: Optional[int], top_p: float, eos_token_ids: set,
+                 streamer: Optional[TextStreamer], cancel_event: threading.Event):
+        self.session = session
+        self.user_input = user_input
+        self.prompt_ids = prompt_ids
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_k = top_k
+        self.top_p = top_p
+        self.eos_token_ids = eos_token_ids # Empty to always generate max_new_tokens
+        self.streamer = streamer
+        self.cancel_event = cancel_event
+        self.generated: List[int] = []
+        self.text = ""
+        self.error: Optional[BaseException] = None
+        self.stats: Dict[str, float] = {}
+        self.done = threading.Event()
+        # Scheduler state
+        self.cache = None # Prefill cache (DynamicCache, then CacheLayers once complete) until joining the batch
+        self.cache_len = 0 # Tokens in the KV cache: the prompt (so far) and all generated tokens but the last
+        self.pad = 0 # Left padding of this row in the batch cache
+        self.finished = False
+        self.cancelled = False
+        self.reused_tokens = 0
+        self.submit_time = time.perf_counter()
+        self.admit_time: Optional[float] = None
+        self.first_token_time: Optional[float] = None
+        self.end_time: Optional[float] = None
+        self._callbacks: List[Callable[['GenerationRequest'], None]] = []
+        self._callback_lock = threading.Lock()
+
+    def cancel(self):
+        """Stops generation after the current token; the partial reply is kept."""
+        self.cancel_event.set()
+
+    def result(self, timeout: Optional[float] = None) -> str:
+        if not self.done.wait(timeout):
+            raise TimeoutError("Generation did not finish in time")
+        if self.error is not None:
+            raise self.error
+        return self.text
+
+    def add_done_callback(self, callback: Callable[['GenerationRequest'], None]):
+        with self._callback_lock:
+            if not self.done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _set_done(self):
+        with self._callback_lock:
+            self.done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"Warning: generation done callback failed: {e}")
+
+
+class GenerationEngine:
+    """
+    Continuous-batching generation for many chat sessions sharing one model.
+
+    Each session keeps its own HistoryWindow and the KV cache of its last turn.
+    Turns are queued and a scheduler thread works at token granularity: before
+    every decode step it retires finished or cancelled sequences, admits
+    waiting ones up to max_batch_size, prefills at most max_prefill_tokens
+    prompt tokens (so a long prompt is spread over several steps instead of
+    stalling every active sequence), then runs one forward pass that decodes
+    the next token of every active sequence together. The batch KV cache is
+    left-padded to the longest sequence and only re-stacked when the batch
+    changes. Decoding is bound by reading the weights, which a batched step
+    does once for all sequences, so aggregate tokens/sec grows with the
+    number of concurrent sessions.
+
+    A prompt reuses the session's cached KV up to the longest common token
+    prefix. The chat template drops the <think> block of earlier replies, so
+    after a reply that thought, only its prompt is kept. Idle sessions' caches
+    are limited to max_cached_tokens in total and the least recently used
+    are dropped first (a token of Qwen3-1.7B's float32 KV cache is about
+    224 KiB). Histories stay until close_session.
+
+    stats() reports queue depth, batch size and throughput of the scheduler.
+    """
+
+    def __init__(self, model_name: str = "Qwen/Qwen3-1.7B", precision: str = 'float32',
+                 cache_dir: Optional[str] = 'quantized_models', max_batch_size: int = 8,
+                 token_budget: Optional[int] = 4096, reuse_kv_cache: bool = True, summary_max_tokens: int = 200,
+                 max_prefill_tokens: Optional[int] = 512, max_cached_tokens: Optional[int] = 8192):
+        if precision not in PRECISIONS:
+            raise ValueError(f"precision must be one of {', '.join(PRECISIONS)}, got '{precision}'")
+        self.model_name = model_name
+        self.precision = precision
+        self.cache_dir = cache_dir
+        self.max_batch_size = max_batch_size
+        self.token_budget = token_budget
+        self.reuse_kv_cache = reuse_kv_cache
+        self.summary_max_tokens = summary_max_tokens
+        self.max_prefill_tokens = max_prefill_tokens # Per scheduler step; None prefills whole prompts
+        self.max_cached_tokens = max_cached_tokens # Over all idle sessions; None keeps every cache
+        self.sessions: Dict[str, ChatSession] = {}
+        self._sessions_lock = threading.Lock()
+        self._cached_sessions: 'OrderedDict[str, ChatSession]' = OrderedDict() # Sessions holding a cache, LRU first
+        self._cached_tokens = 0
+        self._waiting: deque = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._worker: Optional[threading.Thread] = None
+        # Owned by the scheduler thread
+        self._batch: List[GenerationRequest] = []
+        self._prefilling: deque = deque() # Admitted requests whose prompt is partly prefilled
+        self._cache: Optional[DynamicCache] = None
+        self._mask: Optional[torch.Tensor] = None
+        self._metrics = {'completed': 0, 'decode_steps': 0, 'batch_size_sum': 0, 'peak_batch_size': 0,
+                         'queue_depth_sum': 0, 'peak_queue_depth': 0, 'prefill_tokens': 0, 'reused_tokens': 0,
+                         'generated_tokens': 0, 'busy_seconds': 0.0, 'queue_seconds_sum': 0.0,
+                         'evicted_session_caches': 0}
+
+    @property
+    def tokenizer(self):
+        return model_registry.get(self.model_name, lambda: AutoTokenizer.from_pretrained(self.model_name),
+                                  dtype='-', kind='tokenizer')
+
+    @property
+    def model(self):
+        return model_registry.get(self.model_name, lambda: load_causal_lm(self.model_name, self.precision, self.cache_dir),
+                                  dtype=self.precision, kind='causal-lm')
+
+    def session(self, session_id: str) -> ChatSession:
+        """The session with this id, created on first use."""
+        with self._sessions_lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                window = HistoryWindow(self._count_tokens, self._summarize, token_budget=self.token_budget)
+                session = self.sessions[session_id] = ChatSession(session_id, window)
+            return session
+
+    def close_session(self, session_id: str):
+        with self._sessions_lock:
+            session = self.sessions.pop(session_id, None)
+            if session is not None:
+                self._drop_session_cache(session)
+        if session is not None:
+            session.history_window.wait()
+
+    def _drop_session_cache(self, session: ChatSession):
+        """Caller holds _sessions_lock."""
+        if self._cached_sessions.pop(session.session_id, None) is not None:
+            self._cached_tokens -= len(session.cache_ids)
+        session.cache, session.cache_ids = None, []
+
+    def _store_session_cache(self, session: ChatSession, cache, cache_ids: List[int]):
+        """Keeps a finished turn's cache for the session, evicting least recently used caches over the limit."""
+        with self._sessions_lock:
+            self._drop_session_cache(session)
+            if self.sessions.get(session.session_id) is not session: # Closed meanwhile
+                return
+            session.cache, session.cache_ids = cache, cache_ids
+            self._cached_sessions[session.session_id] = session
+            self._cached_tokens += len(cache_ids)
+            while self.max_cached_tokens is not None and self._cached_tokens > self.max_cached_tokens:
+                _, oldest = next(iter(self._cached_sessions.items()))
+                self._drop_session_cache(oldest)
+                self._metrics['evicted_session_caches'] += 1
+
+    def _take_session_cache(self, session: ChatSession):
+        """(cache, cache_ids) of the session's last turn, removed from the session; (None, []) if dropped."""
+        with self._sessions_lock:
+            cache, cache_ids = session.cache, session.cache_ids
+            self._drop_session_cache(session)
+        return cache, cache_ids
+
+    def _count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def _summarize(self, previous_summary: str, messages: List[Dict[str, str]]) -> str:
+        """Runs the session's summary as one more (sessionless, greedy) request in the batch."""
+        request = self._enqueue(None, None, [{"role": "user", "content": summary_instruction(previous_summary, messages)}],
+                                max_new_tokens=self.summary_max_tokens, temperature=0.0,
+                                chat_template_kwargs={'enable_thinking': False})
+        return strip_thinking(request.result())
+
+    def submit(self, session_id: str, user_input: str, max_new_tokens: int = 1000, temperature: Optional[float] = None,
+               top_k: Optional[int] = None, top_p: Optional[float] = None, ignore_eos: bool = False,
+               on_text: Optional[Callable[[str], None]] = None,
+               cancel_event: Optional[threading.Event] = None) -> GenerationRequest:
+        """
+        Queues the next turn of a session and returns its request. Sampling
+        settings default to the model's generation config (temperature 0 is
+        greedy). on_text receives the reply as text deltas on the scheduler
+        thread. A session runs one turn at a time: this blocks until the
+        session's previous turn has finished.
+        """
+        session = self.session(session_id)
+        session.turn_lock.acquire()
+        try:
+            messages = session.history_window.prompt_messages(user_input)
+            return self._enqueue(session, user_input, messages, max_new_tokens, temperature, top_k, top_p,
+                                 ignore_eos, on_text, cancel_event)
+        except BaseException:
+            session.turn_lock.release()
+            raise
+
+    def _enqueue(self, session: Optional[ChatSession], user_input: Optional[str], messages: List[Dict[str, str]],
+                 max_new_tokens: int = 1000, temperature: Optional[float] = None, top_k: Optional[int] = None,
+                 top_p: Optional[float] = None, ignore_eos: bool = False,
+                 on_text: Optional[Callable[[str], None]] = None, cancel_event: Optional[threading.Event] = None,
+                 chat_template_kwargs: Optional[Dict] = None) -> GenerationRequest:
+        tokenizer = self.tokenizer
+        text = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True,
+                                             **(chat_template_kwargs or {}))
+        prompt_ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+        config = self.model.generation_config
+        sample = getattr(config, 'do_sample', False)
+        if temperature is None:
+            temperature = (config.temperature or 1.0) if sample else 0.0
+        if top_k is None and sample:
+            top_k = config.top_k
+        if top_p is None:
+            top_p = (config.top_p or 1.0) if sample else 1.0
+        eos_token_ids = set()
+        if not ignore_eos:
+            eos = getattr(config, 'eos_token_id', None)
+            eos_token_ids = {token for token in (eos if isinstance(eos, (list, tuple)) else [eos]) + [tokenizer.eos_token_id]
+                             if token is not None}
+        streamer = _TextCallbackStreamer(tokenizer, on_text) if on_text is not None else None
+        request = GenerationRequest(session, user_input, prompt_ids, max_new_tokens, temperature, top_k, top_p,
+                                    eos_token_ids, streamer, cancel_event or threading.Event())
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Generation engine is closed")
+            self._waiting.append(request)
+            self._metrics['peak_queue_depth'] = max(self._metrics['peak_queue_depth'], len(self._waiting))
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+                self._worker.start()
+            self._condition.notify()
+        return request
+
+    def generate(self, session_id: str, user_input: str, max_new_tokens: int = 1000, **kwargs) -> str:
+        return self.submit(session_id, user_input, max_new_tokens, **kwargs).result()
+
+    async def stream(self, session_id: str, user_input: str, max_new_tokens: int = 1000,
+                     cancel_event: Optional[threading.Event] = None, **kwargs) -> AsyncIterator[str]:
+        """Yields the reply as text deltas. Setting cancel_event (or closing the iterator) stops it."""
+        cancel_event = cancel_event or threading.Event()
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+        request = await asyncio.to_thread(self.submit, session_id, user_input, max_new_tokens,
+                                          on_text=lambda text: loop.call_soon_threadsafe(queue.put_nowait, text),
+                                          cancel_event=cancel_event, **kwargs)
+        request.add_done_callback(lambda _: loop.call_soon_threadsafe(queue.put_nowait, done))
+        try:
+            while True:
+                text = await queue.get()
+                if text is done:
+                    break
+                yield text
+            request.result()
+        finally:
+            cancel_event.set() # No-op once the request has finished
+            await asyncio.to_thread(request.done.wait) # No text is handed to this loop after we return
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and not self._waiting and not self._batch and not self._prefilling:
+                    self._condition.wait()
+                if self._closed:
+                    break
+                free = self.max_batch_size - sum(not request.finished for request in self._batch) - len(self._prefilling)
+                admitted = [self._waiting.popleft() for _ in range(min(free, len(self._waiting)))]
+            start = time.perf_counter()
+            try:
+                model = self.model
+                with torch.inference_mode():
+                    changed = self._retire_finished()
+                    self._prefilling.extend(request for request in admitted if self._begin_prefill(request))
+                    joined = self._prefill_step(model)
+                    if changed or joined:
+                        self._restack(joined)
+                    if self._batch:
+                        self._decode(model)
+            except Exception as e: # Keep serving later requests; fail the ones in flight
+                print(f"Error in generation scheduler: {e}")
+                for request in admitted + list(self._prefilling) + self._batch:
+                    if not request.done.is_set():
+                        request.error = request.error or e
+                        self._finish(request)
+                        try:
+                            self._finalize(request)
+                        except Exception:
+                            if request.session is not None and request.session.turn_lock.locked():
+                                request.session.turn_lock.release()
+                            request._set_done()
+                self._batch, self._cache, self._mask = [], None, None
+                self._prefilling.clear()
+            self._metrics['busy_seconds'] += time.perf_counter() - start
+
+        # Closed: fail whatever is still queued or running
+        with self._condition:
+            pending, self._waiting = list(self._waiting) + list(self._prefilling) + self._batch, deque()
+            self._prefilling.clear()
+        for request in pending:
+            if request.done.is_set():
+                continue
+            if not request.finished:
+                request.error = RuntimeError("Generation engine closed")
+                self._finish(request)
+            self._finalize(request)
+        self._batch, self._cache, self._mask = [], None, None
+
+    def _retire_finished(self) -> bool:
+        """Finalizes finished or cancelled rows, keeping their cache for the session's next turn."""
+        layers, changed = None, False
+        for row, request in enumerate(self._batch):
+            if not request.finished and request.cancel_event.is_set():
+                self._finish(request, cancelled=True)
+            if request.finished:
+                changed = True
+                cache = None
+                if self.reuse_kv_cache and request.session is not None:
+                    layers = layers if layers is not None else _cache_layers(self._cache)
+                    cache = [(keys[row:row + 1, :, request.pad:], values[row:row + 1, :, request.pad:])
+                             for keys, values in layers]
+                self._finalize(request, cache)
+        return changed
+
+    def _begin_prefill(self, request: GenerationRequest) -> bool:
+        """Starts an admitted request from its session's cached prefix; False if it was cancelled while queued."""
+        request.admit_time = time.perf_counter()
+        if request.cancel_event.is_set():
+            self._finish(request, cancelled=True)
+            self._finalize(request)
+            return False
+        ids, session, reused = request.prompt_ids, request.session, 0
+        request.cache = DynamicCache()
+        if session is not None:
+            cache, cache_ids = self._take_session_cache(session)
+            # At least the last prompt token must be fed to get the next token's logits
+            reused = min(common_prefix_length(cache_ids, ids), len(ids) - 1) if cache is not None else 0
+            if reused:
+                request.cache = _new_cache([(keys[:, :, :reused], values[:, :, :reused]) for keys, values in cache])
+        request.cache_len = request.reused_tokens = reused
+        self._metrics['reused_tokens'] += reused
+        return True
+
+    def _prefill_step(self, model) -> List[GenerationRequest]:
+        """
+        Feeds up to max_prefill_tokens prompt tokens, oldest request first, and
+        samples the first token of each prompt that completes. Returns the
+        requests that join the batch.
+        """
+        budget = self.max_prefill_tokens or sys.maxsize
+        joined = []
+        while self._prefilling and budget > 0:
+            request = self._prefilling[0]
+            ids = request.prompt_ids
+            if request.cancel_event.is_set():
+                self._finish(request, cancelled=True)
+            else:
+                chunk = ids[request.cache_len:request.cache_len + budget]
+                try:
+                    outputs = model(input_ids=torch.tensor([chunk], dtype=torch.long), past_key_values=request.cache,
+                                    use_cache=True, logits_to_keep=1)
+                    request.cache = outputs.past_key_values
+                    request.cache_len += len(chunk)
+                    budget -= len(chunk)
+                    self._metrics['prefill_tokens'] += len(chunk)
+                    if request.cache_len < len(ids):
+                        break # Out of budget; continues next step
+                    self._accept(request, self._sample(outputs.logits[0, -1], request))
+                except Exception as e:
+                    request.error = e
+                    self._finish(request)
+            self._prefilling.popleft()
+            cache = _cache_layers(request.cache) if request.error is None and request.cache_len else None
+            request.cache = None
+            if request.finished:
+                self._finalize(request, cache)
+            else:
+                request.cache = cache
+                joined.append(request)
+        return joined
+
+    def _restack(self, joined: List[GenerationRequest]):
+        """Rebuilds the batch cache from the unfinished rows and the newly prefilled requests, left-padded."""
+        layers = _cache_layers(self._cache) if self._cache is not None else None
+        batch, parts = [], []
+        for row, request in enumerate(self._batch):
+            if not request.finished:
+                batch.append(request)
+                parts.append([(keys[row:row + 1, :, request.pad:], values[row:row + 1, :, request.pad:])
+                              for keys, values in layers])
+        for request in joined:
+            batch.append(request)
+            parts.append(request.cache)
+            request.cache = None
+        self._batch = batch
+        if not batch:
+            self._cache, self._mask = None, None
+            return
+        length = max(request.cache_len for request in batch)
+        for request in batch:
+            request.pad = length - request.cache_len
+        stacked = []
+        for layer in range(len(parts[0])):
+            keys = torch.cat([F.pad(part[layer][0], (0, 0, request.pad, 0)) for request, part in zip(batch, parts)])
+            values = torch.cat([F.pad(part[layer][1], (0, 0, request.pad, 0)) for request, part in zip(batch, parts)])
+            stacked.append((keys, values))
+        self._cache = _new_cache(stacked)
+        self._mask = torch.ones(len(batch), length, dtype=torch.long)
+        for row, request in enumerate(batch):
+            self._mask[row, :request.pad] = 0
+
+    def _decode(self, model):
+        """One forward pass feeding the last token of every active sequence."""
+        batch = self._batch
+        with self._condition:
+            queue_depth = len(self._waiting)
+        metrics = self._metrics
+        metrics['decode_steps'] += 1
+        metrics['batch_size_sum'] += len(batch)
+        metrics['peak_batch_size'] = max(metrics['peak_batch_size'], len(batch))
+        metrics['queue_depth_sum'] += queue_depth
+        self._mask = torch.cat([self._mask, torch.ones(len(batch), 1, dtype=torch.long)], dim=1)
+        try:
+            outputs = model(input_ids=torch.tensor([[request.generated[-1]] for request in batch], dtype=torch.long),
+                            attention_mask=self._mask,
+                            position_ids=torch.tensor([[request.cache_len] for request in batch], dtype=torch.long),
+                            past_key_values=self._cache, use_cache=True)
+        except Exception as e:
+            for request in batch:
+                request.error = e
+                self._finish(request)
+                self._finalize(request)
+            self._batch, self._cache, self._mask = [], None, None
+            return
+        self._cache = outputs.past_key_values
+        for row, request in enumerate(batch):
+            request.cache_len += 1
+            self._accept(request, self._sample(outputs.logits[row, -1], request))
+
+    @staticmethod
+    def _sample(logits: torch.Tensor, request: GenerationRequest) -> int:
+        if not request.temperature:
+            return int(torch.argmax(logits))
+        logits = logits.float() / request.temperature
+        if request.top_k:
+            kth = torch.topk(logits, min(request.top_k, logits.numel())).values[-1]
+            logits = logits.masked_fill(logits < kth, float('-inf'))
+        probs = torch.softmax(logits, dim=-1)
+        if request.top_p < 1.0:
+            sorted_probs, order = probs.sort(descending=True)
+            sorted_probs[sorted_probs.cumsum(0) - sorted_probs > request.top_p] = 0 # Keep the smallest set reaching top_p
+            probs = torch.zeros_like(probs).scatter(0, order, sorted_probs)
+        return int(torch.multinomial(probs, 1))
+
+    def _accept(self, request: GenerationRequest, token: int):
+        if request.first_token_time is None:
+            request.first_token_time = time.perf_counter()
+        request.generated.append(token)
+        self._metrics['generated_tokens'] += 1
+        if request.streamer is not None:
+            try:
+                request.streamer.put(torch.tensor([token]))
+            except Exception as e: # The caller's on_text failed; stop this request, not the batch
+                request.error = e
+                self._finish(request)
+                return
+        if token in request.eos_token_ids or len(request.generated) >= request.max_new_tokens:
+            self._finish(request)
+
+    def _finish(self, request: GenerationRequest, cancelled: bool = False):
+        request.finished = True
+        request.cancelled = cancelled
+        request.end_time = time.perf_counter()
+        if request.streamer is not None:
+            try:
+                request.streamer.end()
+            except Exception as e:
+                request.error = request.error or e
+
+    def _finalize(self, request: GenerationRequest, cache=None):
+        """Records a finished request in its session and wakes up its caller."""
+        request.text = self.tokenizer.decode(request.generated, skip_special_tokens=True)
+        first = request.first_token_time
+        end = request.end_time or time.perf_counter()
+        request.stats = {
+            'prompt_tokens': len(request.prompt_ids), 'reused_tokens': request.reused_tokens,
+            'prefill_tokens': len(request.prompt_ids) - request.reused_tokens, 'new_tokens': len(request.generated),
+            'queue_seconds': (request.admit_time or end) - request.submit_time,
+            'ttft_seconds': (first if first is not None else end) - request.submit_time,
+            'seconds': end - request.submit_time,
+            'tokens_per_second': (len(request.generated) - 1) / (end - first)
+                                 if first is not None and len(request.generated) > 1 and end > first else 0.0,
+            'cancelled': request.cancelled,
+        }
+        self._metrics['completed'] += 1
+        self._metrics['queue_seconds_sum'] += request.stats['queue_seconds']
+        session = request.session
+        if session is not None:
+            try:
+                if cache is not None and self.reuse_kv_cache:
+                    # The next prompt renders this reply without its <think> block, so only the prompt can match
+                    keep = request.cache_len if '</think>' not in request.text \
+                        else min(request.cache_len, len(request.prompt_ids))
+                    self._store_session_cache(session, [(keys[:, :, :keep].clone(), values[:, :, :keep].clone())
+                                                        for keys, values in cache],
+                                              (request.prompt_ids + request.generated)[:keep])
+                if request.error is None and request.generated:
+                    session.history_window.append({"role": "user", "content": request.user_input})
+                    session.history_window.append({"role": "assistant", "content": request.text},
+                                                  tokens=len(request.generated))
+                    session.history_window.enforce_budget()
+                session.last_stats = {**request.stats, **session.history_window.stats()}
+            finally:
+                session.turn_lock.release()
+        request._set_done()
+
+    def stats(self) -> Dict[str, float]:
+        """Queue depth and batch size (now, mean per decode step and peak), token counts and throughput."""
+        with self._condition:
+            queue_depth = len(self._waiting)
+        metrics = dict(self._metrics)
+        steps, completed = metrics['decode_steps'], metrics['completed']
+        return {
+            'queue_depth': queue_depth,
+            'active_sequences': sum(not request.finished for request in self._batch),
+            'prefilling_sequences': len(self._prefilling),
+            'completed': completed,
+            'decode_steps': steps,
+            'mean_batch_size': metrics['batch_size_sum'] / steps if steps else 0.0,
+            'peak_batch_size': metrics['peak_batch_size'],
+            'mean_queue_depth': metrics['queue_depth_sum'] / steps if steps else 0.0,
+            'peak_queue_depth': metrics['peak_queue_depth'],
+            'mean_queue_seconds': metrics['queue_seconds_sum'] / completed if completed else 0.0,
+            'prefill_tokens': metrics['prefill_tokens'],
+            'reused_tokens': metrics['reused_tokens'],
+            'generated_tokens': metrics['generated_tokens'],
+            'busy_seconds': metrics['busy_seconds'],
+            'cached_session_tokens': self._cached_tokens,
+            'evicted_session_caches': metrics['evicted_session_caches'],
+            'tokens_per_second': metrics['generated_tokens'] / metrics['busy_seconds'] if metrics['busy_seconds'] else 0.0,
+        }
+
+    def close(self):
+        """Stops the scheduler; queued and running requests fail with RuntimeError."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            worker = self._worker
+        if worker is not None:
+            worker.join()
+
+
+def benchmark_engine(model_name: str = "Qwen/Qwen3-1.7B", session_counts: Sequence[int] = (1, 2, 4, 8, 16),
+                     max_new_tokens: int = 32, precision: str = 'float32', max_batch_size: int = 8) -> List[Dict]:
+    """
+    Sends one turn from each of N concurrent sessions (greedy, exactly
+    max_new_tokens each) for every N in session_counts and returns one row per
+    N: wall time, aggregate tokens/sec, mean time to first token, and the
+    engine's batch size and queue depth. Counts above max_batch_size show
+    requests queueing for a free slot.
+    """
+    rows = []
+    for sessions in session_counts:
+        engine = GenerationEngine(model_name, precision=precision, max_batch_size=max_batch_size, token_budget=None)
+        engine.model # Loaded (once, through the registry) before timing
+        start = time.perf_counter()
+        requests = [engine.submit(f"session-{i}", BENCHMARK_PROMPTS[i % len(BENCHMARK_PROMPTS)],
+                                  max_new_tokens=max_new_tokens, temperature=0.0, ignore_eos=True)
+                    for i in range(sessions)]
+        for request in requests:
+            request.result()
+        seconds = time.perf_counter() - start
+        stats = engine.stats()
+        engine.close()
+        generated = sum(len(request.generated) for request in requests)
+        rows.append({'sessions': sessions, 'seconds': seconds, 'generated_tokens': generated,
+                     'tokens_per_second': generated / seconds if seconds else 0.0,
+                     'ttft_seconds': sum(request.stats['ttft_seconds'] for request in requests) / sessions,
+                     'mean_batch_size': stats['mean_batch_size'], 'peak_batch_size': stats['peak_batch_size'],
+                     'mean_queue_depth': stats['mean_queue_depth'], 'peak_queue_depth': stats['peak_queue_depth']})
+    return rows
@@ -0,0 +1,141 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+Message = Dict[str, str]
+# Approximate template tokens around each message (role markers, end-of-turn)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class HistoryWindow:
+    """
+    Conversation history kept within a token budget.
+
+    The prompt is the system prompt, a running summary of older turns and the
+    recent messages verbatim. Each message's token count is computed once and
+    memoized by its content, so the total is updated without re-tokenizing
+    the conversation, and edits to messages just count the edited text. Once
+    the total passes token_budget, the oldest turns are taken out of the window
+    until it is back under low_water * token_budget (so this happens every few
+    turns, not every turn), always keeping keep_recent_messages. Removed turns
+    are folded into the summary by summarize(previous_summary, messages) on a
+    background thread, so no turn waits for it; until it finishes, the prompt
+    uses the previous summary. A token_budget of None keeps every message.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int],
+                 summarize: Optional[Callable[[str, List[Message]], str]] = None,
+                 token_budget: Optional[int] = 4096, low_water: float = 0.75, keep_recent_messages: int = 4,
+                 system_prompt: Optional[str] = None, max_memoized: int = 4096):
+        self.count_tokens = count_tokens
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.low_water = low_water
+        self.keep_recent_messages = keep_recent_messages
+        self.system_prompt = system_prompt
+        self.max_memoized = max_memoized
+        self.messages: List[Message] = []
+        self.summary = ""
+        self.summarized_messages = 0 # Messages folded into the summary so far
+        self._token_counts: 'OrderedDict[str, int]' = OrderedDict() # Content -> tokens, overhead included
+        self._pending: List[Message] = [] # Taken out of the window, not yet in the summary
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def message_tokens(self, message: Message) -> int:
+        key = message["content"]
+        count = self._token_counts.get(key)
+        if count is None:
+            count = self.count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+            self._token_counts[key] = count
+            if len(self._token_counts) > self.max_memoized:
+                self._token_counts.popitem(last=False)
+        else:
+            self._token_counts.move_to_end(key)
+        return count
+
+    def prefix_messages(self) -> List[Message]:
+        """System message with the system prompt and the summary of older turns (empty if neither)."""
+        with self._lock:
+            summary = self.summary
+        parts = [part for part in (self.system_prompt,
+                                   f"Summary of the earlier conversation: {summary}" if summary else "") if part]
+        return [{"role": "system", "content": "\n\n".join(parts)}] if parts else []
+
+    def prompt_messages(self, user_input: Optional[str] = None) -> List[Message]:
+        messages = self.prefix_messages() + self.messages
+        if user_input is not None:
+            messages = messages + [{"role": "user", "content": user_input}]
+        return messages
+
+    def total_tokens(self) -> int:
+        """Tokens of the prompt before the new user message: prefix plus verbatim messages."""
+        return sum(self.message_tokens(message) for message in self.prefix_messages() + self.messages)
+
+    def append(self, message: Message, tokens: Optional[int] = None):
+        """Adds a message; tokens, if already known, saves counting it. Call enforce_budget afterwards."""
+        if tokens is not None:
+            self._token_counts[message["content"]] = tokens + MESSAGE_OVERHEAD_TOKENS
+        self.messages.append(message)
+
+    def enforce_budget(self):
+        if self.token_budget is None:
+            return
+        total = self.total_tokens()
+        if total <= self.token_budget:
+            return
+        target = self.low_water * self.token_budget
+        cut = 0
+        while total > target and len(self.messages) - cut > self.keep_recent_messages:
+            total -= self.message_tokens(self.messages[cut])
+            cut += 1
+        # Never start the window with an assistant reply: fold it together with its question
+        while cut < len(self.messages) - self.keep_recent_messages and self.messages[cut]["role"] != "user":
+            cut += 1
+        if not cut:
+            return
+        folded, self.messages = self.messages[:cut], self.messages[cut:]
+        with self._lock:
+            self._pending.extend(folded)
+            if self.summarize is None:
+                self.summarized_messages += len(self._pending)
+                self._pending = []
+            elif self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._summarize_pending, name="history-summary", daemon=True)
+                self._worker.start()
+
+    def _summarize_pending(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._worker = None
+                    return
+                batch, summary = list(self._pending), self.summary
+            try:
+                new_summary = self.summarize(summary, batch).strip()
+            except Exception as e:
+                print(f"Warning: could not summarize older conversation turns: {e}")
+                new_summary = summary
+            with self._lock:
+                self.summary = new_summary
+                self.summarized_messages += len(batch)
+                del self._pending[:len(batch)]
+
+    def wait(self, timeout: Optional[float] = None):
+        """Blocks until background summarization has caught up."""
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+    def clear(self):
+        self.wait()
+        self.messages = []
+        with self._lock:
+            self.summary = ""
+            self.summarized_messages = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            pending = len(self._pending)
+        return {'history_tokens': self.total_tokens(), 'window_messages': len(self.messages),
+                'summarized_messages': self.summarized_messages, 'pending_summary_messages': pending}
@@ -1,46 +1,148 @@
 import json
 import os
 from typing import Dict, Optional
+from question_ann_index import QuestionANNIndex
+from question_normalizer import normalize_question
+
 
 class KnowledgeBaseManager:
-    """Manages loading and saving the knowledge base from a JSON file."""
-   
-    def __init__(self, file_path: str = "knowledge_base.json"):
+    """
+    Manages the knowledge base: a JSON snapshot plus an append-only log.
+
+    Each insert appends one JSON line to the log and fsyncs it, so its cost does
+    not depend on the size of the knowledge base. Every compact_every changes the
+    log is folded into a new snapshot, written to a temporary file and swapped in
+    with os.replace. Log records carry a sequence number and the snapshot records
+    the last one it contains, so records replayed after a crash between the swap
+    and the log truncation are skipped, and a torn last line is dropped. Existing
+    knowledge_base.json files (without a sequence number) load as snapshots.
+    """
+
+    def __init__(self, file_path: str = "knowledge_base.json", compact_every: int = 1000):
         self.file_path = os.path.join(os.path.dirname(__file__), file_path)
+        self.log_path = os.path.splitext(self.file_path)[0] + ".log"
+        self.compact_every = compact_every
+        self.sequence = 0 # Number of the last change applied
+        self._logged_changes = 0 # Changes in the log that are not in the snapshot yet
+        self._question_ids: Dict[str, int] = {} # normalize_question(question) -> position in "questions"
         self.knowledge_base = self.load_knowledge_base()
+        self.question_index: Optional[QuestionANNIndex] = None # Built on the first semantic lookup
 
     def load_knowledge_base(self) -> Dict:
-        """Load the knowledge base from a JSON file."""
+        """Load the knowledge base snapshot and replay the changes logged since it."""
         try:
             with open(self.file_path, 'r') as file:
-                return json.load(file)
+                knowledge_base = json.load(file)
         except (FileNotFoundError, json.JSONDecodeError) as e:
             print(f"Error loading knowledge base: {e}")
-            return {"questions": []}
+            knowledge_base = {"questions": []}
+        self.sequence = knowledge_base.pop("sequence", 0)
+        self.knowledge_base = knowledge_base
+        self._reindex()
+        self._replay_log()
+        return self.knowledge_base
+
+    def _reindex(self):
+        self._question_ids = {}
+        for i, q in enumerate(self.knowledge_base["questions"]):
+            self._question_ids.setdefault(normalize_question(q["question"]), i)
+
+    def _apply(self, record: Dict):
+        if record["op"] == "add":
+            questions = self.knowledge_base["questions"]
+            questions.append({"question": record["question"], "answer": record["answer"]})
+            self._question_ids.setdefault(normalize_question(record["question"]), len(questions) - 1)
+        elif record["op"] == "reset":
+            self.knowledge_base = {"questions": []}
+            self._question_ids = {}
+        self.sequence = record["seq"]
+
+    def _replay_log(self):
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'r+b') as log:
+            offset = 0
+            for line in log:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise json.JSONDecodeError("missing newline", line.decode('utf-8', 'replace'), len(line))
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn write from a crash can only be the last line; drop it
+                    print(f"Warning: discarding an incomplete record at the end of {self.log_path}")
+                    log.truncate(offset)
+                    break
+                offset += len(line)
+                if record["seq"] > self.sequence:
+                    self._apply(record)
+                    self._logged_changes += 1
+
+    def _append_log(self, record: Dict):
+        """Durably logs one change, applies it, and compacts once enough changes have piled up."""
+        record["seq"] = self.sequence + 1
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+        try:
+            with open(self.log_path, 'ab') as log:
+                log.write(line)
+                log.flush()
+                os.fsync(log.fileno())
+        except IOError as e:
+            raise IOError(f"Failed to save knowledge base: {e}")
+        self._apply(record)
+        self._logged_changes += 1
+        if self._logged_changes >= self.compact_every:
+            self.save_knowledge_base()
 
     def save_knowledge_base(self):
-        """Save the knowledge base to a JSON file."""
+        """Compact: atomically write the whole knowledge base as the new snapshot and empty the log."""
+        tmp_path = self.file_path + ".tmp"
         try:
-            with open(self.file_path, 'w') as file:
-                json.dump(self.knowledge_base, file, indent=2)
+            with open(tmp_path, 'w') as file:
+                json.dump({"sequence": self.sequence, **self.knowledge_base}, file, indent=2)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.file_path)
+            if os.path.exists(self.log_path):
+                with open(self.log_path, 'r+b') as log:
+                    log.truncate(0)
+            self._logged_changes = 0
         except IOError as e:
             raise IOError(f"Failed to save knowledge base: {e}")
 
-    def get_answer_for_question(self, question: str) -> tuple[Optional[str], Optional[str]]:
-        """Retrieve an answer for a given question from the knowledge base."""
-        for q in self.knowledge_base["questions"]:
-            if q["question"].lower() == question.lower():
-                return q["answer"], q["question"]
+    def get_question_index(self, nlp_processor) -> QuestionANNIndex:
+        """Returns the ANN index over the stored questions, loading or building it on first use."""
+        if self.question_index is None:
+            questions = [q["question"] for q in self.knowledge_base["questions"]]
+            self.question_index = QuestionANNIndex.load_or_build(
+                os.path.splitext(self.file_path)[0] + "_questions", questions, nlp_processor)
+        return self.question_index
+
+    def get_answer_for_question(self, question: str, nlp_processor=None,
+                                threshold: float = 0.85) -> tuple[Optional[str], Optional[str]]:
+        """
+        Retrieve an answer for a given question from the knowledge base. If no stored
+        question matches exactly and an NLPProcessor is given, the most similar stored
+        question above threshold is used.
+        """
+        question_id = self._question_ids.get(normalize_question(question))
+        if question_id is None and nlp_processor is not None:
+            matches = self.get_question_index(nlp_processor).search(question, k=1, threshold=threshold)
+            question_id = matches[0][0] if matches else None
+        if question_id is not None:
+            q = self.knowledge_base["questions"][question_id]
+            return q["answer"], q["question"]
         return None, None
 
     def add_Youtube(self, question: str, answer: str):
         """Add a new question-answer pair to the knowledge base."""
         if not question.strip() or not answer.strip():
             raise ValueError("Question and answer cannot be empty")
-        self.knowledge_base["questions"].append({"question": question, "answer": answer})
-        self.save_knowledge_base()
+        self._append_log({"op": "add", "question": question, "answer": answer})
+        if self.question_index is not None:
+            self.question_index.add([question])
 
     def reset_knowledge_base(self):
         """Reset the knowledge base to an empty state."""
-        self.knowledge_base = {"questions": []}
-        self.save_knowledge_base()
\ No newline at end of file
+        self._apply({"op": "reset", "seq": self.sequence + 1})
+        self.save_knowledge_base()
+        self.question_index = None # Rebuilt (empty) on the next semantic lookup
@@ -1,7 +1,9 @@
 import argparse
 import asyncio
 import os
+import signal
 import sys
+import threading
 
 # Add current dir for imports (adjust if needed)
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -9,10 +11,35 @@ if script_dir not in sys.path:
     sys.path.insert(0, script_dir)
 
 # Import QwenChatbot for the chat command
-from qwen_chatbot import QwenChatbot
+from qwen_chatbot import QwenChatbot, benchmark_conversation, benchmark_precisions
+from model_precision import PRECISIONS
 
 
 from chat_history_manager import ChatHistoryManager
+from bulk_drug_query import BulkDrugQueryRunner, BULK_OPERATIONS
+from embedding_backend import benchmark_embedding_backends
+from model_registry import model_registry
+
+async def stream_reply(qwen_chatbot_instance: QwenChatbot, user_input: str) -> str:
+    """
+    Prints the reply as it is generated. Ctrl+C stops the reply (not the chat)
+    after the current token. Ends with time-to-first-token and tokens/sec.
+    """
+    cancel_event = threading.Event()
+    previous_handler = signal.signal(signal.SIGINT, lambda signum, frame: cancel_event.set())
+    chunks = []
+    print("Bot: ", end="", flush=True)
+    try:
+        async for text in qwen_chatbot_instance.stream_response(user_input, cancel_event=cancel_event):
+            print(text, end="", flush=True)
+            chunks.append(text)
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+    stats = qwen_chatbot_instance.last_stats
+    loaded = f"model loaded in {stats['load_seconds']:.1f}s, " if stats['load_seconds'] >= 0.1 else ""
+    print(f"\n[{loaded}{stats['new_tokens']} tokens, first token after {stats['ttft_seconds']:.2f}s, "
+          f"{stats['tokens_per_second']:.1f} tokens/sec{', interrupted' if stats['cancelled'] else ''}]")
+    return "".join(chunks)
 
 def main():
     parser = argparse.ArgumentParser(description="Run the AI Chatbot with different commands.")
@@ -20,8 +47,11 @@ def main():
         "command",
         choices=[
             "chat", "history", "clear_history", "predict_rent", "solve_math",
-            "get_drug_info", "get_side_effects", "get_semantic_side_effects",
-            "get_related_drugs", "classify_drug", "translate_to_english",
+            "get_drug_info", "get_side_effects", "get_semantic_side_effects", "find_drugs_by_symptom",
+            "get_drugs_causing",
+            "get_related_drugs", "get_relation_path", "get_common_related_drugs", "classify_drug",
+            "train_drug_classifier", "bulk_drug_query", "benchmark_embeddings", "build_medicine_index",
+            "benchmark_medicine_retrieval", "benchmark_chat", "benchmark_precision", "benchmark_engine", "translate_to_english",
             "translate_from_english", "generate_bangla", "generate_hindi"
         ],
         help="Command to execute."
@@ -34,8 +64,37 @@ def main():
     parser.add_argument("--rating", type=float, help="Rating for rent prediction.")
     parser.add_argument("--target_lang", type=str, help="Target language for translation (e.g., 'bn' for Bengali, 'hi' for Hindi).")
     parser.add_argument("--symptom", type=str, help="Symptom for semantic side effects search.")
+    parser.add_argument("--hops", type=int, default=1, help="How many relation hops 'get_related_drugs' should follow.")
+    parser.add_argument("--top_k", type=int, help="Number of best matches to return for semantic side effects searches.")
+    parser.add_argument("--input", type=str, help="File of drug names (or 'drug<TAB>symptom' lines) for 'bulk_drug_query'; '-' or omitted reads stdin. "
+                                                  "For 'benchmark_embeddings', a file of sentences (one per line).")
+    parser.add_argument("--output", type=str, help="JSONL file for 'bulk_drug_query' results (default: stdout).")
+    parser.add_argument("--index_type", type=str, default="flat",
+                        help="Comma-separated index types for 'build_medicine_index' (flat, ivf_flat, ivf_pq, hnsw); the first one is used by the retriever.")
+    parser.add_argument("--index_params", type=str, help="Index parameters for 'build_medicine_index', e.g. 'nlist=1024,nprobe=32,ivf_pq.m=16,hnsw.m=32'; "
+                                                         "a plain key applies to every index type that takes it.")
+    parser.add_argument("--operations", type=str, help=f"Comma-separated operations for 'bulk_drug_query' (default: {','.join(BULK_OPERATIONS)}).")
+    parser.add_argument("--token_budget", type=int, default=4096,
+                        help="Tokens of conversation history 'chat' keeps in the prompt; older turns are summarized (0 keeps everything).")
+    parser.add_argument("--precision", type=str,
+                        help=f"Qwen weight precision for 'chat' ({', '.join(PRECISIONS)}; default float32), "
+                             "or a comma-separated list for 'benchmark_precision' (default: all).")
+    parser.add_argument("--sessions", type=str, default="1,2,4,8,16",
+                        help="Comma-separated counts of concurrent sessions for 'benchmark_engine'.")
+    parser.add_argument("--max_batch_size", type=int, default=8, help="Sequences decoded together by 'benchmark_engine'.")
+    parser.add_argument("--turns", type=int, default=30, help="Conversation length for 'benchmark_chat'.")
+    parser.add_argument("--model_memory_mb", type=float,
+                        help="Memory budget for loaded models; least recently used models are evicted beyond it (default: $CHATBOT_MODEL_MEMORY_MB or unlimited).")
+    parser.add_argument("--model_report", action="store_true", help="Print load time and memory of every model loaded by the command.")
 
     args = parser.parse_args()
+    if args.model_memory_mb is not None:
+        model_registry.memory_budget = int(args.model_memory_mb * 2**20)
+
+    # Bulk mode streams JSONL results on stdout, so all status messages go to stderr instead
+    results_stream = sys.stdout
+    if args.command == "bulk_drug_query" and not args.output:
+        sys.stdout = sys.stderr
 
     # Initialize the original Chatbot instance if available for non-chat commands
     try:
@@ -58,7 +117,7 @@ def main():
 
             if args.command == "chat":
                 print("Initializing Qwen-powered interactive chat mode. Please wait for model loading...")
-                qwen_chatbot_instance = QwenChatbot()
+                qwen_chatbot_instance = QwenChatbot(token_budget=args.token_budget or None, precision=args.precision or "float32")
 
                 print("Entering interactive chat mode. Type 'exit' to leave.")
                 while True:
@@ -71,9 +130,9 @@ def main():
                     if saved_answer:
                         print(f"Bot (from history): {saved_answer}")
                     else:
-                        response = await asyncio.to_thread(qwen_chatbot_instance.generate_response, user_input)
-                        print(f"Bot: {response}")
-                        history_manager.save_qa(user_input, response)
+                        response = await stream_reply(qwen_chatbot_instance, user_input)
+                        if response and not qwen_chatbot_instance.last_stats.get("cancelled"):
+                            history_manager.save_qa(user_input, response)
 
             elif args.command == "history":
                 history_manager.display_history()
@@ -129,20 +188,62 @@ def main():
                 elif not args.query or not args.symptom:
                     print("Error: For 'get_semantic_side_effects', --query (drug name) and --symptom are required.")
                 else:
-                    response = chatbot.get_semantic_side_effects(args.query, args.symptom)
+                    response = chatbot.get_semantic_side_effects(args.query, args.symptom, args.top_k)
                     print(f"Bot: {response}")
                     history_manager.add_interaction(f"Get Semantic Side Effects: Drug={args.query}, Symptom={args.symptom}", response)
 
+            elif args.command == "find_drugs_by_symptom":
+                if not chatbot:
+                    print("Error: 'Chatbot' instance not available for this command.")
+                elif not args.symptom:
+                    print("Error: For 'find_drugs_by_symptom', --symptom is required.")
+                else:
+                    response = chatbot.find_drugs_by_symptom(args.symptom, args.top_k or 10)
+                    print(f"Bot: {response}")
+                    history_manager.add_interaction(f"Find Drugs By Symptom: {args.symptom}", response)
+
+            elif args.command == "get_drugs_causing":
+                if not chatbot:
+                    print("Error: 'Chatbot' instance not available for this command.")
+                elif not args.query:
+                    print("Error: For 'get_drugs_causing', --query (e.g. 'drowsiness but not nausea') is required.")
+                else:
+                    response = chatbot.get_drugs_causing(args.query)
+                    print(f"Bot: {response}")
+                    history_manager.add_interaction(f"Get Drugs Causing: {args.query}", response)
+
             elif args.command == "get_related_drugs":
                 if not chatbot:
                     print("Error: 'Chatbot' instance not available for this command.")
                 elif not args.query:
                     print("Error: For 'get_related_drugs', --query (the drug name) is required.")
                 else:
-                    response = chatbot.get_related_drugs(args.query)
+                    response = chatbot.get_related_drugs(args.query, args.hops)
                     print(f"Bot: {response}")
                     history_manager.add_interaction(f"Get Related Drugs: {args.query}", response)
 
+            elif args.command == "get_relation_path":
+                drug_names = [name.strip() for name in (args.query or "").split(",") if name.strip()]
+                if not chatbot:
+                    print("Error: 'Chatbot' instance not available for this command.")
+                elif len(drug_names) != 2:
+                    print("Error: For 'get_relation_path', --query must name two drugs separated by a comma.")
+                else:
+                    response = chatbot.get_relation_path(drug_names[0], drug_names[1])
+                    print(f"Bot: {response}")
+                    history_manager.add_interaction(f"Get Relation Path: {args.query}", response)
+
+            elif args.command == "get_common_related_drugs":
+                drug_names = [name.strip() for name in (args.query or "").split(",") if name.strip()]
+                if not chatbot:
+                    print("Error: 'Chatbot' instance not available for this command.")
+                elif not drug_names:
+                    print("Error: For 'get_common_related_drugs', --query (comma-separated drug names) is required.")
+                else:
+                    response = chatbot.get_common_related_drugs(drug_names)
+                    print(f"Bot: {response}")
+                    history_manager.add_interaction(f"Get Common Related Drugs: {args.query}", response)
+
             elif args.command == "classify_drug":
                 if not chatbot:
                     print("Error: 'Chatbot' instance not available for this command.")
@@ -153,6 +254,107 @@ def main():
                     print(f"Bot: {response}")
                     history_manager.add_interaction(f"Classify Drug: {args.query}", response)
 
+            elif args.command == "train_drug_classifier":
+                if not chatbot:
+                    print("Error: 'Chatbot' instance not available for this command.")
+                else:
+                    response = chatbot.train_drug_classifier()
+                    print(f"Bot: {response}")
+
+            elif args.command == "bulk_drug_query":
+                if not chatbot:
+                    print("Error: 'Chatbot' instance not available for this command.")
+                else:
+                    operations = [op.strip() for op in args.operations.split(",") if op.strip()] if args.operations else BULK_OPERATIONS
+                    runner = BulkDrugQueryRunner(chatbot, operations, hops=args.hops, top_k=args.top_k)
+                    input_file = open(args.input, encoding="utf-8") if args.input and args.input != "-" else sys.stdin
+                    output_file = open(args.output, "w", encoding="utf-8") if args.output else results_stream
+                    try:
+                        stats = runner.run(input_file, output_file)
+                    finally:
+                        if input_file is not sys.stdin:
+                            input_file.close()
+                        if output_file is not results_stream:
+                            output_file.close()
+                    print(f"Bot: Answered {stats['drugs']} drugs ({stats['answers']} answers, {stats['errors']} errors) "
+                          f"in {stats['seconds']:.2f}s: {stats['drugs_per_second']:.1f} drugs/sec, "
+                          f"{stats['answers_per_second']:.1f} answers/sec.")
+                    print(f"Bot: {chatbot.nlp_processor.cache.report()}")
+
+            elif args.command == "benchmark_embeddings":
+                if args.input:
+                    with open(args.input, encoding="utf-8") as file:
+                        sentences = [line.strip() for line in file if line.strip()]
+                elif chatbot:
+                    sentences = [q["question"] for q in chatbot.train_data_manager.train_data]
+                    sentences += [q["question"] for q in chatbot.knowledge_base_manager.knowledge_base.get("questions", [])]
+                else:
+                    sentences = []
+                if not sentences:
+                    print("Error: For 'benchmark_embeddings', --input (a file of sentences) is required when no train or knowledge base questions are available.")
+                else:
+                    for result in benchmark_embedding_backends(sentences):
+                        line = f"{result['backend']}: {result['sentences_per_second']:.1f} sentences/sec"
+                        if "mean_cosine" in result:
+                            line += (f", cosine vs float32 mean {result['mean_cosine']:.4f} / min {result['min_cosine']:.4f}, "
+                                     f"nearest-neighbour agreement {result['neighbour_agreement']:.1%}")
+                        print(f"Bot: {line}")
+
+            elif args.command == "build_medicine_index":
+                if not args.input:
+                    print("Error: For 'build_medicine_index', --input (the medicine CSV) is required.")
+                else:
+                    from medicine_index_builder import MedicineIndexBuilder, index_specs, parse_index_params
+                    index_types = [index_type.strip() for index_type in args.index_type.split(",") if index_type.strip()]
+                    specs = index_specs(index_types, parse_index_params(args.index_params))
+                    reports = MedicineIndexBuilder().build(args.input, specs, k=args.top_k or 10)
+                    for report in reports:
+                        recall = next(value for key, value in report.items() if key.startswith("recall@"))
+                        print(f"Bot: {report['index_type']} {report['params']}: built in {report['build_seconds']:.1f}s "
+                              f"(encoding {report['encode_seconds']:.1f}s), {report['index_bytes'] / 2**20:.1f} MiB, "
+                              f"recall@{args.top_k or 10} {recall:.3f}, latency p50 {report['latency_ms_p50']:.2f} ms / "
+                              f"p95 {report['latency_ms_p95']:.2f} ms -> {report['index_path']}")
+
+            elif args.command == "benchmark_medicine_retrieval":
+                from medicine_retriever import MedicineRetriever, benchmark_retrieval_modes
+                top_k = args.top_k or 5
+                for result in benchmark_retrieval_modes(MedicineRetriever(), top_k=top_k):
+                    hit_rates = ", ".join(f"{key} {value:.1%}" for key, value in result.items() if key.startswith("hit@"))
+                    print(f"Bot: {result['mode']}: p50 {result['latency_ms_p50']:.2f} ms / p95 {result['latency_ms_p95']:.2f} ms, "
+                          f"lexical fast path {result['lexical_fast_path']:.0%}, {hit_rates}")
+
+            elif args.command == "benchmark_chat":
+                rows = benchmark_conversation(turns=args.turns, token_budget=args.token_budget or None)
+                for reuse in (False, True):
+                    label = "KV cache reused across turns" if reuse else "full prefill every turn"
+                    turns = [row for row in rows if row["reuse_kv_cache"] == reuse]
+                    print(f"Bot: {label}:")
+                    for row in turns:
+                        print(f"  turn {row['turn']:>2}: {row['prompt_tokens']:>5} prompt tokens, {row['prefill_tokens']:>5} prefilled, "
+                              f"{row['history_tokens']:>5} history tokens, KV cache {row.get('kv_cache_tokens', 0):>5} tokens, "
+                              f"first token {row['ttft_seconds']:.2f}s, turn {row['seconds']:.2f}s")
+                    first, last = turns[0], turns[-1]
+                    print(f"  first token: turn 1 {first['ttft_seconds']:.2f}s -> turn {last['turn']} {last['ttft_seconds']:.2f}s")
+
+            elif args.command == "benchmark_precision":
+                precisions = [p.strip() for p in args.precision.split(",") if p.strip()] if args.precision else PRECISIONS
+                for row in benchmark_precisions(precisions=precisions):
+                    agreement = (f"{row['token_agreement']:.1%} token agreement, {row['exact_match']:.0%} identical replies"
+                                 if row["token_agreement"] is not None else "no float32 reference")
+                    print(f"Bot: {row['precision']}: loaded in {row['load_seconds']:.1f}s"
+                          f"{' (cached)' if row['cached'] else ''}, RSS {row['rss_bytes'] / 2**20:.0f} MiB, "
+                          f"{row['tokens_per_second']:.1f} tokens/sec, {agreement}")
+
+            elif args.command == "benchmark_engine":
+                from generation_engine import benchmark_engine
+                session_counts = [int(count) for count in args.sessions.split(",") if count.strip()]
+                for row in benchmark_engine(session_counts=session_counts, precision=args.precision or "float32",
+                                            max_batch_size=args.max_batch_size):
+                    print(f"Bot: {row['sessions']:>3} sessions: {row['generated_tokens']} tokens in {row['seconds']:.1f}s, "
+                          f"{row['tokens_per_second']:.1f} tokens/sec, first token {row['ttft_seconds']:.2f}s, "
+                          f"batch size mean {row['mean_batch_size']:.1f} / peak {row['peak_batch_size']}, "
+                          f"queue depth mean {row['mean_queue_depth']:.1f} / peak {row['peak_queue_depth']}")
+
             elif args.command == "translate_to_english":
                 if not chatbot:
                     print("Error: 'Chatbot' instance not available for this command.")
@@ -199,6 +401,8 @@ def main():
             print(f"An error occurred: {e}")
             import traceback
             traceback.print_exc()
+        if args.model_report:
+            print(model_registry.report())
 
     asyncio.run(run_command())
 
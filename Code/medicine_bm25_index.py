@@ -0,0 +1,148 @@
+import os
+import re
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+
+from side_effect_inverted_index import normalize_terms
+
+# Column -> weight of its term frequencies: a hit in the name counts more than a mention in the uses
+FIELD_WEIGHTS = {'Medicine Name': 3.0, 'Composition': 2.0, 'Uses': 1.0}
+_DOSE_RE = re.compile(r"(\d+(?:\.\d+)?)\s+(mg|mcg|g|gm|ml|iu|%)(?![a-z])", re.IGNORECASE)
+
+
+def medicine_terms(text: str) -> List[str]:
+    """normalize_terms with doses kept as one token, so "500 mg" and "500mg" match."""
+    return normalize_terms(_DOSE_RE.sub(r"\1\2", text))
+
+
+def file_signature(path: str) -> str:
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def bm25_path(data_path: str) -> str:
+    return os.path.splitext(data_path)[0] + '_bm25.pkl'
+
+
+class MedicineBM25Index:
+    """
+    BM25 inverted index over the name, composition and uses of each medicine.
+
+    Term frequencies of the three fields are combined with FIELD_WEIGHTS
+    (BM25F-style) and the BM25 weight of every (term, medicine) posting is
+    computed at build time, so a query only gathers the postings of its terms
+    and sums them per medicine. Postings are stored as in
+    SideEffectInvertedIndex: term i owns rows[offsets[i]:offsets[i + 1]] and
+    the matching weights.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, fields: Dict[str, Sequence[str]], k1: float = 1.2, b: float = 0.75,
+                 source_signature: str = ''):
+        self.k1 = k1
+        self.b = b
+        self.source_signature = source_signature
+        self.num_docs = len(fields[next(iter(FIELD_WEIGHTS))])
+        self.term_ids: Dict[str, int] = {}
+        posting_terms, posting_rows, posting_tfs = array('i'), array('i'), array('f')
+        lengths = np.zeros(self.num_docs, dtype=np.float32)
+        for row in range(self.num_docs):
+            counts: Dict[int, float] = {}
+            for field, weight in FIELD_WEIGHTS.items():
+                for term in medicine_terms(str(fields[field][row])):
+                    term_id = self.term_ids.setdefault(term, len(self.term_ids))
+                    counts[term_id] = counts.get(term_id, 0.0) + weight
+                    lengths[row] += weight
+            for term_id, tf in counts.items():
+                posting_terms.append(term_id)
+                posting_rows.append(row)
+                posting_tfs.append(tf)
+
+        terms = np.frombuffer(posting_terms, dtype=np.int32)
+        order = np.argsort(terms, kind='stable') # Rows stay ascending within each term
+        self.rows = np.frombuffer(posting_rows, dtype=np.int32)[order]
+        tfs = np.frombuffer(posting_tfs, dtype=np.float32)[order]
+        doc_freqs = np.bincount(terms, minlength=len(self.term_ids))
+        self.offsets = np.zeros(len(self.term_ids) + 1, dtype=np.int64)
+        np.cumsum(doc_freqs, out=self.offsets[1:])
+        idf = np.log1p((self.num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        average_length = float(lengths.mean()) if self.num_docs else 1.0
+        norms = k1 * (1 - b + b * lengths / max(average_length, 1e-9))
+        self.weights = (np.repeat(idf, doc_freqs) * tfs * (k1 + 1) / (tfs + norms[self.rows])).astype(np.float32)
+
+    @classmethod
+    def from_frame(cls, df, source_signature: str = '', **kwargs) -> 'MedicineBM25Index':
+        return cls({field: df[field].fillna('').astype(str).tolist() for field in FIELD_WEIGHTS},
+                   source_signature=source_signature, **kwargs)
+
+    def save(self, path: str):
+        tmp_path = path + '.tmp'
+        joblib.dump({
+            'version': self.FORMAT_VERSION,
+            'source_signature': self.source_signature,
+            'k1': self.k1,
+            'b': self.b,
+            'num_docs': self.num_docs,
+            'term_ids': self.term_ids,
+            'offsets': self.offsets,
+            'rows': self.rows,
+            'weights': self.weights,
+        }, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, source_signature: str) -> Optional['MedicineBM25Index']:
+        """Loads a saved index built from the same medicine data; returns None if missing or stale."""
+        if not os.path.exists(path):
+            return None
+        try:
+            state = joblib.load(path)
+        except Exception as e:
+            print(f"Error loading medicine BM25 index from {path}: {e}")
+            return None
+        if not isinstance(state, dict) or state.get('version') != cls.FORMAT_VERSION \
+                or state.get('source_signature') != source_signature:
+            return None
+        index = cls.__new__(cls)
+        for key in ('source_signature', 'k1', 'b', 'num_docs', 'term_ids', 'offsets', 'rows', 'weights'):
+            setattr(index, key, state[key])
+        return index
+
+    @classmethod
+    def load_or_build(cls, path: str, df, source_signature: str) -> 'MedicineBM25Index':
+        index = cls.load(path, source_signature)
+        if index is not None:
+            return index
+        index = cls.from_frame(df, source_signature)
+        try:
+            index.save(path)
+            print(f"Medicine BM25 index ({len(index.term_ids)} terms) saved to '{path}'")
+        except Exception as e:
+            print(f"Error saving medicine BM25 index to '{path}': {e}")
+        return index
+
+    def search(self, query: str, k: int = 10) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (rows, BM25 scores, coverage) of the k best medicines, best first.
+        coverage is the fraction of the query's distinct terms that a medicine
+        contains; terms missing from the vocabulary count as not covered.
+        """
+        terms = list(dict.fromkeys(medicine_terms(query)))
+        term_ids = [self.term_ids[term] for term in terms if term in self.term_ids]
+        if not term_ids or k <= 0:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+        rows = np.concatenate([self.rows[self.offsets[t]:self.offsets[t + 1]] for t in term_ids])
+        weights = np.concatenate([self.weights[self.offsets[t]:self.offsets[t + 1]] for t in term_ids])
+        candidates, inverse = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights).astype(np.float32)
+        matched = np.bincount(inverse)
+        if len(candidates) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.lexsort((candidates[top], -scores[top]))]
+        return candidates[top], scores[top], (matched[top] / len(terms)).astype(np.float32)
@@ -0,0 +1,282 @@
+import json
+import os
+import tempfile
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+import pandas as pd
+from sentence_transformers import SentenceTransformer
+
+from medicine_bm25_index import MedicineBM25Index, bm25_path, file_signature
+from medicine_retriever import RESULT_COLUMNS
+from model_registry import model_registry
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+DEFAULT_INDEX_PARAMS = {
+    'flat': {},
+    'ivf_flat': {'nlist': 256, 'nprobe': 16},
+    'ivf_pq': {'nlist': 256, 'nprobe': 16, 'm': 16, 'nbits': 8},
+    'hnsw': {'m': 32, 'ef_construction': 80, 'ef_search': 64},
+}
+
+
+def manifest_path(index_path: str) -> str:
+    return os.path.splitext(index_path)[0] + '_manifest.json'
+
+
+def parse_index_params(text: Optional[str]) -> Dict[str, int]:
+    """'nlist=1024,hnsw.m=32' -> {'nlist': 1024, 'hnsw.m': 32}."""
+    params = {}
+    for item in (text or '').split(','):
+        if item.strip():
+            key, _, value = item.partition('=')
+            params[key.strip()] = int(value)
+    return params
+
+
+def index_specs(index_types: Sequence[str], params: Dict[str, int]) -> List[Tuple[str, Dict[str, int]]]:
+    """
+    Splits parsed --index_params over the requested index types. A key
+    prefixed with a type ('hnsw.m') applies to that type only; a plain key
+    applies to every requested type that takes it. Keys no requested type
+    takes, and a plain 'm' when both ivf_pq (subquantizers) and hnsw (graph
+    degree) are requested, are rejected.
+    """
+    unknown = [index_type for index_type in index_types if index_type not in INDEX_TYPES]
+    if unknown or not index_types:
+        raise ValueError(f"Unknown index type(s) {unknown} (choose from {', '.join(INDEX_TYPES)})")
+    specs = [(index_type, {}) for index_type in index_types]
+    for key, value in params.items():
+        prefix, _, name = key.rpartition('.')
+        if prefix and prefix not in index_types:
+            raise ValueError(f"Index parameter '{key}' is for '{prefix}', which is not being built")
+        targets = [spec for index_type, spec in specs
+                   if (not prefix or index_type == prefix) and name in DEFAULT_INDEX_PARAMS[index_type]]
+        if not targets:
+            raise ValueError(f"Index parameter '{key}' does not apply to {', '.join(index_types)}")
+        if not prefix and name == 'm' and {'ivf_pq', 'hnsw'} <= set(index_types):
+            raise ValueError("'m' means subquantizers for ivf_pq but graph degree for hnsw; use ivf_pq.m / hnsw.m")
+        for spec in targets:
+            spec[name] = value
+    return specs
+
+
+def medicine_text(chunk: pd.DataFrame) -> List[str]:
+    """Text that is embedded for each medicine: its name, composition and uses."""
+    return (chunk['Medicine Name'] + '. Composition: ' + chunk['Composition'] + '. Uses: ' + chunk['Uses']).tolist()
+
+
+def iter_medicine_chunks(csv_path: str, chunk_size: int = 4096) -> Iterator[pd.DataFrame]:
+    """Reads only the result columns of the medicine CSV, chunk by chunk."""
+    columns = set(RESULT_COLUMNS.values())
+    for chunk in pd.read_csv(csv_path, usecols=lambda column: column in columns, chunksize=chunk_size):
+        for column in columns - set(chunk.columns):
+            chunk[column] = ''
+        text_columns = ['Medicine Name', 'Composition', 'Uses', 'Side_effects', 'Manufacturer']
+        chunk[text_columns] = chunk[text_columns].fillna('').astype(str)
+        yield chunk.reset_index(drop=True)
+
+
+def new_index(index_type: str, dim: int, params: Dict[str, int]):
+    if index_type == 'flat':
+        return faiss.IndexFlatL2(dim)
+    if index_type == 'ivf_flat':
+        return faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, params['nlist'])
+    if index_type == 'ivf_pq':
+        return faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, params['nlist'], params['m'], params['nbits'])
+    if index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(dim, params['m'])
+        index.hnsw.efConstruction = params['ef_construction']
+        return index
+    raise ValueError(f"Unknown index type '{index_type}' (choose from {', '.join(INDEX_TYPES)})")
+
+
+def search_parameters(index_type: str, params: Dict[str, int]) -> str:
+    """faiss.ParameterSpace string for the query-time parameters of an index."""
+    if index_type in ('ivf_flat', 'ivf_pq'):
+        return f"nprobe={params['nprobe']}"
+    if index_type == 'hnsw':
+        return f"efSearch={params['ef_search']}"
+    return ''
+
+
+def apply_search_parameters(index, parameters: str):
+    if parameters:
+        faiss.ParameterSpace().set_index_parameters(index, parameters)
+
+
+class MedicineIndexBuilder:
+    """
+    Builds the FAISS index, the metadata pickle and the BM25 index that
+    MedicineRetriever loads.
+
+    The medicine CSV is streamed in chunks; each chunk is encoded and its
+    vectors are appended to a temporary float32 file, so only the metadata
+    columns and one chunk of vectors are held in memory. Indexes are then
+    trained on a sample and filled from a memory map of that file. Each built
+    index is evaluated against exact search over the same vectors (recall@k,
+    single-query latency) and described in a manifest next to it.
+    """
+
+    def __init__(self, model_name: str = 'all-MiniLM-L6-v2', chunk_size: int = 4096, batch_size: int = 128):
+        self.model_name = model_name
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+
+    @property
+    def model(self) -> SentenceTransformer:
+        return model_registry.get(self.model_name, lambda: SentenceTransformer(self.model_name), kind='sentence-transformer')
+
+    def encode_csv(self, csv_path: str, vectors_path: str) -> Tuple[pd.DataFrame, np.ndarray, float]:
+        """Streams and encodes the CSV; returns the metadata frame, memory-mapped vectors and seconds spent."""
+        start = time.perf_counter()
+        frames = []
+        num_rows, dim = 0, None
+        with open(vectors_path, 'wb') as file:
+            for chunk in iter_medicine_chunks(csv_path, self.chunk_size):
+                vectors = self.model.encode(medicine_text(chunk), batch_size=self.batch_size,
+                                            convert_to_numpy=True).astype(np.float32)
+                file.write(np.ascontiguousarray(vectors).tobytes())
+                frames.append(chunk)
+                num_rows += len(chunk)
+                dim = vectors.shape[1]
+                print(f"Encoded {num_rows} medicines...")
+        if not num_rows:
+            raise ValueError(f"No medicines found in '{csv_path}'")
+        df = pd.concat(frames, ignore_index=True)
+        vectors = np.memmap(vectors_path, dtype=np.float32, mode='r', shape=(num_rows, dim))
+        return df, vectors, time.perf_counter() - start
+
+    @staticmethod
+    def fit_params(index_type: str, params: Dict[str, int], num_rows: int, dim: int) -> Dict[str, int]:
+        """
+        Fills in defaults and shrinks the trained parts to what num_rows can
+        train: FAISS wants at least 39 points per k-means centroid, both for the
+        nlist coarse centroids and for the 2**nbits centroids of each PQ codebook.
+        """
+        params = {**DEFAULT_INDEX_PARAMS[index_type], **params}
+        if 'nlist' in params:
+            params['nlist'] = min(params['nlist'], max(1, num_rows // 39))
+        if index_type == 'ivf_pq':
+            if dim % params['m']:
+                raise ValueError(f"ivf_pq: m={params['m']} subquantizers must divide the embedding dimension {dim}")
+            nbits = max(1, min(params['nbits'], int(np.log2(max(num_rows // 39, 1)))))
+            if nbits != params['nbits']:
+                print(f"ivf_pq: {num_rows} vectors are too few to train 2^{params['nbits']} codes per "
+                      f"subquantizer; using nbits={nbits}.")
+                params['nbits'] = nbits
+        return params
+
+    @staticmethod
+    def build_index(index_type: str, vectors: np.ndarray, params: Dict[str, int], add_chunk: int = 65536):
+        num_rows, dim = vectors.shape
+        index = new_index(index_type, dim, params)
+        if not index.is_trained:
+            # Train on a sample; FAISS wants roughly 40-256 points per centroid
+            sample_size = min(num_rows, params['nlist'] * 256)
+            sample = np.random.default_rng(0).choice(num_rows, sample_size, replace=False)
+            index.train(np.ascontiguousarray(vectors[np.sort(sample)]))
+        for start in range(0, num_rows, add_chunk):
+            index.add(np.ascontiguousarray(vectors[start:start + add_chunk]))
+        apply_search_parameters(index, search_parameters(index_type, params))
+        return index
+
+    @staticmethod
+    def evaluate(index, exact_ids: np.ndarray, queries: np.ndarray, k: int) -> Dict[str, float]:
+        """recall@k against exact search, single-query latency and batch throughput."""
+        start = time.perf_counter()
+        _, ids = index.search(queries, k)
+        batch_seconds = time.perf_counter() - start
+        hits = [len(set(found[found >= 0]) & set(exact)) for found, exact in zip(ids, exact_ids)]
+        latencies = []
+        for query in queries[:200]:
+            start = time.perf_counter()
+            index.search(query[None, :], k)
+            latencies.append(time.perf_counter() - start)
+        return {
+            f'recall@{k}': float(np.mean(hits)) / k,
+            'latency_ms_p50': float(np.percentile(latencies, 50) * 1000),
+            'latency_ms_p95': float(np.percentile(latencies, 95) * 1000),
+            'batch_queries_per_second': len(queries) / max(batch_seconds, 1e-9),
+        }
+
+    def build(self, csv_path: str, index_specs: Sequence[Tuple[str, Dict[str, int]]],
+              index_path: str = 'medicine_faiss.index', data_path: str = 'medicine_data.pkl',
+              k: int = 10, num_queries: int = 1000) -> List[Dict]:
+        """
+        Encodes the CSV once and builds every (index type, params) spec. The first
+        spec becomes index_path; the others are written next to it as
+        <name>_<type>.index for comparison. Returns one report per index.
+        """
+        unknown = [index_type for index_type, _ in index_specs if index_type not in INDEX_TYPES]
+        if unknown or not index_specs:
+            raise ValueError(f"Unknown index type(s) {unknown} (choose from {', '.join(INDEX_TYPES)})")
+        for index_type, params in index_specs:
+            extra = set(params) - set(DEFAULT_INDEX_PARAMS[index_type])
+            if extra:
+                raise ValueError(f"Index type '{index_type}' does not take parameter(s) {sorted(extra)}")
+        fd, vectors_path = tempfile.mkstemp(suffix='.f32', dir=os.path.dirname(os.path.abspath(index_path)))
+        os.close(fd)
+        vectors = None
+        try:
+            df, vectors, encode_seconds = self.encode_csv(csv_path, vectors_path)
+            tmp_data_path = data_path + '.tmp'
+            df.to_pickle(tmp_data_path)
+            os.replace(tmp_data_path, data_path)
+            # The lexical side of hybrid retrieval, keyed to the data file it was built from
+            start = time.perf_counter()
+            bm25 = MedicineBM25Index.from_frame(df, file_signature(data_path))
+            bm25.save(bm25_path(data_path))
+            print(f"Built BM25 index ({len(bm25.term_ids)} terms) in {time.perf_counter() - start:.1f}s -> {bm25_path(data_path)}")
+            del bm25
+
+            num_rows, dim = vectors.shape
+            sample = np.sort(np.random.default_rng(1).choice(num_rows, min(num_queries, num_rows), replace=False))
+            queries = np.ascontiguousarray(vectors[sample])
+            k = min(k, num_rows)
+            exact = self.build_index('flat', vectors, {})
+            _, exact_ids = exact.search(queries, k)
+            del exact
+
+            reports = []
+            for position, (index_type, params) in enumerate(index_specs):
+                params = self.fit_params(index_type, params, num_rows, dim)
+                start = time.perf_counter()
+                index = self.build_index(index_type, vectors, params)
+                build_seconds = time.perf_counter() - start
+                path = index_path if position == 0 else f"{os.path.splitext(index_path)[0]}_{index_type}.index"
+                faiss.write_index(index, path + '.tmp')
+                os.replace(path + '.tmp', path)
+                report = {
+                    'index_type': index_type,
+                    'params': params,
+                    'index_path': path,
+                    'index_bytes': os.path.getsize(path),
+                    'encode_seconds': encode_seconds,
+                    'build_seconds': build_seconds,
+                    **self.evaluate(index, exact_ids, queries, k),
+                }
+                manifest = {
+                    'model_name': self.model_name,
+                    'dim': dim,
+                    'count': num_rows,
+                    'metric': 'l2',
+                    'text': 'Medicine Name. Composition: ... Uses: ...',
+                    'data_path': os.path.basename(data_path),
+                    'source': os.path.basename(csv_path),
+                    'search_parameters': search_parameters(index_type, params),
+                    **report,
+                    'index_path': os.path.basename(path),
+                }
+                with open(manifest_path(path) + '.tmp', 'w', encoding='utf-8') as file:
+                    json.dump(manifest, file, indent=2)
+                os.replace(manifest_path(path) + '.tmp', manifest_path(path))
+                reports.append(report)
+                del index
+            return reports
+        finally:
+            del vectors # Release the memory map before deleting its file
+            if os.path.exists(vectors_path):
+                os.remove(vectors_path)
@@ -1,33 +1,233 @@
+import json
+import os
+import time
 import faiss
 import numpy as np
 import pandas as pd
 from sentence_transformers import SentenceTransformer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from medicine_bm25_index import MedicineBM25Index, bm25_path, file_signature
+from model_registry import model_registry
+
+# Result field -> column of the medicine dataframe
+RESULT_COLUMNS = {
+    'Medicine Name': 'Medicine Name',
+    'Composition': 'Composition',
+    'Uses': 'Uses',
+    'Side Effects': 'Side_effects',
+    'Manufacturer': 'Manufacturer',
+    'Excellent Review %': 'Excellent Review %',
+    'Average Review %': 'Average Review %',
+    'Poor Review %': 'Poor Review %',
+}
+RETRIEVAL_MODES = ('dense', 'hybrid', 'lexical_first')
+FUSION_METHODS = ('rrf', 'weighted')
+
+
+def fuse_rankings(lexical_rows: np.ndarray, lexical_scores: np.ndarray, dense_rows: np.ndarray,
+                  dense_scores: np.ndarray, k: int, method: str = 'rrf', rrf_k: int = 60,
+                  dense_weight: float = 0.5) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Combines two best-first rankings into the k best (rows, fused scores).
+    'rrf' sums 1 / (rrf_k + rank) over the lists a row appears in; 'weighted'
+    min-max normalizes each list's scores and mixes them with dense_weight.
+    """
+    fused: Dict[int, float] = {}
+    for rows, scores, weight in ((lexical_rows, lexical_scores, 1 - dense_weight), (dense_rows, dense_scores, dense_weight)):
+        if method == 'rrf':
+            contributions = 1.0 / (rrf_k + np.arange(1, len(rows) + 1))
+        elif method == 'weighted':
+            spread = float(scores.max() - scores.min()) if len(scores) else 0.0
+            contributions = weight * ((scores - scores.min()) / spread if spread > 0 else np.ones(len(scores)))
+        else:
+            raise ValueError(f"fusion must be one of {FUSION_METHODS}, got '{method}'")
+        for row, contribution in zip(rows.tolist(), contributions.tolist()):
+            fused[row] = fused.get(row, 0.0) + contribution
+    best = sorted(fused.items(), key=lambda item: (-item[1], item[0]))[:k]
+    return (np.fromiter((row for row, _ in best), dtype=np.int64, count=len(best)),
+            np.fromiter((score for _, score in best), dtype=np.float32, count=len(best)))
+
+
+class RetrievalBatch:
+    """
+    Columnar results of MedicineRetriever.query_many.
+
+    Hits of all questions are stored back to back: the hits of question i are
+    positions offsets[i]:offsets[i + 1] of row_ids (dataframe rows), distances
+    (FAISS distances, NaN for hits the dense search did not return), scores
+    (the ranking score of the mode, higher is better) and every array in
+    columns. Questions with fewer than top_k hits simply have fewer positions;
+    FAISS's -1 padding is dropped. sources[i] says which path answered
+    question i: 'dense', 'hybrid' or 'lexical'.
+    """
+
+    def __init__(self, offsets: np.ndarray, row_ids: np.ndarray, distances: np.ndarray,
+                 columns: Dict[str, np.ndarray], scores: Optional[np.ndarray] = None,
+                 sources: Optional[List[str]] = None):
+        self.offsets = offsets
+        self.row_ids = row_ids
+        self.distances = distances
+        self.columns = columns
+        self.scores = -distances if scores is None else scores
+        self.sources = sources if sources is not None else ['dense'] * (len(offsets) - 1)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def rows(self, i: int) -> List[Dict]:
+        """Hits of question i as result dicts, best first."""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return [{field: values[j] for field, values in self.columns.items()} for j in range(start, end)]
+
+    def to_dicts(self) -> List[List[Dict]]:
+        return [self.rows(i) for i in range(len(self))]
+
 
 class MedicineRetriever:
-    def __init__(self, 
+    """
+    Answers medicine questions from the FAISS index and a BM25 index over
+    name, composition and uses (see medicine_bm25_index). Modes:
+    'dense' is FAISS search alone; 'hybrid' fuses the BM25 and FAISS rankings
+    (reciprocal rank or weighted); 'lexical_first' answers from BM25 alone when
+    its best hit contains every query term, skipping the encoder, and uses
+    'hybrid' for the remaining questions.
+    """
+
+    def __init__(self,
                  index_path='medicine_faiss.index',
                  data_path='medicine_data.pkl',
-                 model_name='all-MiniLM-L6-v2'):
+                 model_name='all-MiniLM-L6-v2',
+                 mode='lexical_first',
+                 fusion='rrf',
+                 candidate_depth=50):
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"mode must be one of {RETRIEVAL_MODES}, got '{mode}'")
+        if fusion not in FUSION_METHODS:
+            raise ValueError(f"fusion must be one of {FUSION_METHODS}, got '{fusion}'")
         print("Loading retrieval system...")
-        self.model = SentenceTransformer(model_name)
+        self.mode = mode
+        self.fusion = fusion
+        self.candidate_depth = candidate_depth # Hits taken from each ranking before fusing
+        self.manifest = {}
+        manifest_path = os.path.splitext(index_path)[0] + '_manifest.json'
+        if os.path.exists(manifest_path):
+            # Written by medicine_index_builder: names the encoder and the index's query-time parameters
+            with open(manifest_path, 'r', encoding='utf-8') as file:
+                self.manifest = json.load(file)
+            if self.manifest.get('model_name', model_name) != model_name:
+                print(f"Warning: {index_path} was built with '{self.manifest['model_name']}', not '{model_name}'.")
+        self.model_name = model_name
         self.index = faiss.read_index(index_path)
+        if self.manifest.get('search_parameters'):
+            faiss.ParameterSpace().set_index_parameters(self.index, self.manifest['search_parameters'])
         self.df = pd.read_pickle(data_path)
+        # Result columns as plain arrays, so hits are gathered with one take per column
+        self.columns = {field: self.df[column].to_numpy() for field, column in RESULT_COLUMNS.items()}
+        self.lexical_index: Optional[MedicineBM25Index] = None
+        try:
+            self.lexical_index = MedicineBM25Index.load_or_build(bm25_path(data_path), self.df, file_signature(data_path))
+        except Exception as e:
+            print(f"Warning: BM25 index unavailable, using dense retrieval only: {e}")
         print("Loaded index and data.")
 
-    def query(self, question, top_k=3):
-        q_emb = self.model.encode([question])
-        distances, indices = self.index.search(q_emb, top_k)
-        results = []
-        for idx in indices[0]:
-            row = self.df.iloc[idx]
-            results.append({
-                'Medicine Name': row['Medicine Name'],
-                'Composition': row['Composition'],
-                'Uses': row['Uses'],
-                'Side Effects': row['Side_effects'],
-                'Manufacturer': row['Manufacturer'],
-                'Excellent Review %': row['Excellent Review %'],
-                'Average Review %': row['Average Review %'],
-                'Poor Review %': row['Poor Review %']
-            })
-        return results
+    @property
+    def model(self) -> SentenceTransformer:
+        """The sentence encoder, loaded on first query and shared through the model registry."""
+        return model_registry.get(self.model_name, lambda: SentenceTransformer(self.model_name), kind='sentence-transformer')
+
+    def _dense_search(self, questions: List[str], k: int, batch_size: int) -> Tuple[np.ndarray, np.ndarray]:
+        q_emb = self.model.encode(questions, batch_size=batch_size, convert_to_numpy=True)
+        return self.index.search(np.ascontiguousarray(q_emb, dtype=np.float32), k)
+
+    def query_many(self, questions: Sequence[str], top_k=3, batch_size=64, mode: Optional[str] = None,
+                   fusion: Optional[str] = None) -> RetrievalBatch:
+        """
+        Answers all questions; questions that need the encoder are encoded in
+        batches and searched with a single index search.
+        """
+        questions = list(questions)
+        mode = mode or self.mode
+        fusion = fusion or self.fusion
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"mode must be one of {RETRIEVAL_MODES}, got '{mode}'")
+        if self.lexical_index is None:
+            mode = 'dense'
+        hits: List[Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]] = [None] * len(questions) # (rows, scores, distances)
+        sources = [mode if mode != 'lexical_first' else 'hybrid'] * len(questions)
+        depth = top_k if mode == 'dense' else max(top_k, self.candidate_depth)
+        lexical = []
+        if mode != 'dense':
+            lexical = [self.lexical_index.search(question, depth) for question in questions]
+        if mode == 'lexical_first':
+            for i, (rows, scores, coverage) in enumerate(lexical):
+                if len(rows) and coverage[0] >= 1.0: # Decisive: the best hit contains every query term
+                    hits[i] = (rows[:top_k], scores[:top_k], np.full(min(top_k, len(rows)), np.nan, dtype=np.float32))
+                    sources[i] = 'lexical'
+        pending = [i for i in range(len(questions)) if hits[i] is None]
+        if pending:
+            distances, indices = self._dense_search([questions[i] for i in pending], depth, batch_size)
+            for position, i in enumerate(pending):
+                found = indices[position] >= 0
+                dense_rows, dense_distances = indices[position][found], distances[position][found]
+                if mode == 'dense':
+                    hits[i] = (dense_rows, -dense_distances, dense_distances)
+                    continue
+                rows, scores = fuse_rankings(lexical[i][0], lexical[i][1], dense_rows, -dense_distances, top_k, fusion)
+                distance_of = dict(zip(dense_rows.tolist(), dense_distances.tolist()))
+                hits[i] = (rows, scores, np.array([distance_of.get(row, np.nan) for row in rows.tolist()], dtype=np.float32))
+
+        offsets = np.zeros(len(questions) + 1, dtype=np.int64)
+        np.cumsum([len(rows) for rows, _, _ in hits], out=offsets[1:])
+        if not questions:
+            row_ids, scores, distances = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+        else:
+            row_ids = np.concatenate([rows for rows, _, _ in hits]).astype(np.int64)
+            scores = np.concatenate([hit_scores for _, hit_scores, _ in hits]).astype(np.float32)
+            distances = np.concatenate([hit_distances for _, _, hit_distances in hits]).astype(np.float32)
+        columns = {field: values.take(row_ids) for field, values in self.columns.items()}
+        return RetrievalBatch(offsets, row_ids, distances, columns, scores, sources)
+
+    def query(self, question, top_k=3, mode: Optional[str] = None):
+        return self.query_many([question], top_k=top_k, mode=mode).rows(0)
+
+
+def benchmark_retrieval_modes(retriever: MedicineRetriever, num_queries: int = 200, top_k: int = 5,
+                              seed: int = 0) -> List[Dict]:
+    """
+    Per mode: single-question latency (p50/p95), the share of questions answered
+    by the lexical fast path, and hit@top_k for three query types generated from
+    the catalog. A 'name' query (the medicine name) hits if any result has that
+    name; a 'composition' query (the composition) or 'uses' query (the first
+    words of the uses) hits if any result has the same composition or uses.
+    """
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(retriever.df), min(num_queries, len(retriever.df)), replace=False)
+    queries = []
+    for query_type, column, make_query in (('name', 'Medicine Name', lambda text: text),
+                                           ('composition', 'Composition', lambda text: text),
+                                           ('uses', 'Uses', lambda text: ' '.join(text.split()[:8]))):
+        values = retriever.df[column].fillna('').astype(str).str.lower().to_numpy()
+        for row in sample:
+            if values[row]:
+                queries.append((query_type, make_query(str(retriever.df[column].iloc[row])), values, values[row]))
+    retriever.model # Load the encoder before timing
+
+    results = []
+    for mode in RETRIEVAL_MODES:
+        latencies, hits, lexical = [], {}, 0
+        for query_type, query, values, wanted in queries:
+            start = time.perf_counter()
+            batch = retriever.query_many([query], top_k=top_k, mode=mode)
+            latencies.append(time.perf_counter() - start)
+            lexical += batch.sources[0] == 'lexical'
+            hits.setdefault(query_type, []).append(bool(np.any(values[batch.row_ids] == wanted)))
+        results.append({
+            'mode': mode,
+            'queries': len(queries),
+            'latency_ms_p50': float(np.percentile(latencies, 50) * 1000) if latencies else 0.0,
+            'latency_ms_p95': float(np.percentile(latencies, 95) * 1000) if latencies else 0.0,
+            'lexical_fast_path': lexical / max(len(queries), 1),
+            **{f'hit@{top_k} {query_type}': float(np.mean(values)) for query_type, values in hits.items()},
+        })
+    return results
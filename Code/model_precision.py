@@ -0,0 +1,226 @@
+import json
+import os
+import re
+import shutil
+from typing import Optional
+
+import torch
+import torch.nn.functional as F
+from transformers import AutoConfig, AutoModelForCausalLM, GenerationConfig
+
+# float32: the checkpoint as is. bfloat16: every weight in bfloat16.
+# int8_dynamic: Linear layers quantized to int8 with activations quantized on the fly (torch dynamic quantization).
+# int8_weight / int4_weight: Linear weights stored as int8 / packed int4. int8 uses PyTorch's int8 x float
+# matmul kernel where available; otherwise (and always for int4) weights are dequantized to float32 when used.
+PRECISIONS = ('float32', 'bfloat16', 'int8_dynamic', 'int8_weight', 'int4_weight')
+INT4_GROUP_SIZE = 128
+CACHE_FORMAT_VERSION = 1
+_SAFE_NAME_RE = re.compile(r'[^A-Za-z0-9_.-]+')
+# Kept in full precision: quantizing the output projection costs the most agreement for the least memory
+_SKIPPED_LINEARS = ('lm_head',)
+
+
+class WeightOnlyLinear(torch.nn.Module):
+    """
+    Linear layer with int8 or int4 weights and float scales.
+
+    int8 weights have one scale per output row; int4 weights one scale per
+    group of group_size inputs and are packed two per byte, so they occupy a
+    quarter (int8) or an eighth (int4) of the float32 memory. int8 layers
+    multiply with torch._weight_int8pack_mm where PyTorch provides it. Without
+    that kernel, and always for int4, the forward pass dequantizes the whole
+    weight to float32 and then runs a float32 matmul. That is an extra pass
+    over the weight for every token, so decoding is slower than with float32
+    weights, not faster: these modes trade speed for memory
+    (benchmark_precisions measures tokens/sec).
+    """
+
+    _int8_matmul = getattr(torch, '_weight_int8pack_mm', None) # int8 weight x float input, per-row scales
+
+    def __init__(self, in_features: int, out_features: int, bits: int = 8, group_size: Optional[int] = None,
+                 bias: bool = True, dtype: torch.dtype = torch.float32):
+        super().__init__()
+        if bits not in (4, 8):
+            raise ValueError(f"bits must be 4 or 8, got {bits}")
+        group_size = group_size or in_features
+        if in_features % group_size:
+            group_size = in_features
+        self.in_features = in_features
+        self.out_features = out_features
+        self.bits = bits
+        self.group_size = group_size
+        packed_features = in_features if bits == 8 else (in_features + 1) // 2
+        self.register_buffer('qweight', torch.zeros(out_features, packed_features,
+                                                    dtype=torch.int8 if bits == 8 else torch.uint8))
+        self.register_buffer('scales', torch.ones(out_features, in_features // group_size, dtype=dtype))
+        self.bias = torch.nn.Parameter(torch.zeros(out_features, dtype=dtype), requires_grad=False) if bias else None
+
+    @classmethod
+    def from_linear(cls, linear: torch.nn.Linear, bits: int = 8, group_size: Optional[int] = None) -> 'WeightOnlyLinear':
+        layer = cls(linear.in_features, linear.out_features, bits, group_size, linear.bias is not None)
+        weight = linear.weight.detach().float()
+        groups = weight.reshape(layer.out_features, -1, layer.group_size)
+        qmax = 2 ** (bits - 1) - 1
+        scales = groups.abs().amax(dim=-1, keepdim=True).clamp(min=1e-8) / qmax
+        quantized = torch.round(groups / scales).clamp(-qmax - 1, qmax).to(torch.int8).reshape(weight.shape)
+        if bits == 4:
+            unsigned = (quantized + 8).to(torch.uint8)
+            if unsigned.shape[1] % 2:
+                unsigned = F.pad(unsigned, (0, 1))
+            layer.qweight = unsigned[:, 0::2] | (unsigned[:, 1::2] << 4)
+        else:
+            layer.qweight = quantized
+        layer.scales = scales.squeeze(-1).to(layer.scales.dtype)
+        if linear.bias is not None:
+            layer.bias.data.copy_(linear.bias.detach())
+        return layer
+
+    def dequantized_weight(self) -> torch.Tensor:
+        quantized = self.qweight
+        if self.bits == 4:
+            unpacked = torch.stack((quantized & 0x0F, quantized >> 4), dim=-1).reshape(self.out_features, -1)
+            quantized = unpacked[:, :self.in_features].to(torch.int8) - 8
+        groups = quantized.reshape(self.out_features, -1, self.group_size).to(self.scales.dtype)
+        return (groups * self.scales.unsqueeze(-1)).reshape(self.out_features, self.in_features)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        bias = None if self.bias is None else self.bias.to(x.dtype)
+        if self.bits == 8 and self.group_size == self.in_features and WeightOnlyLinear._int8_matmul is not None:
+            try:
+                out = WeightOnlyLinear._int8_matmul(x.reshape(-1, self.in_features).contiguous(), self.qweight,
+                                                    self.scales.reshape(-1).to(x.dtype))
+                out = out.reshape(*x.shape[:-1], self.out_features)
+                return out if bias is None else out + bias
+            except RuntimeError as e:
+                print(f"int8 matmul kernel unavailable ({e}); dequantizing int8 weights instead.")
+                WeightOnlyLinear._int8_matmul = None
+        return F.linear(x, self.dequantized_weight().to(x.dtype), bias)
+
+    def extra_repr(self) -> str:
+        return f"in_features={self.in_features}, out_features={self.out_features}, bits={self.bits}, group_size={self.group_size}"
+
+
+def _quantizable_linears(model):
+    return [name for name, module in model.named_modules()
+            if isinstance(module, torch.nn.Linear) and name.rsplit('.', 1)[-1] not in _SKIPPED_LINEARS]
+
+
+def convert_model(model, precision: str, quantize_weights: bool = True):
+    """
+    Converts a float32 model to precision in place (returning it).
+    quantize_weights=False only swaps in quantized layers of the right shape,
+    without reading the (possibly meta) float weights, for a state dict to be
+    loaded into.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision must be one of {', '.join(PRECISIONS)}, got '{precision}'")
+    if precision == 'bfloat16':
+        return model.to(torch.bfloat16)
+    if precision == 'int8_dynamic':
+        names = _quantizable_linears(model)
+        if quantize_weights:
+            return torch.quantization.quantize_dynamic(model, set(names), dtype=torch.qint8)
+        for name in names:
+            parent_name, _, child_name = name.rpartition('.')
+            parent = model.get_submodule(parent_name)
+            linear = getattr(parent, child_name)
+            setattr(parent, child_name, torch.ao.nn.quantized.dynamic.Linear(
+                linear.in_features, linear.out_features, bias_=linear.bias is not None, dtype=torch.qint8))
+        return model
+    if precision in ('int8_weight', 'int4_weight'):
+        bits, group_size = (8, None) if precision == 'int8_weight' else (4, INT4_GROUP_SIZE)
+        for name in _quantizable_linears(model):
+            parent_name, _, child_name = name.rpartition('.')
+            parent = model.get_submodule(parent_name)
+            linear = getattr(parent, child_name)
+            if quantize_weights:
+                layer = WeightOnlyLinear.from_linear(linear, bits, group_size)
+            else:
+                with torch.device('meta'): # Filled in by load_state_dict(assign=True)
+                    layer = WeightOnlyLinear(linear.in_features, linear.out_features, bits, group_size,
+                                             linear.bias is not None)
+            setattr(parent, child_name, layer)
+    return model
+
+
+def converted_model_path(model_name: str, precision: str, cache_dir: str = 'quantized_models') -> str:
+    return os.path.join(cache_dir, f"{_SAFE_NAME_RE.sub('_', model_name)}.{precision}")
+
+
+def _cache_matches(path: str, model_name: str, precision: str) -> bool:
+    try:
+        with open(os.path.join(path, 'precision.json')) as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return False
+    return meta == {'version': CACHE_FORMAT_VERSION, 'model_name': model_name, 'precision': precision,
+                    'int4_group_size': INT4_GROUP_SIZE}
+
+
+def load_causal_lm(model_name: str, precision: str = 'float32', cache_dir: Optional[str] = 'quantized_models'):
+    """
+    Loads a causal LM on CPU in the given precision.
+
+    The first load of a reduced precision converts the float32 checkpoint and
+    saves the result under cache_dir (bfloat16 as a regular checkpoint,
+    quantized modes as a state dict with the config); later loads read the
+    converted weights directly. cache_dir=None converts on every load.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision must be one of {', '.join(PRECISIONS)}, got '{precision}'")
+    if precision == 'float32':
+        return AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32, device_map={"": "cpu"})
+
+    path = converted_model_path(model_name, precision, cache_dir) if cache_dir else None
+    if path and _cache_matches(path, model_name, precision):
+        try:
+            return _load_converted(path, precision)
+        except Exception as e:
+            print(f"Error loading converted model from '{path}', converting again: {e}")
+
+    print(f"Converting '{model_name}' to {precision}...")
+    model = convert_model(AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32,
+                                                               device_map={"": "cpu"}), precision)
+    model.eval()
+    if path:
+        try:
+            _save_converted(model, path, model_name, precision)
+            print(f"Converted model saved to '{path}'")
+        except Exception as e:
+            print(f"Error saving converted model to '{path}': {e}")
+    return model
+
+
+def _save_converted(model, path: str, model_name: str, precision: str):
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    if precision == 'bfloat16':
+        model.save_pretrained(tmp_path)
+    else:
+        os.makedirs(tmp_path)
+        model.config.save_pretrained(tmp_path)
+        model.generation_config.save_pretrained(tmp_path)
+        torch.save(model.state_dict(), os.path.join(tmp_path, 'model.pt'))
+    with open(os.path.join(tmp_path, 'precision.json'), 'w') as file:
+        json.dump({'version': CACHE_FORMAT_VERSION, 'model_name': model_name, 'precision': precision,
+                   'int4_group_size': INT4_GROUP_SIZE}, file)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+def _load_converted(path: str, precision: str):
+    if precision == 'bfloat16':
+        model = AutoModelForCausalLM.from_pretrained(path, torch_dtype=torch.bfloat16, device_map={"": "cpu"})
+    else:
+        # Build the architecture with parameters on the meta device (no float32 copy is allocated; buffers
+        # such as rotary frequencies are still computed), give it the converted layers, then attach the
+        # saved tensors themselves, memory-mapped from the file, instead of copying them into new ones
+        from accelerate import init_empty_weights # Only this path needs it; importing here keeps the module light
+        with init_empty_weights():
+            model = AutoModelForCausalLM.from_config(AutoConfig.from_pretrained(path), torch_dtype=torch.float32)
+        model = convert_model(model, precision, quantize_weights=False)
+        state_dict = torch.load(os.path.join(path, 'model.pt'), map_location='cpu', mmap=True, weights_only=False)
+        model.load_state_dict(state_dict, assign=True)
+        model.tie_weights()
+        model.generation_config = GenerationConfig.from_pretrained(path)
+    return model.eval()
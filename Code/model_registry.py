@@ -0,0 +1,166 @@
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ModelKey = Tuple[str, str, str] # (kind, name, dtype)
+
+
+def _tensors(values):
+    for value in values:
+        if isinstance(value, (tuple, list)):
+            yield from _tensors(value)
+        elif hasattr(value, 'data_ptr') and hasattr(value, 'element_size'):
+            yield value
+
+
+def estimate_nbytes(obj) -> int:
+    """Bytes held by the tensors or arrays of a loaded model (0 if it has none we can see)."""
+    if obj is None:
+        return 0
+    if isinstance(obj, (tuple, list)):
+        return sum(estimate_nbytes(item) for item in obj)
+    if isinstance(obj, dict):
+        return sum(estimate_nbytes(item) for item in obj.values())
+    if hasattr(obj, 'parameters') and hasattr(obj, 'buffers'): # torch.nn.Module
+        # state_dict() also holds tensors kept outside parameters and buffers,
+        # e.g. the packed weights of dynamically quantized Linear layers
+        tensors = list(obj.parameters()) + list(obj.buffers()) + list(_tensors(obj.state_dict().values()))
+        seen, total = set(), 0
+        for tensor in tensors:
+            if tensor.data_ptr() not in seen: # Tied weights are counted once
+                seen.add(tensor.data_ptr())
+                total += tensor.numel() * tensor.element_size()
+        return total
+    if hasattr(obj, 'model'): # transformers pipelines
+        return estimate_nbytes(obj.model)
+    nbytes = getattr(obj, 'nbytes', None)
+    return int(nbytes) if isinstance(nbytes, int) else 0
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (0 where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded models.
+
+    Components ask for a model by kind, name and dtype together with a loader;
+    the first request runs the loader and later ones (from any component or
+    thread) get the same object, so a checkpoint is resident once per dtype.
+    Each model's size is estimated from its tensors (or from the growth of the
+    process RSS while it loaded), and when the resident total exceeds
+    memory_budget bytes the least recently used models are dropped. Callers
+    should therefore fetch the model on each use instead of keeping their own
+    reference, or an evicted model cannot actually be freed. The budget
+    defaults to the CHATBOT_MODEL_MEMORY_MB environment variable (unlimited if
+    unset).
+    """
+
+    def __init__(self, memory_budget: Optional[int] = None):
+        if memory_budget is None and os.getenv("CHATBOT_MODEL_MEMORY_MB"):
+            memory_budget = int(float(os.environ["CHATBOT_MODEL_MEMORY_MB"]) * 2**20)
+        self.memory_budget = memory_budget
+        self._models: 'OrderedDict[ModelKey, Any]' = OrderedDict() # Resident models, least recently used first
+        self._stats: Dict[ModelKey, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[ModelKey, threading.Lock] = {}
+
+    def get(self, name: str, loader: Callable[[], Any], dtype: str = 'float32', kind: str = 'model'):
+        """Returns the resident model for (kind, name, dtype), running loader if it is not loaded."""
+        key = (kind, name, str(dtype))
+        with self._lock:
+            if key in self._models:
+                return self._hit(key)
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock: # Concurrent first requests wait for one load instead of each loading a copy
+            with self._lock:
+                if key in self._models:
+                    return self._hit(key)
+            rss_before = current_rss()
+            start = time.perf_counter()
+            model = loader()
+            seconds = time.perf_counter() - start
+            nbytes = estimate_nbytes(model) or max(0, current_rss() - rss_before)
+            with self._lock:
+                stats = self._stats.setdefault(key, {'loads': 0, 'hits': 0, 'evictions': 0, 'load_seconds': 0.0})
+                stats['loads'] += 1
+                stats['load_seconds'] += seconds
+                stats['last_load_seconds'] = seconds
+                stats['bytes'] = nbytes
+                self._models[key] = model
+                evicted = self._evict(keep=key)
+        print(f"Model registry: loaded {kind} '{name}' ({dtype}) in {seconds:.1f}s, {nbytes / 2**20:.0f} MiB "
+              f"({self.resident_bytes() / 2**20:.0f} MiB resident)")
+        if evicted:
+            gc.collect()
+        return model
+
+    def _hit(self, key: ModelKey):
+        self._models.move_to_end(key)
+        self._stats[key]['hits'] += 1
+        return self._models[key]
+
+    def _evict(self, keep: ModelKey) -> List[ModelKey]:
+        """Drops least recently used models (never keep) until the budget is met. Caller holds the lock."""
+        evicted = []
+        while self.memory_budget is not None and self._resident_bytes() > self.memory_budget:
+            victim = next((key for key in self._models if key != keep), None)
+            if victim is None:
+                break
+            del self._models[victim]
+            self._stats[victim]['evictions'] += 1
+            evicted.append(victim)
+            print(f"Model registry: evicted {victim[0]} '{victim[1]}' ({victim[2]}) to stay within "
+                  f"{self.memory_budget / 2**20:.0f} MiB")
+        return evicted
+
+    def release(self, name: str, dtype: str = 'float32', kind: str = 'model') -> bool:
+        """Drops a model from the registry; returns whether it was resident."""
+        with self._lock:
+            model = self._models.pop((kind, name, str(dtype)), None)
+        if model is None:
+            return False
+        del model
+        gc.collect()
+        return True
+
+    def is_loaded(self, name: str, dtype: str = 'float32', kind: str = 'model') -> bool:
+        return (kind, name, str(dtype)) in self._models
+
+    def _resident_bytes(self) -> int:
+        return int(sum(self._stats[key].get('bytes', 0) for key in self._models))
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return self._resident_bytes()
+
+    def stats(self) -> List[Dict]:
+        """One row per model ever loaded: load count and time, size, hits, evictions and residency."""
+        with self._lock:
+            return [{'kind': kind, 'name': name, 'dtype': dtype, 'resident': (kind, name, dtype) in self._models, **stats}
+                    for (kind, name, dtype), stats in self._stats.items()]
+
+    def report(self) -> str:
+        rows = self.stats()
+        if not rows:
+            return "Model registry: no models loaded."
+        lines = [f"Model registry: {self.resident_bytes() / 2**20:.0f} MiB resident"
+                 + (f" of {self.memory_budget / 2**20:.0f} MiB budget" if self.memory_budget is not None else "")]
+        for row in rows:
+            lines.append(f"  {row['kind']} '{row['name']}' ({row['dtype']}): {row['bytes'] / 2**20:.0f} MiB, "
+                         f"loaded {row['loads']}x in {row['load_seconds']:.1f}s, {row['hits']} reuses, "
+                         f"{row['evictions']} evictions{'' if row['resident'] else ', not resident'}")
+        return "\n".join(lines)
+
+
+# Shared by every component in the process
+model_registry = ModelRegistry()
@@ -1,26 +1,76 @@
-from typing import List, Optional, Tuple
-from transformers import pipeline
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple, Union
+import numpy as np
 from scipy.spatial.distance import cosine
+from embedding_backend import EmbeddingBackend
+from embedding_cache import EmbeddingCache
+from embedding_index import EmbeddingIndex
 
 class NLPProcessor:
-    def __init__(self):
-        self.nlp = pipeline("feature-extraction", model="distilbert-base-uncased", tokenizer="distilbert-base-uncased")
+    def __init__(self, model_name: str = "distilbert-base-uncased",
+                 cache_path: Optional[str] = "embedding_cache", # None disables the on-disk tier
+                 memory_cache_size: int = 10_000,
+                 pooling: str = "cls", normalize: bool = False,
+                 quantize: Optional[str] = None, # None (float32) or "int8"
+                 runtime: str = "torch"): # "torch" or "onnx"
+        self.backend = EmbeddingBackend(model_name, pooling=pooling, normalize=normalize,
+                                        quantize=quantize, runtime=runtime)
+        # Names the vectors, not just the checkpoint: caches and indexes built with other options are kept apart
+        self.model_name = self.backend.name
         self.cosine = cosine
+        # Every embedding goes through the cache: in-memory LRU first, then the persistent store
+        self.cache = EmbeddingCache(cache_path, self.model_name, memory_cache_size)
+        # Normalized candidate matrices for find_best_matches, most recently used last
+        self._candidate_indexes: 'OrderedDict[str, EmbeddingIndex]' = OrderedDict()
+        self.max_candidate_indexes = 4
 
     def get_embedding(self, text: str) -> List[float]:
-        return self.nlp(text)[0][0].tolist()
+        return self.get_embeddings([text])[0].tolist()
 
-    def find_best_match(self, user_question: str, questions: List[str]) -> Tuple[Optional[str], float]:
+    def get_embeddings(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Embeds texts in batches and returns a (len(texts), dim) float32 matrix, using cached vectors where possible."""
+        return self.cache.get_or_compute(texts, lambda missing: self.backend.embed_many(missing, batch_size))
+
+    def embed_many(self, texts: Sequence[str], batch_size: int = 32) -> np.ndarray:
+        """Runs the encoder on texts directly, bypassing the cache."""
+        return self.backend.embed_many(texts, batch_size)
+
+    def cache_stats(self) -> dict:
+        """Hit/miss counts of the embedding cache."""
+        return self.cache.stats()
+
+    def candidate_index(self, candidates: Sequence[str]) -> EmbeddingIndex:
+        """
+        Normalized embedding matrix for a candidate list, memoized by the list's
+        signature so repeated searches over the same candidates only embed the query.
+        """
+        signature = EmbeddingIndex.texts_signature(candidates)
+        index = self._candidate_indexes.get(signature)
+        if index is None:
+            index = EmbeddingIndex.build(candidates, self)
+            self._candidate_indexes[signature] = index
+            while len(self._candidate_indexes) > self.max_candidate_indexes:
+                self._candidate_indexes.popitem(last=False)
+        self._candidate_indexes.move_to_end(signature)
+        return index
+
+    def find_best_matches(self, user_question: str, candidates: Union[Sequence[str], EmbeddingIndex],
+                          k: int = 5, threshold: Optional[float] = 0.85) -> List[Tuple[str, float]]:
+        """
+        Top-k (candidate, cosine score) pairs above threshold, best first. Candidates
+        are a list of texts or a precomputed EmbeddingIndex; either way all of them
+        are scored with one matrix-vector product.
+        """
         try:
-            user_embedding = self.get_embedding(user_question)
-            best_score = 0.0
-            best_question = None
-            for question in questions:
-                q_embedding = self.get_embedding(question)
-                score = 1 - self.cosine(user_embedding, q_embedding)
-                if score > best_score and score > 0.85:
-                    best_score = score
-                    best_question = question
-            return best_question, best_score
-        except Exception:
-            return None, 0.0
+            index = candidates if isinstance(candidates, EmbeddingIndex) else self.candidate_index(candidates)
+            if not len(index):
+                return []
+            return index.top_k(self.get_embedding(user_question), k=k, threshold=threshold)
+        except Exception as e:
+            print(f"Error during semantic matching: {e}")
+            return []
+
+    def find_best_match(self, user_question: str, questions: Union[Sequence[str], EmbeddingIndex],
+                        threshold: Optional[float] = 0.85) -> Tuple[Optional[str], float]:
+        matches = self.find_best_matches(user_question, questions, k=1, threshold=threshold)
+        return matches[0] if matches else (None, 0.0)
@@ -0,0 +1,156 @@
+import hashlib
+import os
+from typing import List, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+
+try:
+    import faiss
+except ImportError:  # Exact search over an in-memory matrix is used instead
+    faiss = None
+
+from embedding_index import EmbeddingIndex
+
+
+class QuestionANNIndex:
+    """
+    Persistent approximate-nearest-neighbour index over a growing list of questions.
+
+    Vectors are L2-normalised embeddings in a FAISS HNSW graph with inner-product
+    metric, so scores are cosine similarities and row i is question i. New
+    questions are inserted into the graph as they are added; nothing is ever
+    rebuilt. The graph is written to disk every save_every additions (and on
+    save()), together with the number of questions it covers and a chained hash
+    of them. On load, questions appended since the last save are embedded
+    (usually straight from the embedding cache) and inserted, and a hash
+    mismatch, meaning the earlier questions changed, triggers a rebuild.
+    """
+
+    FORMAT_VERSION = 1
+    BUILD_CHUNK = 10_000
+
+    def __init__(self, path_prefix: Optional[str], nlp_processor, hnsw_m: int = 32,
+                 ef_construction: int = 80, ef_search: int = 64, save_every: int = 256):
+        self.path_prefix = path_prefix
+        self.nlp_processor = nlp_processor
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.save_every = save_every
+        self.index = None
+        self.matrix: Optional[np.ndarray] = None  # Used when FAISS is not installed
+        self.count = 0
+        self.signature = ''
+        self._unsaved = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    @staticmethod
+    def chain_signature(signature: str, questions: Sequence[str]) -> str:
+        """Extends the hash of a question list by more questions, so appends can be verified cheaply."""
+        for question in questions:
+            signature = hashlib.sha1(signature.encode('ascii') + question.encode('utf-8') + b'\0').hexdigest()
+        return signature
+
+    def _paths(self) -> Tuple[str, str]:
+        return self.path_prefix + '.faiss', self.path_prefix + '_meta.pkl'
+
+    def _new_index(self, dim: int):
+        index = faiss.IndexHNSWFlat(dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = self.ef_construction
+        index.hnsw.efSearch = self.ef_search
+        return index
+
+    def add(self, questions: Sequence[str]):
+        """Embeds and inserts questions (in order, after the existing ones)."""
+        questions = list(questions)
+        for start in range(0, len(questions), self.BUILD_CHUNK):
+            chunk = questions[start:start + self.BUILD_CHUNK]
+            vectors = np.ascontiguousarray(EmbeddingIndex.normalize(self.nlp_processor.get_embeddings(chunk)))
+            if faiss is not None:
+                if self.index is None:
+                    self.index = self._new_index(vectors.shape[1])
+                self.index.add(vectors)
+            else:
+                self.matrix = vectors if self.matrix is None else np.vstack([self.matrix, vectors])
+            self.count += len(chunk)
+            self.signature = self.chain_signature(self.signature, chunk)
+        self._unsaved += len(questions)
+        if self._unsaved >= self.save_every:
+            self.save()
+
+    def search(self, question: str, k: int = 1, threshold: Optional[float] = None) -> List[Tuple[int, float]]:
+        """(question id, cosine score) pairs for the k nearest questions, best first."""
+        if not self.count or k <= 0:
+            return []
+        query = EmbeddingIndex.normalize(self.nlp_processor.get_embeddings([question]))
+        if self.index is not None:
+            scores, ids = self.index.search(np.ascontiguousarray(query), min(k, self.count))
+            matches = [(int(i), float(score)) for i, score in zip(ids[0], scores[0]) if i >= 0]
+        else:
+            scores = self.matrix @ query[0]
+            matches = [(int(i), float(scores[i])) for i in EmbeddingIndex.top_k_ids(scores, k)]
+        if threshold is not None:
+            matches = [(i, score) for i, score in matches if score > threshold]
+        return matches
+
+    def save(self):
+        self._unsaved = 0
+        if not self.path_prefix or self.index is None:
+            return
+        index_path, meta_path = self._paths()
+        try:
+            faiss.write_index(self.index, index_path + '.tmp')
+            os.replace(index_path + '.tmp', index_path)
+            joblib.dump({
+                'version': self.FORMAT_VERSION,
+                'model_name': self.nlp_processor.model_name,
+                'count': self.count,
+                'signature': self.signature,
+            }, meta_path + '.tmp')
+            os.replace(meta_path + '.tmp', meta_path)
+        except Exception as e:
+            print(f"Error saving question index to '{self.path_prefix}': {e}")
+
+    def _load(self, questions: Sequence[str]) -> bool:
+        """Loads the saved graph if it covers a prefix of questions with the current model."""
+        index_path, meta_path = self._paths()
+        if not (os.path.exists(index_path) and os.path.exists(meta_path)):
+            return False
+        try:
+            meta = joblib.load(meta_path)
+            if not isinstance(meta, dict) or meta.get('version') != self.FORMAT_VERSION \
+                    or meta.get('model_name') != self.nlp_processor.model_name \
+                    or meta['count'] > len(questions) \
+                    or self.chain_signature('', questions[:meta['count']]) != meta['signature']:
+                return False
+            index = faiss.read_index(index_path)
+            if index.ntotal != meta['count']:
+                return False
+        except Exception as e:
+            print(f"Error loading question index from '{self.path_prefix}': {e}")
+            return False
+        index.hnsw.efSearch = self.ef_search
+        self.index, self.count, self.signature = index, meta['count'], meta['signature']
+        return True
+
+    @classmethod
+    def load_or_build(cls, path_prefix: Optional[str], questions: Sequence[str], nlp_processor,
+                      **kwargs) -> 'QuestionANNIndex':
+        """Opens the saved index, catching up on questions appended since it was saved, or builds it."""
+        index = cls(path_prefix if faiss is not None else None, nlp_processor, **kwargs)
+        if faiss is None:
+            print("Warning: faiss is not installed; semantic question lookups use exact search.")
+        elif path_prefix and index._load(questions):
+            if index.count < len(questions):
+                print(f"Adding {len(questions) - index.count} new questions to the index at '{path_prefix}'...")
+                index.add(questions[index.count:])
+                index.save()
+            return index
+        if questions:
+            print(f"Building question index for {len(questions)} questions at '{path_prefix}'...")
+            index.add(questions)
+            index.save()
+        return index
@@ -0,0 +1,3 @@
+def normalize_question(question: str) -> str:
+    """Key used for exact question lookups: case-folded, with runs of whitespace collapsed."""
+    return " ".join(question.casefold().split())
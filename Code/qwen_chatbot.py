@@ -1,28 +1,399 @@
 # qwen_chatbot.py
-from transformers import AutoModelForCausalLM, AutoTokenizer
+import asyncio
+import os
+import re
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Optional, Sequence
+
+from transformers import (AutoTokenizer, DynamicCache, StoppingCriteria,
+                          StoppingCriteriaList, TextStreamer)
 import torch
 
+from history_window import HistoryWindow
+from model_precision import PRECISIONS, converted_model_path, load_causal_lm
+from model_registry import current_rss, model_registry
+
+_THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+# Scripted user turns for benchmark_conversation
+BENCHMARK_PROMPTS = [
+    "What is paracetamol used for?",
+    "What are its common side effects?",
+    "Can I take it together with ibuprofen?",
+    "How much water should an adult drink in a day?",
+    "Summarize what we have talked about so far in one sentence.",
+    "Give me a tip for sleeping better.",
+]
+
+
+def strip_thinking(text: str) -> str:
+    return _THINK_RE.sub("", text).strip()
+
+
+def common_prefix_length(ids: Sequence[int], other_ids: Sequence[int]) -> int:
+    """Number of leading tokens the two sequences share."""
+    common = 0
+    for token, other in zip(ids, other_ids):
+        if token != other:
+            break
+        common += 1
+    return common
+
+
+def summary_instruction(previous_summary: str, messages: List[Dict[str, str]]) -> str:
+    """Prompt asking the model to fold messages into the running summary of a conversation."""
+    transcript = "\n".join(f"{message['role'].capitalize()}: {strip_thinking(message['content'])}"
+                           for message in messages)
+    return ("Update the summary of a conversation between a user and an assistant. Keep the facts "
+            "the user shared, what they asked and the key points of the answers, in a few sentences.\n\n"
+            f"Current summary: {previous_summary or '(none)'}\n\nNew turns:\n{transcript}\n\nUpdated summary:")
+
+
+class _TimingStreamer(TextStreamer):
+    """Records when the first new token arrived and how many were generated; prints nothing."""
+
+    def __init__(self, tokenizer):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        self.first_token_time: Optional[float] = None
+        self.new_tokens = 0
+
+    def put(self, value):
+        if not self.next_tokens_are_prompt: # The first call carries the prompt
+            if self.first_token_time is None:
+                self.first_token_time = time.perf_counter()
+            self.new_tokens += value.numel()
+        super().put(value)
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        pass
+
+
+class _QueueStreamer(_TimingStreamer):
+    """Hands decoded text from the generate() thread to an asyncio queue."""
+
+    def __init__(self, tokenizer, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        super().__init__(tokenizer)
+        self.loop = loop
+        self.queue = queue
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        if text:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, text)
+
+
+class _CancelCriteria(StoppingCriteria):
+    """Stops generation after the current token once the event is set."""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool)
+
+
 class QwenChatbot:
-    def __init__(self, model_name="Qwen/Qwen3-1.7B"):
-        # Load tokenizer and model on CPU
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModelForCausalLM.from_pretrained(
-            model_name,
-            torch_dtype=torch.float32,
-            device_map={"": "cpu"}  # Forces CPU usage
-        )
-        self.history = []
+    """
+    Chat with a Qwen model on CPU.
+
+    With reuse_kv_cache (the default) the model's key/value cache is kept
+    between turns, along with the token ids it holds (each turn's prompt, then
+    the reply as generated). A new turn renders and tokenizes the template and
+    crops the cache to the longest common token prefix, so only the rest is
+    prefilled. The template need not reproduce what the model saw: Qwen3
+    drops the <think> block of earlier replies, so the previous reply is
+    prefilled again in its rendered form, a cost that does not grow with the
+    conversation. Editing or truncating self.history just shortens the prefix.
+
+    The prompt is bounded by a HistoryWindow: once the history passes
+    token_budget tokens, the oldest turns leave the prompt and are folded
+    into a running summary (generated by the same model on a background
+    thread) that is sent as a system message. Folding changes the start of the
+    prompt, so the turn after a fold prefills the whole window once; the
+    window's low-water mark makes that happen every few turns, not every turn.
 
-    def generate_response(self, user_input: str) -> str:
-        messages = self.history + [{"role": "user", "content": user_input}]
-        text = self.tokenizer.apply_chat_template(
+    precision selects how the weights are held (see model_precision): float32,
+    bfloat16, int8_dynamic, int8_weight or int4_weight. Converted weights are
+    cached under cache_dir. Changing precision drops the KV cache, which was
+    computed by the other model.
+    """
+
+    def __init__(self, model_name="Qwen/Qwen3-1.7B", reuse_kv_cache: bool = True,
+                 token_budget: Optional[int] = 4096, system_prompt: Optional[str] = None,
+                 summary_max_tokens: int = 200, precision: str = 'float32',
+                 cache_dir: Optional[str] = 'quantized_models'):
+        # Tokenizer and model are loaded on first use and shared through the model registry
+        self.model_name = model_name
+        self.reuse_kv_cache = reuse_kv_cache
+        self.summary_max_tokens = summary_max_tokens
+        self.history_window = HistoryWindow(self._count_tokens, self._summarize, token_budget=token_budget,
+                                            system_prompt=system_prompt)
+        self._cache_ids: List[int] = [] # Token ids fed to the model, covering the cache
+        self._past_key_values: Optional[DynamicCache] = None
+        self.last_stats: Dict[str, float] = {} # Tokens and timing of the last turn
+        self.cache_dir = cache_dir
+        self.precision = precision
+
+    @property
+    def tokenizer(self):
+        return model_registry.get(self.model_name, lambda: AutoTokenizer.from_pretrained(self.model_name),
+                                  dtype='-', kind='tokenizer')
+
+    @property
+    def model(self):
+        return model_registry.get(self.model_name, self._load_model, dtype=self.precision, kind='causal-lm')
+
+    def _load_model(self):
+        return load_causal_lm(self.model_name, self.precision, self.cache_dir)
+
+    @property
+    def precision(self) -> str:
+        return self._precision
+
+    @precision.setter
+    def precision(self, precision: str):
+        if precision not in PRECISIONS:
+            raise ValueError(f"precision must be one of {', '.join(PRECISIONS)}, got '{precision}'")
+        if precision != getattr(self, '_precision', precision):
+            self.reset_kv_cache()
+        self._precision = precision
+
+    @property
+    def history(self) -> List[Dict[str, str]]:
+        """Messages kept verbatim; older ones live in history_window.summary."""
+        return self.history_window.messages
+
+    @history.setter
+    def history(self, messages: List[Dict[str, str]]):
+        self.history_window.messages = messages
+
+    def _count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def _summarize(self, previous_summary: str, messages: List[Dict[str, str]]) -> str:
+        """Folds messages into the running summary (called by the history window's background thread)."""
+        tokenizer = self.tokenizer
+        messages = [{"role": "user", "content": summary_instruction(previous_summary, messages)}]
+        text = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True, enable_thinking=False)
+        inputs = tokenizer(text, return_tensors="pt")
+        generated_ids = self.model.generate(**inputs, max_new_tokens=self.summary_max_tokens, do_sample=False)
+        summary = tokenizer.decode(generated_ids[0][inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+        return strip_thinking(summary)
+
+    def reset_kv_cache(self):
+        self._cache_ids = []
+        self._past_key_values = None
+
+    def _prepare_turn(self, user_input: str) -> Dict:
+        """generate() inputs for this turn; reuses the cached prefix of the conversation when possible."""
+        tokenizer = self.tokenizer
+        messages = self.history_window.prompt_messages(user_input)
+        text = tokenizer.apply_chat_template(
             messages, tokenize=False, add_generation_prompt=True
         )
-        inputs = self.tokenizer(text, return_tensors="pt")
-        generated_ids = self.model.generate(**inputs, max_new_tokens=1000)
-        response_ids = generated_ids[0][len(inputs.input_ids[0]):].tolist()
-        response = self.tokenizer.decode(response_ids, skip_special_tokens=True)
-        # Update history
-        self.history.append({"role": "user", "content": user_input})
-        self.history.append({"role": "assistant", "content": response})
+        prompt_ids = list(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+        # The cache holds every fed token, i.e. all but the last token of the previous reply.
+        # At least one prompt token must be fed to produce the first logits.
+        reused = 0
+        if self._past_key_values is not None:
+            cached_ids = self._cache_ids[:self._past_key_values.get_seq_length()]
+            reused = common_prefix_length(cached_ids, prompt_ids[:-1])
+            if reused:
+                self._past_key_values.crop(reused)
+            else:
+                self._past_key_values = None
+        self._cache_ids = prompt_ids if self.reuse_kv_cache else []
+        input_ids = torch.tensor([prompt_ids], dtype=torch.long)
+        inputs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+        if self.reuse_kv_cache:
+            if self._past_key_values is None:
+                self._past_key_values = DynamicCache()
+            inputs["past_key_values"] = self._past_key_values
+        self.last_stats = {'prompt_tokens': len(prompt_ids), 'reused_tokens': reused,
+                           'prefill_tokens': len(prompt_ids) - reused}
+        return inputs
+
+    def _finish_turn(self, user_input: str, inputs: Dict, sequence, shown: Optional[str] = None) -> str:
+        """
+        Records the reply in the history and, with reuse_kv_cache, the ids the
+        cache now holds. shown replaces the reply when the caller saw only part
+        of it (a stream closed early), so the history holds what was shown.
+        """
+        tokenizer = self.tokenizer
+        response_ids = sequence[inputs["input_ids"].shape[1]:].tolist()
+        response = tokenizer.decode(response_ids, skip_special_tokens=True)
+        if self.reuse_kv_cache:
+            self._cache_ids = self._cache_ids + response_ids
+        # Update history; the reply's token count is already known unless only part of it was shown
+        self.history_window.append({"role": "user", "content": user_input})
+        if shown is not None and shown != response:
+            self.history_window.append({"role": "assistant", "content": shown})
+        else:
+            self.history_window.append({"role": "assistant", "content": response}, tokens=len(response_ids))
+        self.history_window.enforce_budget()
+        self.last_stats.update(self.history_window.stats())
+        if self._past_key_values is not None:
+            self.last_stats['kv_cache_tokens'] = self._past_key_values.get_seq_length()
         return response
+
+    def _load(self):
+        """Loads the tokenizer and model, so that a turn's timing does not include loading them."""
+        start = time.perf_counter()
+        self.tokenizer
+        model = self.model
+        return model, time.perf_counter() - start
+
+    def _record_timing(self, start: float, streamer: _TimingStreamer, cancelled: bool = False,
+                       load_seconds: float = 0.0):
+        end = time.perf_counter()
+        first = streamer.first_token_time
+        self.last_stats.update({
+            'load_seconds': load_seconds,
+            'new_tokens': streamer.new_tokens,
+            'ttft_seconds': (first if first is not None else end) - start,
+            'seconds': end - start,
+            # Decode rate, excluding the prefill that produced the first token
+            'tokens_per_second': (streamer.new_tokens - 1) / (end - first)
+                                 if first is not None and streamer.new_tokens > 1 and end > first else 0.0,
+            'cancelled': cancelled,
+        })
+
+    def generate_response(self, user_input: str, max_new_tokens: int = 1000, **generate_kwargs) -> str:
+        model, load_seconds = self._load()
+        start = time.perf_counter()
+        inputs = self._prepare_turn(user_input)
+        streamer = _TimingStreamer(self.tokenizer)
+        try:
+            generated_ids = model.generate(**inputs, max_new_tokens=max_new_tokens, streamer=streamer,
+                                           **generate_kwargs)
+        except Exception:
+            self.reset_kv_cache() # The cache may hold part of a failed step
+            raise
+        self._record_timing(start, streamer, load_seconds=load_seconds)
+        return self._finish_turn(user_input, inputs, generated_ids[0])
+
+    async def stream_response(self, user_input: str, max_new_tokens: int = 1000,
+                              cancel_event: Optional[threading.Event] = None) -> AsyncIterator[str]:
+        """
+        Yields the reply as text deltas while model.generate runs in a worker
+        thread. Setting cancel_event stops generation after the current token;
+        the text decoded up to there is still yielded and kept in the history.
+        Closing the iterator also stops generation, and the history keeps only
+        the text that was yielded. Tokens and timing of the turn are left in
+        last_stats: prompt_tokens, reused_tokens and prefill_tokens,
+        load_seconds (loading the model, not part of the turn), ttft_seconds
+        (prompt to first token), new_tokens, seconds, tokens_per_second and
+        cancelled.
+        """
+        cancel_event = cancel_event or threading.Event()
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        model, load_seconds = await asyncio.to_thread(self._load)
+        start = time.perf_counter()
+        inputs = await asyncio.to_thread(self._prepare_turn, user_input)
+        streamer = _QueueStreamer(self.tokenizer, loop, queue)
+        done = object()
+        outputs, errors = [], []
+
+        def run():
+            try:
+                outputs.append(model.generate(
+                    **inputs, max_new_tokens=max_new_tokens, streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([_CancelCriteria(cancel_event)])))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        worker = threading.Thread(target=run, name="qwen-generate", daemon=True)
+        worker.start()
+        finished = False
+        shown = []
+        try:
+            while True:
+                text = await queue.get()
+                if text is done:
+                    break
+                shown.append(text) # Before yielding: closing the iterator raises at the yield
+                yield text
+            if errors:
+                raise errors[0]
+            finished = True
+        finally:
+            cancelled = cancel_event.is_set() or not finished
+            cancel_event.set() # Stops generation if the caller went away; no-op once it has finished
+            await asyncio.to_thread(worker.join)
+            self._record_timing(start, streamer, cancelled, load_seconds)
+            if outputs:
+                self._finish_turn(user_input, inputs, outputs[0][0], None if finished else "".join(shown))
+            else:
+                self.reset_kv_cache()
+
+
+def benchmark_conversation(model_name: str = "Qwen/Qwen3-1.7B", turns: int = 30,
+                           max_new_tokens: int = 32, token_budget: Optional[int] = 4096) -> List[Dict]:
+    """
+    Runs the same scripted conversation (greedy, max_new_tokens per reply) with
+    and without cross-turn KV-cache reuse; returns one row per turn with the
+    prompt, reused and prefilled token counts, history and KV-cache size, time
+    to first token and total turn time. Background summaries are waited for
+    between turns (as if the user were typing), so they do not skew timings.
+    """
+    rows = []
+    for reuse in (False, True):
+        bot = QwenChatbot(model_name, reuse_kv_cache=reuse, token_budget=token_budget)
+        for turn in range(1, turns + 1):
+            prompt = f"{BENCHMARK_PROMPTS[(turn - 1) % len(BENCHMARK_PROMPTS)]} (question {turn})"
+            bot.generate_response(prompt, max_new_tokens=max_new_tokens, do_sample=False)
+            rows.append({'reuse_kv_cache': reuse, 'turn': turn, **bot.last_stats})
+            bot.history_window.wait()
+    return rows
+
+
+def _token_agreement(ids, reference_ids) -> float:
+    """Fraction of the longer sequence covered by the common prefix of the two."""
+    longest = max(len(ids), len(reference_ids))
+    return common_prefix_length(ids, reference_ids) / longest if longest else 1.0
+
+
+def benchmark_precisions(model_name: str = "Qwen/Qwen3-1.7B", precisions=PRECISIONS, max_new_tokens: int = 64,
+                         cache_dir: Optional[str] = 'quantized_models') -> List[Dict]:
+    """
+    Answers BENCHMARK_PROMPTS (each on its own, greedy) in every precision and
+    returns one row per precision: load time (and whether converted weights
+    were already cached), process RSS after loading, generated tokens per
+    second, and agreement with float32 - the mean token-level agreement of the
+    replies (common prefix over length) and the fraction of identical replies.
+    Agreement is None when float32 is not among precisions. Each model is
+    released before the next loads, but freed memory is not always returned to
+    the OS, so compare RSS across separate runs for exact figures.
+    """
+    precisions = sorted(precisions, key=lambda precision: precision != 'float32') # Reference first
+    reference, rows = None, []
+    for precision in precisions:
+        bot = QwenChatbot(model_name, reuse_kv_cache=False, token_budget=None, precision=precision, cache_dir=cache_dir)
+        cached = precision != 'float32' and cache_dir is not None \
+            and os.path.exists(converted_model_path(model_name, precision, cache_dir))
+        start = time.perf_counter()
+        bot.model
+        load_seconds = time.perf_counter() - start
+        rss = current_rss()
+        replies, new_tokens, seconds = [], 0, 0.0
+        for prompt in BENCHMARK_PROMPTS:
+            bot.history = []
+            replies.append(bot.tokenizer(bot.generate_response(prompt, max_new_tokens=max_new_tokens, do_sample=False),
+                                         add_special_tokens=False)["input_ids"])
+            new_tokens += bot.last_stats['new_tokens']
+            seconds += bot.last_stats['seconds']
+        if precision == 'float32':
+            reference = replies
+        row = {'precision': precision, 'cached': cached, 'load_seconds': load_seconds, 'rss_bytes': rss,
+               'tokens_per_second': new_tokens / seconds if seconds else 0.0,
+               'token_agreement': None, 'exact_match': None}
+        if reference is not None:
+            row['token_agreement'] = sum(map(_token_agreement, replies, reference)) / len(replies)
+            row['exact_match'] = sum(reply == expected for reply, expected in zip(replies, reference)) / len(replies)
+        rows.append(row)
+        model_registry.release(model_name, dtype=precision, kind='causal-lm')
+    return rows
@@ -0,0 +1,199 @@
+import os
+import re
+from typing import Callable, Dict, List, Optional, Sequence
+
+import joblib
+import numpy as np
+
+_LINK_RE = re.compile(r':\s*https?://')
+
+
+def parse_related_drugs(related_drugs: str) -> List[str]:
+    """Splits a 'name: url | name: url' field into the listed drug names."""
+    if not related_drugs or related_drugs == 'nan':
+        return []
+    names = []
+    for item in related_drugs.split('|'):
+        name = _LINK_RE.split(item, 1)[0].strip()
+        if name:
+            names.append(name)
+    return names
+
+
+class RelatedDrugsGraph:
+    """
+    Related-drug relations as integer-id adjacency in CSR form.
+
+    Nodes 0..num_catalog-1 are catalog drug ids; related names that are not in
+    the catalog get extra node ids after them. Names keep the spelling they
+    were first listed with (display_names for catalog drugs, whose ids come
+    from lowercased keys). Two CSR structures are kept: the listed relations
+    in their original order (out_indptr/out_indices), and a symmetric, sorted,
+    deduplicated version (indptr/indices) used for multi-hop, path and
+    intersection queries.
+    """
+
+    FORMAT_VERSION = 2
+
+    def __init__(self, catalog_names: Sequence[str] = (), related_column: Sequence[str] = (),
+                 catalog_id: Optional[Callable[[str], Optional[int]]] = None, source_signature: str = ''):
+        self.source_signature = source_signature
+        self.num_catalog = len(catalog_names)
+        self.external_names: List[str] = []
+        self.display_names: Dict[int, str] = {} # Catalog node -> name as first listed
+        external_ids: Dict[str, int] = {}
+        out_lists: List[List[int]] = []
+        for text in related_column:
+            targets: List[int] = []
+            for name in parse_related_drugs(text):
+                key = name.lower()
+                node = catalog_id(key) if catalog_id else None
+                if node is None:
+                    node = external_ids.get(key)
+                    if node is None:
+                        node = external_ids[key] = self.num_catalog + len(self.external_names)
+                        self.external_names.append(name)
+                else:
+                    self.display_names.setdefault(node, name)
+                if node not in targets:
+                    targets.append(node)
+            out_lists.append(targets)
+
+        num_nodes = self.num_catalog + len(self.external_names)
+        self.out_indptr = np.zeros(len(out_lists) + 1, dtype=np.int64)
+        np.cumsum([len(targets) for targets in out_lists], out=self.out_indptr[1:])
+        self.out_indices = np.fromiter((t for targets in out_lists for t in targets),
+                                       dtype=np.int32, count=int(self.out_indptr[-1]))
+
+        # Symmetric adjacency: every listed edge in both directions, sorted and unique per node
+        sources = np.repeat(np.arange(len(out_lists), dtype=np.int64), np.diff(self.out_indptr))
+        rows = np.concatenate([sources, self.out_indices.astype(np.int64)])
+        cols = np.concatenate([self.out_indices.astype(np.int64), sources])
+        keep = rows != cols
+        edges = np.unique(rows[keep] * num_nodes + cols[keep]) if num_nodes else np.zeros(0, dtype=np.int64)
+        rows, cols = edges // max(num_nodes, 1), edges % max(num_nodes, 1)
+        self.indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_nodes), out=self.indptr[1:])
+        self.indices = cols.astype(np.int32)
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.indptr) - 1
+
+    def save(self, path: str):
+        tmp_path = path + '.tmp'
+        joblib.dump({
+            'version': self.FORMAT_VERSION,
+            'source_signature': self.source_signature,
+            'num_catalog': self.num_catalog,
+            'external_names': self.external_names,
+            'display_names': self.display_names,
+            'out_indptr': self.out_indptr,
+            'out_indices': self.out_indices,
+            'indptr': self.indptr,
+            'indices': self.indices,
+        }, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, source_signature: str) -> Optional['RelatedDrugsGraph']:
+        """Loads a saved graph built from the same drug data; returns None if missing or stale."""
+        if not os.path.exists(path):
+            return None
+        try:
+            state = joblib.load(path)
+        except Exception as e:
+            print(f"Error loading related drugs graph from {path}: {e}")
+            return None
+        if not isinstance(state, dict) or state.get('version') != cls.FORMAT_VERSION \
+                or state.get('source_signature') != source_signature:
+            return None
+        graph = cls.__new__(cls)
+        graph.source_signature = source_signature
+        for key in ('num_catalog', 'external_names', 'display_names', 'out_indptr', 'out_indices', 'indptr', 'indices'):
+            setattr(graph, key, state[key])
+        return graph
+
+    @classmethod
+    def load_or_build(cls, path: str, catalog_names: Sequence[str], related_column: Sequence[str],
+                      catalog_id: Callable[[str], Optional[int]], source_signature: str) -> 'RelatedDrugsGraph':
+        graph = cls.load(path, source_signature)
+        if graph is not None:
+            return graph
+        graph = cls(catalog_names, related_column, catalog_id, source_signature)
+        try:
+            graph.save(path)
+            print(f"Related drugs graph ({graph.num_nodes} nodes, {len(graph.indices) // 2} links) saved to '{path}'")
+        except Exception as e:
+            print(f"Error saving related drugs graph to '{path}': {e}")
+        return graph
+
+    def external_id(self, name: str) -> Optional[int]:
+        """Node id of a related name that is not in the catalog."""
+        if getattr(self, '_external_ids', None) is None:
+            self._external_ids = {external.lower(): self.num_catalog + i
+                                  for i, external in enumerate(self.external_names)}
+        return self._external_ids.get(name.lower())
+
+    def listed(self, node: int) -> np.ndarray:
+        """Relations listed for a catalog drug, in their original order."""
+        if node >= self.num_catalog:
+            return np.zeros(0, dtype=np.int32)
+        return self.out_indices[self.out_indptr[node]:self.out_indptr[node + 1]]
+
+    def neighbours(self, node: int) -> np.ndarray:
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def _expand(self, frontier: np.ndarray) -> np.ndarray:
+        if not len(frontier):
+            return frontier
+        return np.unique(np.concatenate([self.neighbours(node) for node in frontier]))
+
+    def within_hops(self, node: int, hops: int) -> Dict[int, np.ndarray]:
+        """Breadth-first rings: {distance: sorted node ids first reached at that distance}."""
+        visited = np.zeros(self.num_nodes, dtype=bool)
+        visited[node] = True
+        frontier = np.asarray([node], dtype=np.int32)
+        rings = {}
+        for distance in range(1, hops + 1):
+            reached = self._expand(frontier)
+            frontier = reached[~visited[reached]]
+            if not len(frontier):
+                break
+            visited[frontier] = True
+            rings[distance] = frontier
+        return rings
+
+    def shortest_path(self, source: int, target: int, max_hops: int = 6) -> Optional[List[int]]:
+        """Node ids on a shortest relation path from source to target, or None."""
+        if source == target:
+            return [source]
+        parent = np.full(self.num_nodes, -1, dtype=np.int64)
+        parent[source] = source
+        frontier = [source]
+        for _ in range(max_hops):
+            next_frontier = []
+            for node in frontier:
+                for neighbour in self.neighbours(node):
+                    if parent[neighbour] != -1:
+                        continue
+                    parent[neighbour] = node
+                    if neighbour == target:
+                        path = [int(target)]
+                        while path[-1] != source:
+                            path.append(int(parent[path[-1]]))
+                        return path[::-1]
+                    next_frontier.append(neighbour)
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        return None
+
+    def common_neighbours(self, nodes: Sequence[int]) -> np.ndarray:
+        """Sorted node ids related to every node in nodes."""
+        if not nodes:
+            return np.zeros(0, dtype=np.int32)
+        result = self.neighbours(nodes[0])
+        for node in nodes[1:]:
+            result = np.intersect1d(result, self.neighbours(node), assume_unique=True)
+        return np.setdiff1d(result, np.asarray(nodes), assume_unique=True)
@@ -0,0 +1,146 @@
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+
+from embedding_index import EmbeddingIndex
+
+
+def split_side_effect_sentences(text: str) -> List[str]:
+    """Simple sentence splitting of a side-effects description (can be improved with nltk.sent_tokenize)."""
+    if not text or text == 'nan':
+        return []
+    return [s.strip() for s in re.split(r'[.;](?=\s*[A-Z])', text) if s.strip()]
+
+
+class SideEffectSentenceIndex:
+    """
+    Side-effect sentences of every drug, split once and stored in CSR form.
+
+    Sentences are deduplicated across the catalog; drug i owns the sentence ids
+    sentence_ids[offsets[i]:offsets[i + 1]]. Once embeddings are attached, a
+    symptom is embedded once and scored against all sentences with a single
+    matrix product.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, side_effects_by_drug: Sequence[str] = (), source_signature: str = ''):
+        self.source_signature = source_signature
+        sentence_to_id: Dict[str, int] = {}
+        self.sentences: List[str] = []
+        ids: List[int] = []
+        offsets = [0]
+        for text in side_effects_by_drug:
+            for sentence in split_side_effect_sentences(text):
+                sentence_id = sentence_to_id.get(sentence)
+                if sentence_id is None:
+                    sentence_id = sentence_to_id[sentence] = len(self.sentences)
+                    self.sentences.append(sentence)
+                ids.append(sentence_id)
+            offsets.append(len(ids))
+        self.sentence_ids = np.asarray(ids, dtype=np.int32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.sentences_signature = EmbeddingIndex.texts_signature(self.sentences)
+        self.embeddings: Optional[EmbeddingIndex] = None
+
+    def save(self, path: str):
+        tmp_path = path + '.tmp'
+        joblib.dump({
+            'version': self.FORMAT_VERSION,
+            'source_signature': self.source_signature,
+            'sentences_signature': self.sentences_signature,
+            'sentences': self.sentences,
+            'sentence_ids': self.sentence_ids,
+            'offsets': self.offsets,
+        }, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, source_signature: str) -> Optional['SideEffectSentenceIndex']:
+        """Loads a saved index built from the same drug data; returns None if missing or stale."""
+        if not os.path.exists(path):
+            return None
+        try:
+            state = joblib.load(path)
+        except Exception as e:
+            print(f"Error loading side effect index from {path}: {e}")
+            return None
+        if not isinstance(state, dict) or state.get('version') != cls.FORMAT_VERSION \
+                or state.get('source_signature') != source_signature:
+            return None
+        index = cls.__new__(cls)
+        index.source_signature = source_signature
+        index.sentences_signature = state['sentences_signature']
+        index.sentences = state['sentences']
+        index.sentence_ids = state['sentence_ids']
+        index.offsets = state['offsets']
+        index.embeddings = None
+        return index
+
+    @classmethod
+    def load_or_build(cls, path: str, side_effects_by_drug: Sequence[str],
+                      source_signature: str) -> 'SideEffectSentenceIndex':
+        """Splits every drug's side effects once per version of the drug data and caches the result."""
+        index = cls.load(path, source_signature)
+        if index is not None:
+            return index
+        index = cls(side_effects_by_drug, source_signature)
+        try:
+            index.save(path)
+        except Exception as e:
+            print(f"Error saving side effect index to '{path}': {e}")
+        return index
+
+    def sentences_for(self, drug_id: int) -> List[str]:
+        start, end = self.offsets[drug_id], self.offsets[drug_id + 1]
+        return [self.sentences[i] for i in self.sentence_ids[start:end]]
+
+    def attach_embeddings(self, path_prefix: str, nlp_processor) -> EmbeddingIndex:
+        """Loads (or computes once and caches) the embedding of every unique sentence."""
+        if self.embeddings is None:
+            self.embeddings = EmbeddingIndex.load_or_build(path_prefix, self.sentences, nlp_processor,
+                                                           signature=self.sentences_signature)
+        return self.embeddings
+
+    def search_drug(self, drug_id: int, query_embedding, threshold: Optional[float] = 0.7,
+                    top_k: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        Scores one drug's sentences against the query embedding.
+        Returns (sentence, score) pairs above threshold in document order, or the
+        top_k best pairs (best first) when top_k is given.
+        """
+        start, end = self.offsets[drug_id], self.offsets[drug_id + 1]
+        ids = self.sentence_ids[start:end]
+        if not len(ids):
+            return []
+        scores = self.embeddings.matrix[ids] @ EmbeddingIndex.normalize(query_embedding)
+        if top_k is not None:
+            order = EmbeddingIndex.top_k_ids(scores, top_k, threshold)
+        else:
+            order = np.flatnonzero(scores > threshold) if threshold is not None else np.arange(len(ids))
+        return [(self.sentences[ids[i]], float(scores[i])) for i in order]
+
+    def search_all(self, query_embedding, top_k: int = 10,
+                   threshold: Optional[float] = 0.7) -> List[Tuple[int, float, str]]:
+        """
+        Cross-drug search: returns (drug_id, score, best_sentence) for the drugs whose
+        closest side-effect sentence is most similar to the query, best first.
+        """
+        if not len(self.sentence_ids):
+            return []
+        sentence_scores = self.embeddings.scores(query_embedding)
+        per_entry = sentence_scores[self.sentence_ids]
+        counts = np.diff(self.offsets)
+        has_sentences = np.flatnonzero(counts)
+        # reduceat over the start offsets of non-empty drugs gives each drug's best sentence score
+        drug_best = np.full(len(counts), -np.inf, dtype=np.float32)
+        drug_best[has_sentences] = np.maximum.reduceat(per_entry, self.offsets[has_sentences])
+        results = []
+        for drug_id in EmbeddingIndex.top_k_ids(drug_best, top_k, threshold):
+            start, end = self.offsets[drug_id], self.offsets[drug_id + 1]
+            best_entry = start + int(np.argmax(per_entry[start:end]))
+            results.append((int(drug_id), float(drug_best[drug_id]), self.sentences[self.sentence_ids[best_entry]]))
+        return results
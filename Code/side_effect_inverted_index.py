@@ -0,0 +1,162 @@
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset({
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'for', 'from', 'has', 'have', 'if',
+    'in', 'is', 'it', 'may', 'of', 'on', 'or', 'such', 'that', 'the', 'this', 'to', 'with', 'you', 'your',
+})
+_NEGATION_RE = re.compile(r"\b(?:but not|and not|not|without|except)\b")
+_QUESTION_PREFIX_RE = re.compile(r"^\s*(?:(?:which|what)\s+)?(?:drugs?|medicines?)\s+(?:that\s+)?(?:cause|causes|list|lists|with)\s+")
+
+
+def normalize_terms(text: str) -> List[str]:
+    """Lowercases, tokenizes and drops stopwords; the same normalisation is used for indexing and querying."""
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in _STOPWORDS]
+
+
+class SideEffectInvertedIndex:
+    """
+    Inverted index from side-effect terms and two-word phrases to the drugs listing them.
+
+    The vocabulary is a sorted term list; term i owns the posting list
+    postings[offsets[i]:offsets[i + 1]], a sorted int32 array of drug ids, so
+    boolean queries reduce to NumPy set operations on small sorted arrays.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, side_effects_by_drug: Sequence[str] = (), source_signature: str = ''):
+        self.source_signature = source_signature
+        term_drugs: Dict[str, List[int]] = {}
+        for drug_id, text in enumerate(side_effects_by_drug):
+            if not text or text == 'nan':
+                continue
+            tokens = normalize_terms(text)
+            keys = set(tokens)
+            keys.update(f"{first} {second}" for first, second in zip(tokens, tokens[1:]))
+            for key in keys:
+                term_drugs.setdefault(key, []).append(drug_id)  # drug ids arrive in increasing order
+        self.terms: List[str] = sorted(term_drugs)
+        self.term_ids: Dict[str, int] = {term: i for i, term in enumerate(self.terms)}
+        lengths = [len(term_drugs[term]) for term in self.terms]
+        self.offsets = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        self.postings = np.fromiter((drug_id for term in self.terms for drug_id in term_drugs[term]),
+                                    dtype=np.int32, count=int(self.offsets[-1]))
+
+    def save(self, path: str):
+        tmp_path = path + '.tmp'
+        joblib.dump({
+            'version': self.FORMAT_VERSION,
+            'source_signature': self.source_signature,
+            'terms': self.terms,
+            'offsets': self.offsets,
+            'postings': self.postings,
+        }, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, source_signature: str) -> Optional['SideEffectInvertedIndex']:
+        """Loads a saved index built from the same drug data; returns None if missing or stale."""
+        if not os.path.exists(path):
+            return None
+        try:
+            state = joblib.load(path)
+        except Exception as e:
+            print(f"Error loading side effect inverted index from {path}: {e}")
+            return None
+        if not isinstance(state, dict) or state.get('version') != cls.FORMAT_VERSION \
+                or state.get('source_signature') != source_signature:
+            return None
+        index = cls.__new__(cls)
+        index.source_signature = source_signature
+        index.terms = state['terms']
+        index.term_ids = {term: i for i, term in enumerate(index.terms)}
+        index.offsets = state['offsets']
+        index.postings = state['postings']
+        return index
+
+    @classmethod
+    def load_or_build(cls, path: str, side_effects_by_drug: Sequence[str],
+                      source_signature: str) -> 'SideEffectInvertedIndex':
+        index = cls.load(path, source_signature)
+        if index is not None:
+            return index
+        index = cls(side_effects_by_drug, source_signature)
+        try:
+            index.save(path)
+            print(f"Side effect inverted index ({len(index.terms)} terms) saved to '{path}'")
+        except Exception as e:
+            print(f"Error saving side effect inverted index to '{path}': {e}")
+        return index
+
+    def _term_postings(self, term: str) -> np.ndarray:
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return np.zeros(0, dtype=np.int32)
+        return self.postings[self.offsets[term_id]:self.offsets[term_id + 1]]
+
+    def postings_for(self, phrase: str, texts: Optional[Sequence[str]] = None) -> np.ndarray:
+        """
+        Sorted drug ids whose side effects mention phrase. Phrases longer than two
+        words intersect their bigram postings; if texts (drug id -> side effects)
+        are given, those candidates are then checked for the exact phrase.
+        """
+        tokens = normalize_terms(phrase)
+        if not tokens:
+            return np.zeros(0, dtype=np.int32)
+        if len(tokens) <= 2:
+            return self._term_postings(' '.join(tokens))
+        result = self._term_postings(f"{tokens[0]} {tokens[1]}")
+        for first, second in zip(tokens[1:], tokens[2:]):
+            if not len(result):
+                break
+            result = np.intersect1d(result, self._term_postings(f"{first} {second}"), assume_unique=True)
+        if texts is not None and len(result):
+            wanted = ' '.join(tokens)
+            result = np.asarray([drug_id for drug_id in result
+                                 if wanted in ' '.join(normalize_terms(texts[drug_id]))], dtype=np.int32)
+        return result
+
+    def search(self, all_of: Sequence[str] = (), any_of: Sequence[str] = (), none_of: Sequence[str] = (),
+               texts: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Drug ids matching every all_of phrase, at least one any_of phrase, and no none_of phrase."""
+        result: Optional[np.ndarray] = None
+        for phrase in all_of:
+            postings = self.postings_for(phrase, texts)
+            result = postings if result is None else np.intersect1d(result, postings, assume_unique=True)
+        if any_of:
+            union = np.zeros(0, dtype=np.int32)
+            for phrase in any_of:
+                union = np.union1d(union, self.postings_for(phrase, texts))
+            result = union if result is None else np.intersect1d(result, union, assume_unique=True)
+        if result is None:
+            return np.zeros(0, dtype=np.int32)
+        for phrase in none_of:
+            if not len(result):
+                break
+            result = np.setdiff1d(result, self.postings_for(phrase, texts), assume_unique=True)
+        return result
+
+    @staticmethod
+    def parse_query(query: str) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Splits a question like "drowsiness and dizziness but not nausea" into
+        (all_of, any_of, none_of) phrase lists. Positive phrases joined with "or"
+        become any_of; otherwise they must all match.
+        """
+        parts = _NEGATION_RE.split(_QUESTION_PREFIX_RE.sub('', query.lower().rstrip('?')))
+        positive, negative = parts[0], ' , '.join(parts[1:])
+        none_of = _split_phrases(negative, r",|\band\b|\bor\b|\bnor\b")
+        if re.search(r"\bor\b", positive):
+            return [], _split_phrases(positive, r",|\bor\b"), none_of
+        return _split_phrases(positive, r",|\band\b"), [], none_of
+
+
+def _split_phrases(text: str, separator: str) -> List[str]:
+    return [part.strip() for part in re.split(separator, text) if normalize_terms(part)]
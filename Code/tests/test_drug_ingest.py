@@ -0,0 +1,77 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from drug_ingest import csv_source_changed, ingest_drug_csv
+from drug_store import DrugStore
+
+HEADER = "drug_name,generic_name,drug_classes,activity,rx_otc,pregnancy_category,side_effects,related_drugs\n"
+
+
+def _row(name: str, generic: str) -> str:
+    return f'{name},{generic},analgesics,80%,OTC,B,"headache, nausea",other: https://example.com\n'
+
+
+@pytest.fixture
+def paths(tmp_path):
+    csv_path = tmp_path / "drugs.csv"
+    csv_path.write_text(HEADER + _row("Tylenol", "acetaminophen") + _row("Advil", "ibuprofen"))
+    return str(csv_path), str(tmp_path / "drugs.store")
+
+
+def _ingest(csv_path, store_path, previous=None):
+    return ingest_drug_csv(csv_path, store_path, previous=previous, chunk_size=2) # Small chunks force a merge
+
+
+def test_first_ingest_rebuilds(paths):
+    csv_path, store_path = paths
+    store, mode = _ingest(csv_path, store_path)
+    assert mode == 'rebuilt'
+    assert list(store.names) == ['advil', 'tylenol']
+    assert store['tylenol']['generic_name'] == 'acetaminophen'
+    assert not csv_source_changed(store.source, csv_path)
+
+
+def test_appended_rows_are_merged(paths):
+    csv_path, store_path = paths
+    store, _ = _ingest(csv_path, store_path)
+    with open(csv_path, 'a') as file:
+        file.write(_row("Aleve", "naproxen") + _row("Advil", "ibuprofen 200mg"))
+    store, mode = _ingest(csv_path, store_path, previous=store)
+    assert mode == 'appended'
+    assert list(store.names) == ['advil', 'aleve', 'tylenol']
+    assert store['advil']['generic_name'] == 'ibuprofen 200mg' # The later row wins
+    assert store['aleve']['generic_name'] == 'naproxen'
+    assert not csv_source_changed(store.source, csv_path)
+
+
+def test_touched_csv_only_updates_the_header(paths):
+    csv_path, store_path = paths
+    store, _ = _ingest(csv_path, store_path)
+    signature = store.signature
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert csv_source_changed(store.source, csv_path)
+    inode = os.stat(store_path).st_ino
+    store, mode = _ingest(csv_path, store_path, previous=store)
+    assert mode == 'unchanged'
+    assert os.stat(store_path).st_ino == inode # Updated in place, not rewritten and renamed
+    assert store.signature == signature
+    assert store['tylenol']['generic_name'] == 'acetaminophen'
+    assert not csv_source_changed(store.source, csv_path)
+    reopened = DrugStore(store_path) # The new source was written to the file, not just the open store
+    assert reopened.source == store.source
+    reopened.close()
+
+
+def test_edited_row_rebuilds(paths):
+    csv_path, store_path = paths
+    store, _ = _ingest(csv_path, store_path)
+    with open(csv_path, 'w') as file:
+        file.write(HEADER + _row("Tylenol", "paracetamol") + _row("Advil", "ibuprofen"))
+    store, mode = _ingest(csv_path, store_path, previous=store)
+    assert mode == 'rebuilt'
+    assert store['tylenol']['generic_name'] == 'paracetamol'
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import mmap
+import os
+from array import array
+from typing import Dict, Iterator, Optional, Sequence, Union
+
+import numpy as np
+
+from question_normalizer import normalize_question
+
+_QUESTION_PREFIX = b"Question: "
+_ANSWER_PREFIX = b"Answer: "
+_PAIR_DTYPE = np.dtype([('question_offset', '<i8'), ('question_length', '<i4'),
+                        ('answer_offset', '<i8'), ('answer_length', '<i4')])
+
+
+def question_key(question: str) -> int:
+    """64-bit hash of the normalized question."""
+    return int.from_bytes(hashlib.blake2b(normalize_question(question).encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class _TextColumn(Sequence):
+    """Question or answer texts, decoded from the corpus file on access."""
+
+    def __init__(self, corpus: 'TrainCorpus', field: str):
+        self._corpus = corpus
+        self._field = field
+
+    def __len__(self) -> int:
+        return len(self._corpus)
+
+    def __getitem__(self, i: Union[int, slice]):
+        if isinstance(i, slice):
+            return [self._corpus.text(self._field, j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._corpus.text(self._field, i)
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self._corpus.text(self._field, i)
+
+
+class _PairView(Sequence):
+    """The corpus as the old list of {"question": ..., "answer": ...} dicts, built on access."""
+
+    def __init__(self, corpus: 'TrainCorpus'):
+        self._corpus = corpus
+
+    def __len__(self) -> int:
+        return len(self._corpus)
+
+    def __getitem__(self, i: Union[int, slice]):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return {"question": self._corpus.questions[i], "answer": self._corpus.answers[i]}
+
+
+class TrainCorpus:
+    """
+    Question-answer pairs of a Train.txt file, indexed by byte offset.
+
+    The file is parsed one line at a time, so memory does not depend on its
+    size: only the offset and length of each question and answer (id-aligned
+    arrays) and a sorted table of 64-bit normalized-question hashes are kept,
+    and the texts are read from a memory map of the file when asked for.
+    The arrays can be saved next to the file as .npy files and memory-mapped
+    back, so later loads skip parsing. The cache records the file's size and
+    mtime and is ignored once the file changes.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, file_path: str, pairs: np.ndarray, keys: np.ndarray, ids: np.ndarray):
+        self.file_path = file_path
+        self.pairs = pairs
+        self.keys = keys # Sorted normalized-question hashes (uint64)...
+        self.ids = ids # ...and the pair id of each, ascending among equal keys
+        self._file = None
+        self._mmap = None
+        if len(pairs):
+            self._file = open(file_path, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.questions = _TextColumn(self, 'question')
+        self.answers = _TextColumn(self, 'answer')
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def text(self, field: str, i: int) -> str:
+        start = int(self.pairs[i][f'{field}_offset'])
+        end = start + int(self.pairs[i][f'{field}_length'])
+        return self._mmap[start:end].decode('utf-8').strip()
+
+    def as_dicts(self) -> _PairView:
+        return _PairView(self)
+
+    def find(self, question: str) -> Optional[int]:
+        """Id of the first pair whose normalized question equals the normalized question, or None."""
+        if not len(self.keys):
+            return None
+        key = np.uint64(question_key(question))
+        normalized = normalize_question(question)
+        for position in range(np.searchsorted(self.keys, key, side='left'), np.searchsorted(self.keys, key, side='right')):
+            i = int(self.ids[position])
+            if normalize_question(self.questions[i]) == normalized: # Guard against hash collisions
+                return i
+        return None
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = self._file = None
+
+    # --- Parsing ---
+    @classmethod
+    def parse(cls, file_path: str) -> 'TrainCorpus':
+        """
+        Streams the file and indexes every "Question: " line that is directly
+        followed by an "Answer: " line.
+        """
+        question_offsets, question_lengths = array('q'), array('i')
+        answer_offsets, answer_lengths = array('q'), array('i')
+        keys = array('Q')
+        with open(file_path, 'rb') as file:
+            offset = 0
+            pending = None # (offset, length, text) of a question line still waiting for its answer
+            for line in file:
+                if pending is not None and line.startswith(_ANSWER_PREFIX):
+                    question_offsets.append(pending[0])
+                    question_lengths.append(pending[1])
+                    answer_offsets.append(offset + len(_ANSWER_PREFIX))
+                    answer_lengths.append(len(line) - len(_ANSWER_PREFIX))
+                    keys.append(question_key(pending[2]))
+                    pending = None
+                elif line.startswith(_QUESTION_PREFIX):
+                    question = line[len(_QUESTION_PREFIX):]
+                    pending = (offset + len(_QUESTION_PREFIX), len(question), question.decode('utf-8').strip())
+                else:
+                    pending = None
+                offset += len(line)
+
+        pairs = np.empty(len(keys), dtype=_PAIR_DTYPE)
+        pairs['question_offset'] = np.frombuffer(question_offsets, dtype=np.int64)
+        pairs['question_length'] = np.frombuffer(question_lengths, dtype=np.int32)
+        pairs['answer_offset'] = np.frombuffer(answer_offsets, dtype=np.int64)
+        pairs['answer_length'] = np.frombuffer(answer_lengths, dtype=np.int32)
+        keys = np.frombuffer(keys, dtype=np.uint64)
+        ids = np.argsort(keys, kind='stable')
+        return cls(file_path, pairs, keys[ids], ids.astype(np.int64))
+
+    # --- Binary cache ---
+    @staticmethod
+    def _cache_paths(file_path: str) -> Dict[str, str]:
+        base = os.path.splitext(file_path)[0]
+        return {'pairs': base + '_pairs.npy', 'keys': base + '_keys.npy', 'ids': base + '_ids.npy',
+                'meta': base + '_index_meta.json'}
+
+    def save_cache(self):
+        paths = self._cache_paths(self.file_path)
+        stat = os.stat(self.file_path)
+        if os.path.exists(paths['meta']):
+            os.remove(paths['meta'])
+        for name in ('pairs', 'keys', 'ids'):
+            tmp_path = paths[name] + '.tmp.npy'
+            np.save(tmp_path, getattr(self, name))
+            os.replace(tmp_path, paths[name])
+        # The metadata is written last: it is what marks the cache as complete
+        with open(paths['meta'] + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump({'version': self.FORMAT_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                       'count': len(self)}, file)
+        os.replace(paths['meta'] + '.tmp', paths['meta'])
+
+    @classmethod
+    def load_cache(cls, file_path: str) -> Optional['TrainCorpus']:
+        """Memory-maps a cache built from the current file; returns None if missing or stale."""
+        paths = cls._cache_paths(file_path)
+        if not all(os.path.exists(path) for path in paths.values()):
+            return None
+        try:
+            with open(paths['meta'], 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+            stat = os.stat(file_path)
+            if meta.get('version') != cls.FORMAT_VERSION or meta.get('size') != stat.st_size \
+                    or meta.get('mtime_ns') != stat.st_mtime_ns:
+                return None
+            pairs = np.load(paths['pairs'], mmap_mode='r')
+            keys = np.load(paths['keys'], mmap_mode='r')
+            ids = np.load(paths['ids'], mmap_mode='r')
+            if pairs.dtype != _PAIR_DTYPE or not len(pairs) == len(keys) == len(ids) == meta['count']:
+                return None
+        except Exception as e:
+            print(f"Bot: Error loading index cache for {file_path}: {e}")
+            return None
+        return cls(file_path, pairs, keys, ids)
+
+    @classmethod
+    def open(cls, file_path: str, use_cache: bool = True) -> 'TrainCorpus':
+        """Loads the cached index if it matches the file, otherwise parses the file (and caches it)."""
+        corpus = cls.load_cache(file_path) if use_cache else None
+        if corpus is not None:
+            return corpus
+        corpus = cls.parse(file_path)
+        if use_cache:
+            try:
+                corpus.save_cache()
+            except Exception as e:
+                print(f"Bot: Error saving index cache for {file_path}: {e}")
+        return corpus
+
+    @classmethod
+    def empty(cls, file_path: str) -> 'TrainCorpus':
+        return cls(file_path, np.empty(0, dtype=_PAIR_DTYPE), np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64))
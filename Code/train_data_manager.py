@@ -1,44 +1,46 @@
-from typing import List, Dict, Optional
+import os
+from typing import Dict, Optional, Sequence
+from question_ann_index import QuestionANNIndex
+from train_corpus import TrainCorpus
 
 class TrainDataManager:
     """Manages loading question-answer pairs from a text file (Train.txt)."""
    
-    def __init__(self, file_path: str = "Train.txt"):
+    def __init__(self, file_path: str = "Train.txt", use_cache: bool = True):
         self.file_path = file_path
+        self.use_cache = use_cache # Keep a binary offset/hash index next to the file for fast reloads
+        self.corpus = TrainCorpus.empty(file_path)
         self.train_data = self.load_train_file()
+        self.question_index: Optional[QuestionANNIndex] = None # Built on the first semantic lookup
 
-    def load_train_file(self) -> List[Dict[str, str]]:
-        """Load question-answer pairs from Train.txt."""
-        train_data = []
+    def load_train_file(self) -> Sequence[Dict[str, str]]:
+        """
+        Load question-answer pairs from Train.txt. The file is streamed into an
+        offset index (see train_corpus.TrainCorpus); the returned sequence reads
+        each {"question", "answer"} pair from the file when accessed.
+        """
         try:
-            with open(self.file_path, 'r', encoding='utf-8') as file:
-                lines = file.readlines()
-                i = 0
-                while i < len(lines):
-                    if lines[i].startswith("Question: ") and i + 1 < len(lines) and lines[i + 1].startswith("Answer: "):
-                        question = lines[i][len("Question: "):].strip()
-                        answer = lines[i + 1][len("Answer: "):].strip()
-                        train_data.append({"question": question, "answer": answer})
-                        i += 2
-                    else:
-                        i += 1
-                return train_data
+            self.corpus = TrainCorpus.open(self.file_path, use_cache=self.use_cache)
         except FileNotFoundError:
             print(f"Bot: Warning: {self.file_path} not found. Skipping local text file search.")
-            return []
         except Exception as e:
             print(f"Bot: Error reading {self.file_path}: {e}")
-            return []
+        return self.corpus.as_dicts()
 
-    def find_answer_in_train(self, question: str, nlp_processor) -> Optional[tuple[str, str]]:
+    def get_question_index(self, nlp_processor) -> QuestionANNIndex:
+        """Returns the ANN index over the training questions, loading or building it on first use."""
+        if self.question_index is None:
+            self.question_index = QuestionANNIndex.load_or_build(
+                os.path.splitext(self.file_path)[0] + "_questions", self.corpus.questions, nlp_processor)
+        return self.question_index
+
+    def find_answer_in_train(self, question: str, nlp_processor,
+                             threshold: float = 0.85) -> Optional[tuple[str, str]]:
         """Find an answer in the train data, using NLP for similarity if needed."""
-        for q in self.train_data:
-            if q["question"].lower() == question.lower():
-                return q["answer"], q["question"]
-        questions = [q["question"] for q in self.train_data]
-        best_match = nlp_processor.find_best_match(question, questions)
-        if best_match:
-            for q in self.train_data:
-                if q["question"].lower() == best_match.lower():
-                    return q["answer"], best_match
-        return None, None
\ No newline at end of file
+        question_id = self.corpus.find(question)
+        if question_id is None:
+            matches = self.get_question_index(nlp_processor).search(question, k=1, threshold=threshold)
+            question_id = matches[0][0] if matches else None
+        if question_id is not None:
+            return self.corpus.answers[question_id], self.corpus.questions[question_id]
+        return None, None